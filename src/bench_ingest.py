@@ -0,0 +1,181 @@
+"""
+Offline benchmark for the ingestion pipeline in ingest.py.
+
+Embeddings come from fakes.HashEmbeddings, so no API key or network is
+needed. Examples:
+
+    python src/bench_ingest.py --corpus data/CP
+    python src/bench_ingest.py --synthetic 50 --file-kb 200 --mode stream
+    python src/bench_ingest.py --corpus data/CP --compare bench_results/old.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+
+from bench_utils import ROOT, make_synthetic_corpus, git_commit, peak_rss_mb
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark load/split/embed/persist with a fake embedder.")
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument("--corpus", type=Path, default=ROOT / "data" / "CP",
+                     help="Topic folder to ingest (default: data/CP)")
+    src.add_argument("--synthetic", type=int, metavar="N_FILES",
+                     help="Generate a synthetic corpus of N text files instead")
+    parser.add_argument("--file-kb", type=int, default=100, help="Size of each synthetic file in KB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["batch", "stream"], default="batch")
+    parser.add_argument("--workers", type=int, default=1, help="Process pool size for parsing (batch mode)")
+    parser.add_argument("--dim", type=int, default=1536, help="Fake embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.0,
+                        help="Simulated seconds per embedding request")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--out", type=Path, default=None, help="Where to write the JSON results")
+    parser.add_argument("--compare", type=Path, default=None, help="Previous results file to diff against")
+    return parser.parse_args()
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def run_batch(ingest, topic_dir: Path, topic: str, workers: int):
+    """
+    Time load, split and embed+persist separately. The last stage is the
+    app's own build_vectorstore, i.e. embed_scheduler.embed_and_write with
+    its bounded concurrency, overlapping embedding and writes.
+    """
+    stages = {}
+    paths = ingest.list_topic_files(topic_dir)
+    fingerprints = {p: ingest.file_sha256(p) for p in paths}
+
+    if workers > 1:
+        # Loading and splitting happen together inside the pool workers
+        t = time.perf_counter()
+        results = ingest.parse_files([(topic, p) for p in paths], workers)
+        stages["load+split"] = time.perf_counter() - t
+        per_file = [splits or [] for splits, _ in results]
+    else:
+        t = time.perf_counter()
+        loaded = [ingest.load_file(p) for p in paths]
+        stages["load"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        per_file = [ingest.split_docs(docs, topic) if docs else [] for docs in loaded]
+        stages["split"] = time.perf_counter() - t
+
+    all_splits, all_ids = [], []
+    for p, splits in zip(paths, per_file):
+        all_splits.extend(splits)
+        all_ids.extend(ingest.chunk_ids_for(p, fingerprints[p], len(splits), topic))
+
+    t = time.perf_counter()
+    ingest.build_vectorstore(all_splits, topic, ids=all_ids)
+    stages["embed+persist"] = time.perf_counter() - t
+
+    return stages, len(all_splits)
+
+
+def run_stream(ingest, topic_dir: Path, topic: str):
+    """Streaming overlaps every stage, so only the end-to-end time is meaningful."""
+    paths = ingest.list_topic_files(topic_dir)
+    changed = {p: {"sha256": ingest.file_sha256(p)} for p in paths}
+    vs = ingest.open_vectorstore(topic)
+    t = time.perf_counter()
+    n_chunks, _ = ingest.stream_vectorstore(changed, topic, vs, {})
+    return {"pipeline": time.perf_counter() - t}, n_chunks
+
+
+def compare(current: dict, previous_path: Path):
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\n[bench] vs {previous_path} (commit {previous.get('commit', '?')[:8]})")
+    for key, value in current["summary"].items():
+        old = previous.get("summary", {}).get(key)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            print(f"[bench]   {key:<20} {old:>10.3f} -> {value:>10.3f} ({(value - old) / old:+.1%})")
+
+
+def main():
+    args = parse_args()
+    workdir = Path(tempfile.mkdtemp(prefix="bench_ingest_"))
+
+    if args.synthetic:
+        topic_dir = make_synthetic_corpus(workdir / "data" / "synthetic", args.synthetic, args.file_kb, args.seed)
+        corpus = {"name": "synthetic", "files": args.synthetic, "file_kb": args.file_kb, "seed": args.seed}
+    else:
+        topic_dir = args.corpus.resolve()
+        corpus = {"name": topic_dir.name, "path": str(topic_dir)}
+    corpus["bytes"] = dir_size(topic_dir)
+
+    # ingest reads its paths at import time, so point it at the scratch dir first
+    os.environ["VS_DIR"] = str(workdir / "vectorstore")
+    os.environ["EMBED_CACHE"] = "0"
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import ingest
+    from fakes import HashEmbeddings
+
+    ingest._embeddings = HashEmbeddings(dim=args.dim, latency=args.embed_latency)
+    topic = topic_dir.name
+
+    runs = []
+    try:
+        for i in range(args.runs):
+            shutil.rmtree(ingest.VS_DIR, ignore_errors=True)
+            start = time.perf_counter()
+            if args.mode == "stream":
+                stages, n_chunks = run_stream(ingest, topic_dir, topic)
+            else:
+                stages, n_chunks = run_batch(ingest, topic_dir, topic, args.workers)
+            total = time.perf_counter() - start
+            run = {
+                "stages_s": {k: round(v, 4) for k, v in stages.items()},
+                "total_s": round(total, 4),
+                "chunks": n_chunks,
+                "chunks_per_s": round(n_chunks / total, 1) if total else None,
+                "store_bytes": dir_size(ingest.store_path(topic)),
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            runs.append(run)
+            print(f"[bench] run {i + 1}/{args.runs}: {json.dumps(run)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    best = min(runs, key=lambda r: r["total_s"])
+    result = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "corpus": corpus,
+        "params": {"mode": args.mode, "workers": args.workers, "dim": args.dim,
+                   "embed_latency": args.embed_latency, "runs": args.runs},
+        "runs": runs,
+        "summary": {
+            **{f"{k}_s": v for k, v in best["stages_s"].items()},
+            "total_s": best["total_s"],
+            "chunks_per_s": best["chunks_per_s"],
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+            "store_mb": round(best["store_bytes"] / 1024 / 1024, 2),
+        },
+    }
+
+    out = args.out or ROOT / "bench_results" / f"ingest_{result['commit'][:8]}_{corpus['name']}_{args.mode}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4)
+    print(f"[bench] Results written to {out}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Helpers shared by the offline benchmarks (bench_ingest, load_test,
+startup_profile): repo root, commit id, peak memory and a synthetic corpus.
+"""
+import sys
+import random
+import resource
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+WORDS = (
+    "process thread scheduler memory page frame cache pointer stack heap queue "
+    "mutex semaphore deadlock kernel interrupt register compiler parser token "
+    "grammar loop array vector matrix graph tree node edge sort search hash "
+    "function variable recursion iteration complexity algorithm input output"
+).split()
+
+
+def make_synthetic_corpus(dest: Path, n_files: int, file_kb: int, seed: int):
+    rng = random.Random(seed)
+    dest.mkdir(parents=True, exist_ok=True)
+    for i in range(n_files):
+        paragraphs, size = [], 0
+        while size < file_kb * 1024:
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+                for _ in range(rng.randint(3, 8))
+            ]
+            paragraph = " ".join(sentences)
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 2
+        (dest / f"synthetic_{i:04d}.md").write_text("\n\n".join(paragraphs), encoding="utf-8")
+    return dest
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux and bytes on macOS; children covers pool workers
+    scale = 1 / 1024 / 1024 if sys.platform == "darwin" else 1 / 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) * scale, 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
@@ -1,18 +1,71 @@
+"""
+Mongo clients, created on first use.
+
+Importing this module neither imports the drivers nor opens a connection:
+get_db() and get_async_db() build the shared clients the first time they
+are called. The old module-level names (db, async_db, users_collection,
+async_users_collection, ...) still resolve, lazily, through __getattr__.
+"""
 import os
-from pymongo import MongoClient
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("MONGO_DB_NAME")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+
+COLLECTIONS = ("users", "interaction", "teacher", "student", "evaluator", "scorer",
+               "student_memory", "score_rollups")
+
+_lock = threading.Lock()
+_db = None
+_async_db = None
+
+
+def get_db():
+    """Blocking (pymongo) database, for scripts and worker threads."""
+    global _db
+    with _lock:
+        if _db is None:
+            from pymongo import MongoClient
+            _db = MongoClient(MONGO_URI)[DB_NAME]
+        return _db
+
+
+def get_async_db():
+    """Async (Motor) database for the Chainlit handlers, so a slow query never blocks the event loop."""
+    global _async_db
+    with _lock:
+        if _async_db is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            _async_db = AsyncIOMotorClient(MONGO_URI, maxPoolSize=MONGO_MAX_POOL_SIZE)[DB_NAME]
+        return _async_db
+
+
+def collection(name: str):
+    return get_db()[name]
+
+
+def async_collection(name: str):
+    return get_async_db()[name]
 
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
 
-users_collection = db["users"]
-interaction_collection = db["interaction"]
-teacher_collection = db["teacher"]
-student_collection = db["student"]
-evaluator_collection = db["evaluator"]
-scorer_collection = db["scorer"]
+def __getattr__(name: str):
+    # Backwards-compatible names: db, async_db, client, async_client, <name>_collection, async_<name>_collection
+    if name == "db":
+        return get_db()
+    if name == "async_db":
+        return get_async_db()
+    if name == "client":
+        return get_db().client
+    if name == "async_client":
+        return get_async_db().client
+    if name.endswith("_collection"):
+        base = name[: -len("_collection")]
+        if base.startswith("async_") and base[len("async_"):] in COLLECTIONS:
+            return async_collection(base[len("async_"):])
+        if base in COLLECTIONS:
+            return collection(base)
+    raise AttributeError(f"module 'db' has no attribute {name!r}")
@@ -0,0 +1,208 @@
+import os
+import random
+import asyncio
+import threading
+from typing import List
+from dotenv import load_dotenv
+
+from token_budget import count_tokens
+from vectorstore_registry import chroma_collection
+
+load_dotenv()
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "8000"))
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "512"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_STREAM_QUEUE = int(os.getenv("EMBED_STREAM_QUEUE", "256"))
+
+
+async def iter_in_thread(iterable, maxsize: int = EMBED_STREAM_QUEUE):
+    """
+    Run a (blocking) iterator in a worker thread and yield its items here.
+
+    The hand-off queue holds at most `maxsize` items, so a fast producer such
+    as a PDF parser is throttled to the speed of the consumer.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                put(("item", item))
+        except BaseException as e:
+            put(("error", e))
+            return
+        put(("end", end))
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            kind, item = await queue.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                raise item
+            yield item
+    finally:
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()  # unblock a producer waiting on a full queue
+
+
+async def _aiter(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def token_batches(items, max_tokens: int = EMBED_BATCH_TOKENS, max_items: int = EMBED_BATCH_MAX_ITEMS):
+    """Group (id, doc) pairs into batches of at most `max_tokens` tokens / `max_items` chunks."""
+    batch, tokens = [], 0
+    async for chunk_id, doc in _aiter(items):
+        n = count_tokens(doc.page_content)
+        if batch and (tokens + n > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch, tokens = [], 0
+        batch.append((chunk_id, doc))
+        tokens += n
+    if batch:
+        yield batch
+
+
+def _status_code(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(exc) -> bool:
+    """429 and 5xx responses, plus connection/timeout errors, are worth retrying."""
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError",
+                                  "ReadTimeout", "TimeoutError")
+
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def embed_with_retry(embeddings, texts: List[str], max_retries: int = EMBED_MAX_RETRIES):
+    """Embed one batch, backing off exponentially (with jitter) on retryable errors."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await embeddings.aembed_documents(texts)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = _retry_after(e) or min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"[embed] {type(e).__name__} (status={_status_code(e)}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def _clean_metadata(metadata: dict) -> dict:
+    # Chroma only accepts scalar metadata values
+    return {k: v for k, v in (metadata or {}).items() if isinstance(v, (str, int, float, bool))}
+
+
+def write_batch(vs, batch, vectors):
+    # Embeddings are already computed, so go straight to the collection instead
+    # of add_documents(), which would embed again.
+    chroma_collection(vs).upsert(
+        ids=[chunk_id for chunk_id, _ in batch],
+        embeddings=vectors,
+        documents=[doc.page_content for _, doc in batch],
+        metadatas=[_clean_metadata(doc.metadata) for _, doc in batch],
+    )
+
+
+async def embed_and_write(vs, items, embeddings, max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+                          batch_tokens: int = EMBED_BATCH_TOKENS, progress=None):
+    """
+    Embed (id, doc) pairs with up to `max_in_flight` concurrent requests and
+    write them to `vs` from a single writer task.
+
+    `items` may be a list, a generator or an async iterator; it is consumed
+    lazily, one batch ahead of the embedders.
+
+    The first error that survives the retries (of an embedder or the writer)
+    stops the run: no further batch is sent, requests still in flight are
+    cancelled and the error is raised.
+
+    Returns the number of chunks written.
+    """
+    written = 0
+    failure = None
+    done = asyncio.Queue(maxsize=max_in_flight * 2)
+    slots = asyncio.Semaphore(max_in_flight)
+
+    async def writer():
+        nonlocal written, failure
+        while True:
+            item = await done.get()
+            if item is None:
+                return
+            if failure is not None:
+                continue  # keep draining so embedders never block on a dead writer
+            batch, vectors = item
+            try:
+                await asyncio.to_thread(write_batch, vs, batch, vectors)
+            except Exception as e:
+                failure = failure or e
+                continue
+            written += len(batch)
+            if progress is not None:
+                progress.update(len(batch))
+
+    async def embed(batch):
+        nonlocal failure
+        try:
+            vectors = await embed_with_retry(embeddings, [doc.page_content for _, doc in batch])
+        except Exception as e:
+            failure = failure or e
+            return
+        finally:
+            # Also wakes the producer, which checks `failure` before sending more
+            slots.release()
+        await done.put((batch, vectors))
+
+    writer_task = asyncio.create_task(writer())
+    tasks = []
+    try:
+        async for batch in token_batches(items, batch_tokens):
+            await slots.acquire()
+            if failure is not None:
+                break
+            tasks.append(asyncio.create_task(embed(batch)))
+        if failure is not None:
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await done.put(None)
+        await writer_task
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        writer_task.cancel()
+        raise
+
+    if failure is not None:
+        raise failure
+    return written
@@ -0,0 +1,213 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from array import array
+from pathlib import Path
+from typing import List
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+VS_DIR = Path(os.getenv("VS_DIR", Path(__file__).resolve().parents[1] / "vectorstore"))
+EMBED_CACHE_PATH = Path(os.getenv("EMBED_CACHE_PATH", VS_DIR / "embedding_cache.sqlite3"))
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "512"))
+# USD per 1M input tokens, used only for the savings report
+EMBED_PRICE_PER_1M = float(os.getenv("EMBED_PRICE_PER_1M", "0.02"))
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so re-flowed copies of the same chunk share a key."""
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class EmbeddingCache:
+    """On-disk (SQLite) map of cache key -> float32 vector with LRU eviction by size."""
+
+    def __init__(self, path: Path = EMBED_CACHE_PATH, max_mb: float = EMBED_CACHE_MAX_MB):
+        self.path = Path(path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        # Running size of the table, so inserts don't have to sum it
+        self._total = self._table_size()
+
+    def _table_size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> dict:
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i: i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[key] = vec.tolist()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows],
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: dict):
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = array("f", vector).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self._lock:
+            replaced = 0
+            for i in range(0, len(rows), 500):
+                part = [row[0] for row in rows[i: i + 500]]
+                marks = ",".join("?" * len(part))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({marks})", part
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            self._total += sum(row[2] for row in rows) - replaced
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other processes may share the file: resync before deciding
+        total = self._total = self._table_size()
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are 10% under the limit
+        target = int(self.max_bytes * 0.9)
+        freed, victims = 0, []
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used ASC"):
+            victims.append((key,))
+            freed += size
+            if total - freed <= target:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        self._conn.commit()
+        self._total -= freed
+        print(f"[embed-cache] Evicted {len(victims)} entries ({freed / 1e6:.1f} MB)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends cache misses to the underlying client.
+
+    Texts are keyed by (model, normalized text hash); duplicates inside a
+    single call are embedded once.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, cache: EmbeddingCache = None):
+        self.underlying = underlying
+        self.model = model
+        self.cache = cache or EmbeddingCache()
+        # Calls run on worker threads (aembed_documents, the embed scheduler)
+        self._stats_lock = threading.Lock()
+        self.requested = 0      # texts asked for
+        self.hits = 0           # served from disk
+        self.deduped = 0        # duplicates inside a call
+        self.embedded = 0       # texts sent to the provider
+        self.saved_tokens = 0
+
+    def _partition(self, texts: List[str]):
+        """Split a call into cached vectors and the unique texts still to embed."""
+        keys = [cache_key(self.model, t) for t in texts]
+        vectors = self.cache.get_many(list(set(keys)))
+
+        to_embed = {}
+        hits = deduped = saved_tokens = 0
+        for key, text in zip(keys, texts):
+            if key in vectors:
+                hits += 1
+                saved_tokens += estimate_tokens(text)
+            elif key in to_embed:
+                deduped += 1
+                saved_tokens += estimate_tokens(text)
+            else:
+                to_embed[key] = text
+        with self._stats_lock:
+            self.hits += hits
+            self.deduped += deduped
+            self.saved_tokens += saved_tokens
+        return keys, vectors, to_embed
+
+    def _merge(self, keys, vectors, to_embed, new_vectors):
+        if to_embed:
+            fresh = dict(zip(to_embed.keys(), new_vectors))
+            self.cache.put_many(fresh)
+            vectors.update(fresh)
+        with self._stats_lock:
+            self.requested += len(keys)
+            self.embedded += len(to_embed)
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, to_embed = self._partition(texts)
+        new_vectors = self.underlying.embed_documents(list(to_embed.values())) if to_embed else []
+        return self._merge(keys, vectors, to_embed, new_vectors)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, to_embed = await asyncio.to_thread(self._partition, texts)
+        new_vectors = await self.underlying.aembed_documents(list(to_embed.values())) if to_embed else []
+        return await asyncio.to_thread(self._merge, keys, vectors, to_embed, new_vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            requested, embedded = self.requested, self.embedded
+            hits, deduped, saved_tokens = self.hits, self.deduped, self.saved_tokens
+        hit_rate = (requested - embedded) / requested if requested else 0.0
+        return {
+            "requested": requested,
+            "embedded": embedded,
+            "hits": hits,
+            "deduped": deduped,
+            "hit_rate": hit_rate,
+            "saved_tokens": saved_tokens,
+            "saved_usd": saved_tokens * EMBED_PRICE_PER_1M / 1_000_000,
+        }
+
+    def report(self):
+        s = self.stats()
+        print(
+            f"[embed-cache] {s['requested']} chunks requested, {s['embedded']} embedded, "
+            f"hit rate {s['hit_rate']:.1%} ({s['hits']} cached, {s['deduped']} in-batch duplicates), "
+            f"~{s['saved_tokens']} tokens / ${s['saved_usd']:.4f} saved"
+        )
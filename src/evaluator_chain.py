@@ -1,6 +1,8 @@
 from langchain.prompts import ChatPromptTemplate
 from langchain.chains import LLMChain
 from langchain.output_parsers import PydanticOutputParser
+from token_budget import BudgetedChain
+from response_cache import with_cache
 from models import EvaluatorResponse 
 
 evaluator_prompt= """
@@ -16,7 +18,7 @@ Inputs:
 {student_question}
 - Student's follow-up question based on the teacher's reponse, will be null if the student received accurate response
 {student_followup_question}
-- Student’s response:
+- Student’s response (rating, reflection, missing points):
 {student_response}
 
 Instructions:
@@ -53,8 +55,7 @@ def build_evaluator_chain(llm):
     chain = LLMChain(
         llm=llm,
         prompt=prompt,
-        output_parser=parser,
-        verbose=True
+        output_parser=parser
     )
 
-    return chain
+    return with_cache(BudgetedChain(chain, "evaluator"))
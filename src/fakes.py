@@ -0,0 +1,454 @@
+import re
+import copy
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic, offline stand-in for OpenAIEmbeddings.
+
+    Each word is hashed onto a few signed coordinates of a `dim`-sized vector
+    (a sparse random projection of the bag of words), and the sum is
+    L2-normalized. Texts sharing words end up close in cosine space, which is
+    enough for retrieval to behave sensibly in benchmarks and load tests.
+    `latency` adds a fixed delay per call to mimic a network round-trip.
+    """
+
+    def __init__(self, dim: int = 1536, nnz: int = 4, latency: float = 0.0):
+        self.dim = dim
+        self.nnz = nnz
+        self.latency = latency
+        self._token_cache = {}
+
+    def _features(self, token: str):
+        features = self._token_cache.get(token)
+        if features is None:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=4 * self.nnz).digest()
+            features = []
+            for i in range(self.nnz):
+                h = int.from_bytes(digest[4 * i: 4 * i + 4], "little")
+                features.append((h % self.dim, 1.0 if h & (1 << 31) else -1.0))
+            self._token_cache[token] = features
+        return features
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in _TOKEN_RE.findall(text.lower()):
+            for index, sign in self._features(token):
+                vec[index] += sign
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+# ------------------- CHAT MODEL ------------------- #
+
+_PIECE_RE = re.compile(r"\S+\s*|\s+")
+
+
+def _prompt_words(prompt: str, rng) -> list:
+    words = [w for w in _TOKEN_RE.findall(prompt.lower()) if len(w) > 3] or ["concept"]
+    return [rng.choice(words) for _ in range(12)]
+
+
+def fake_response(prompt: str) -> str:
+    """
+    A valid JSON answer for whichever of the app's prompts `prompt` is
+    (student, evaluator, scorer, fused judge, Q&A generation). The same
+    prompt always gets the same answer.
+    """
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+    words = _prompt_words(prompt, rng)
+
+    def score():
+        return round(rng.uniform(0.3, 1.0), 2)
+
+    evaluator = {
+        "rating": rng.choice(["excellent", "good", "partial", "needs work", "incorrect"]),
+        "missing_points": [f"How {words[0]} relates to {words[1]}"],
+        "incorrect_points": [],
+        "feedback": f"Explain {words[2]} with an example.",
+        "referenced_points": [words[3]],
+    }
+    scorer = {
+        "overall_score": score(), "teacher_clarity": score(), "teacher_completeness": score(),
+        "student_understanding": score(), "student_engagement": score(),
+        "comments": [f"Clear on {words[4]}, vague on {words[5]}."],
+    }
+
+    if '"evaluator": {' in prompt and '"scorer": {' in prompt:
+        return json.dumps({"evaluator": evaluator, "scorer": scorer})
+    if "preparing questions" in prompt:
+        return json.dumps({"questions": [
+            {"q": f"Why does {rng.choice(words)} matter for {rng.choice(words)}?",
+             "a": " ".join(rng.choice(words) for _ in range(20)).capitalize() + "."}
+            for _ in range(5)
+        ]})
+    if "curious student" in prompt:
+        rating = rng.choice(["understood", "needs work", "needs work", "confused"])
+        message = None if rating == "understood" else (
+            f"Could you explain how {words[6]} works when {words[7]} and {words[8]} interact? "
+            f"I am not sure why {words[9]} is needed."
+        )
+        return json.dumps({
+            "message": message,
+            "rating": rating,
+            "reflection": f"I think I follow {words[10]}, but {words[11]} is still unclear.",
+            "missing_points": [] if rating == "understood" else [f"{words[7]} vs {words[8]}"],
+        })
+    if "overall_score" in prompt:
+        return json.dumps(scorer)
+    return json.dumps(evaluator)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic, offline stand-in for the OpenRouter chat models.
+
+    Answers come from fake_response(). `latency` is the delay before the
+    first token; with `tokens_per_second` set, the rest of the answer is paced
+    (streamed or not) at that rate, one whitespace-delimited word per token.
+    """
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    model_name: str = "fake/chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, messages):
+        text = fake_response("\n".join(str(m.content) for m in messages))
+        return text, _PIECE_RE.findall(text)
+
+    def _generation_time(self, pieces) -> float:
+        return self.latency + (len(pieces) / self.tokens_per_second if self.tokens_per_second else 0.0)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, pieces = self._answer(messages)
+        time.sleep(self._generation_time(pieces))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, pieces = self._answer(messages)
+        await asyncio.sleep(self._generation_time(pieces))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        _, pieces = self._answer(messages)
+        await asyncio.sleep(self.latency)
+        for piece in pieces:
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+
+# ------------------- MONGO ------------------- #
+
+def _get(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def _set(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _matches(doc: dict, filter: dict) -> bool:
+    for path, cond in (filter or {}).items():
+        value = _get(doc, path)
+        if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            for op, arg in cond.items():
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$not" and _matches(doc, {path: arg}):
+                    return False
+                if op == "$exists" and (path_exists(doc, path) != bool(arg)):
+                    return False
+                if op == "$ne" and (value == arg or isinstance(value, list) and arg in value):
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    if not {"$gt": value > arg, "$gte": value >= arg,
+                            "$lt": value < arg, "$lte": value <= arg}[op]:
+                        return False
+        elif value != cond and not (isinstance(value, list) and cond in value):
+            return False
+    return True
+
+
+def path_exists(doc: dict, path: str) -> bool:
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return False
+        doc = doc[part]
+    return True
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        for path, value in fields.items():
+            current = _get(doc, path)
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, path, copy.deepcopy(value))
+            elif op == "$inc":
+                _set(doc, path, (current or 0) + value)
+            elif op == "$min":
+                _set(doc, path, value if current is None else min(current, value))
+            elif op == "$max":
+                _set(doc, path, value if current is None else max(current, value))
+            elif op == "$push":
+                each = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                items = list(current or []) + copy.deepcopy(each)
+                if isinstance(value, dict) and "$slice" in value:
+                    items = items[value["$slice"]:] if value["$slice"] < 0 else items[: value["$slice"]]
+                _set(doc, path, items)
+
+
+class MemoryCursor:
+    """find() result: chainable sort/limit, iterable with `for` and `async for`."""
+
+    def __init__(self, docs: list, projection: dict = None):
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        keys = [(key, direction or 1)] if isinstance(key, str) else list(key)
+        for path, order in reversed(keys):
+            self._docs.sort(key=lambda d: (_get(d, path) is None, _get(d, path)), reverse=order < 0)
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def _results(self):
+        docs = self._docs[: self._limit] if self._limit else self._docs
+        for doc in docs:
+            fields = {k: v for k, v in (self._projection or {}).items() if k != "_id"} or self._projection
+            if fields and any(fields.values()):
+                keep = {k for k, v in self._projection.items() if v} | {"_id"}
+                doc = {k: v for k, v in doc.items() if k in keep}
+            elif self._projection:
+                doc = {k: v for k, v in doc.items() if k not in self._projection}
+            yield copy.deepcopy(doc)
+
+    def __iter__(self):
+        return self._results()
+
+    async def __aiter__(self):
+        for doc in self._results():
+            yield doc
+
+
+class MemoryCollection:
+    """The subset of pymongo's Collection API this app uses, kept in a dict."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.docs = {}
+        self.indexes = []  # key patterns of create_indexes()
+        self._lock = threading.Lock()
+
+    def find_one(self, filter=None, projection=None):
+        return next(iter(self.find(filter, projection).limit(1)), None)
+
+    def find(self, filter=None, projection=None, **kwargs):
+        with self._lock:
+            if filter and set(filter) == {"_id"} and not isinstance(filter["_id"], dict):
+                docs = [self.docs[filter["_id"]]] if filter["_id"] in self.docs else []
+            else:
+                docs = [d for d in self.docs.values() if _matches(d, filter)]
+        return MemoryCursor(docs, projection)
+
+    def count_documents(self, filter=None) -> int:
+        return sum(1 for _ in self.find(filter))
+
+    def insert_one(self, doc: dict):
+        with self._lock:
+            self._insert(doc)
+
+    def _insert(self, doc: dict):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']!r} in {self.name}")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    def replace_one(self, filter: dict, doc: dict, upsert: bool = False):
+        with self._lock:
+            self._replace(filter, doc, upsert)
+
+    def _replace(self, filter, doc, upsert):
+        existing = next((d for d in self.docs.values() if _matches(d, filter)), None)
+        if existing is None and not upsert:
+            return
+        key = existing["_id"] if existing else doc.get("_id", filter.get("_id"))
+        self.docs[key] = {**copy.deepcopy(doc), "_id": key}
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False):
+        with self._lock:
+            self._update(filter, update, upsert)
+
+    def _update(self, filter, update, upsert):
+        if "_id" in filter and not isinstance(filter["_id"], dict):
+            existing = self.docs.get(filter["_id"])
+            if existing is not None and not _matches(existing, filter):
+                existing = None
+        else:
+            existing = next((d for d in self.docs.values() if _matches(d, filter)), None)
+        if existing is not None:
+            _apply_update(existing, update, inserting=False)
+        elif upsert:
+            doc = {k: copy.deepcopy(v) for k, v in filter.items() if not isinstance(v, dict)}
+            _apply_update(doc, update, inserting=True)
+            self._insert(doc)
+
+    def delete_many(self, filter=None):
+        with self._lock:
+            for key in [k for k, d in self.docs.items() if _matches(d, filter)]:
+                del self.docs[key]
+
+    def bulk_write(self, ops, ordered: bool = True):
+        errors = []
+        with self._lock:
+            for i, op in enumerate(ops):
+                # pymongo keeps the operation's arguments in private attributes
+                try:
+                    if isinstance(op, InsertOne):
+                        self._insert(op._doc)
+                    elif isinstance(op, ReplaceOne):
+                        self._replace(op._filter, op._doc, op._upsert)
+                    elif isinstance(op, UpdateOne):
+                        self._update(op._filter, op._doc, op._upsert)
+                except DuplicateKeyError as e:
+                    errors.append({"index": i, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def create_indexes(self, indexes):
+        documents = [getattr(i, "document", {}) for i in indexes]
+        self.indexes.extend(dict(d.get("key", {})) for d in documents)
+        return [d.get("name", "") for d in documents]
+
+    def plan(self, filter: dict) -> dict:
+        """Winning plan of a find: by _id, on an index led by a filtered field, or a collection scan."""
+        if "_id" in filter:
+            return {"stage": "IDHACK"}
+        for key in self.indexes:
+            if next(iter(key), None) in filter:
+                return {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "keyPattern": key}}
+        return {"stage": "COLLSCAN"}
+
+
+class AsyncMemoryCollection:
+    """Motor-style (awaitable) view of a MemoryCollection, with optional per-call latency."""
+
+    def __init__(self, collection: MemoryCollection, latency: float = 0.0):
+        self.sync = collection
+        self.latency = latency
+
+    async def _wait(self):
+        await asyncio.sleep(self.latency)
+
+    def find(self, filter=None, projection=None, **kwargs):
+        return self.sync.find(filter, projection)
+
+    async def find_one(self, filter=None, projection=None):
+        await self._wait()
+        return self.sync.find_one(filter, projection)
+
+    async def insert_one(self, doc):
+        await self._wait()
+        return self.sync.insert_one(doc)
+
+    async def replace_one(self, filter, doc, upsert=False):
+        await self._wait()
+        return self.sync.replace_one(filter, doc, upsert)
+
+    async def update_one(self, filter, update, upsert=False):
+        await self._wait()
+        return self.sync.update_one(filter, update, upsert)
+
+    async def bulk_write(self, ops, ordered=True):
+        await self._wait()
+        return self.sync.bulk_write(ops, ordered)
+
+    async def count_documents(self, filter=None):
+        await self._wait()
+        return self.sync.count_documents(filter)
+
+
+class MemoryDatabase:
+    """db["name"] -> MemoryCollection. async_view() gives the matching Motor-style database."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def collection_names(self) -> list:
+        return list(self._collections)
+
+    def command(self, name, value=None, **kwargs):
+        """Only `explain` of a find, enough for schema.check_query_plans()."""
+        if name != "explain" or "find" not in (value or {}):
+            raise OperationFailure(f"no such command: '{name}'", code=59)
+        return {"queryPlanner": {"winningPlan": self[value["find"]].plan(value.get("filter") or {})}}
+
+    def async_view(self):
+        return _AsyncMemoryDatabase(self)
+
+
+class _AsyncMemoryDatabase:
+    def __init__(self, database: MemoryDatabase):
+        self.sync = database
+
+    def __getitem__(self, name: str) -> AsyncMemoryCollection:
+        return AsyncMemoryCollection(self.sync[name], self.sync.latency)
@@ -1,20 +1,65 @@
 import os
 import glob
+import uuid
+import asyncio
+import argparse
 import json
+import time
+import hashlib
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 from tqdm import tqdm
 
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
+
+from embedding_cache import CachedEmbeddings
+from vectorstore_registry import (
+    write_store_version, open_chroma, TopicView, VS_LAYOUT, VS_SHARED_COLLECTION, SHARED_DIR, VS_BACKEND
+)
+from qa_pool import build_pool, prune_pool
+from embed_scheduler import embed_and_write, iter_in_thread, EMBED_BATCH_TOKENS
 
 # Paths
 load_dotenv()
-DATA_DIR = os.getenv("DATA_DIR", Path(__file__).resolve().parents[1] / "data")
-VS_DIR = VS_DIR = Path(os.getenv("VS_DIR", Path(__file__).resolve().parents[1] / "vectorstore"))
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parents[1] / "data"))
+VS_DIR = Path(os.getenv("VS_DIR", Path(__file__).resolve().parents[1] / "vectorstore"))
 CATALOG_PATH = VS_DIR / "catalog.json"
+MANIFEST_DIR = VS_DIR / "manifests"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+EMBED_CACHE = os.getenv("EMBED_CACHE", "1") == "1"
+# "batch" loads and splits whole files before embedding; "stream" pipes pages into the embedder
+INGEST_MODE = os.getenv("INGEST_MODE", "batch")
+# Precompute this many Q&A pairs per topic after ingestion (0 = leave it to qa_pool.py)
+QA_POOL_SIZE = int(os.getenv("QA_POOL_SIZE", "0"))
+QA_POOL_MODEL = os.getenv("QA_POOL_MODEL", "openai/gpt-4o")
+
+SUPPORTED_PATTERNS = ("*.pdf", "*.txt", "*.md")
+
+
+def list_topic_files(topic_dir: Path):
+    """Return the supported files of a topic folder, sorted by name."""
+    paths = []
+    for pattern in SUPPORTED_PATTERNS:
+        paths.extend(glob.glob(str(topic_dir / pattern)))
+    return sorted(paths)
+
+
+def load_file(p: str):
+    """Load a single PDF, TXT or MD file into page/document objects. Parse errors are raised."""
+    if p.lower().endswith(".pdf"):
+        print(f"[ingest] Loading PDF: {p}")
+        pages = PyPDFLoader(p).load()
+        print(f"[ingest]   -> Loaded {len(pages)} pages from {Path(p).name}")
+        return pages
+
+    print(f"[ingest] Loading text file: {p}")
+    texts = TextLoader(p, encoding="utf-8").load()
+    print(f"[ingest]   -> Loaded {len(texts)} document(s) from {Path(p).name}")
+    return texts
 
 
 def load_documents(topic_dir: Path):
@@ -27,55 +72,201 @@ def load_documents(topic_dir: Path):
 
     print(f"[ingest] Found {len(pdf_paths)} PDFs, {len(txt_paths)} TXTs, {len(md_paths)} MDs in {topic_dir}")
 
-    for p in pdf_paths:
+    for p in pdf_paths + txt_paths + md_paths:
         try:
-            print(f"[ingest] Loading PDF: {p}")
-            pages = PyPDFLoader(p).load()
-            print(f"[ingest]   -> Loaded {len(pages)} pages from {Path(p).name}")
-            docs.extend(pages)
+            docs.extend(load_file(p))
         except Exception as e:
-            print(f"[ingest] Failed to load PDF {p}: {e}")
-
-    for p in txt_paths + md_paths:
-        try:
-            print(f"[ingest] Loading text file: {p}")
-            texts = TextLoader(p, encoding="utf-8").load()
-            print(f"[ingest]   -> Loaded {len(texts)} document(s) from {Path(p).name}")
-            docs.extend(texts)
-        except Exception as e:
-            print(f"[ingest] Failed to load text {p}: {e}")
+            print(f"[ingest] Failed to load {p}: {e}")
 
     print(f"[ingest] Total loaded documents for {topic_dir.name}: {len(docs)}")
     return docs
 
 
-def split_docs(docs, topic: str):
-    """Split into manageable chunks for embeddings with logging."""
-    splitter = RecursiveCharacterTextSplitter(
+def make_splitter():
+    return RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200,
         length_function=len,
         is_separator_regex=False,
     )
-    splits = splitter.split_documents(docs)
+
+
+def tag_chunk(chunk, topic: str):
+    """Metadata every chunk carries: topic, source file name and page (0 for text files)."""
+    chunk.metadata["topic"] = topic
+    chunk.metadata["source"] = Path(chunk.metadata.get("source", "")).name
+    chunk.metadata["page"] = int(chunk.metadata.get("page", 0))
+    return chunk
+
+
+def split_docs(docs, topic: str):
+    """Split into manageable chunks for embeddings with logging."""
+    splitter = make_splitter()
+    splits = [tag_chunk(chunk, topic) for chunk in splitter.split_documents(docs)]
     print(f"[ingest] Split {len(docs)} documents into {len(splits)} chunks for topic={topic}")
     return splits
 
 
-def build_vectorstore(splits, topic: str, batch_size: int = 64):
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    topic_vs_dir = VS_DIR / topic
+def iter_file_pages(p: str):
+    """Yield the pages of a file one at a time instead of loading them all. Parse errors are raised."""
+    loader = PyPDFLoader(p) if p.lower().endswith(".pdf") else TextLoader(p, encoding="utf-8")
+    yield from loader.lazy_load()
+
+
+def iter_file_chunks(p: str, sha256: str, chunk_ids: list, topic: str):
+    """
+    Yield (chunk id, chunk) pairs for a file page by page.
+
+    Pages are split independently, exactly as split_docs does, so ids match
+    the batch path. Every id handed out is appended to `chunk_ids` for the
+    manifest.
+    """
+    splitter = make_splitter()
+    name = id_prefix(topic) + Path(p).name
+    print(f"[ingest] Streaming {p}")
+    for page in iter_file_pages(p):
+        for chunk in splitter.split_documents([page]):
+            chunk_id = f"{name}:{sha256[:16]}:{len(chunk_ids)}"
+            chunk_ids.append(chunk_id)
+            yield chunk_id, tag_chunk(chunk, topic)
+
+
+# ------------------- MANIFEST ------------------- #
+
+def file_sha256(p: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def id_prefix(topic: str) -> str:
+    # Chunks of every topic share one id space in the shared layout
+    return f"{topic}/" if VS_LAYOUT == "shared" else ""
+
+
+def chunk_ids_for(p: str, sha256: str, n: int, topic: str = None):
+    """Deterministic chunk ids, so a file's chunks can be deleted on re-ingest."""
+    name = (id_prefix(topic) if topic else "") + Path(p).name
+    return [f"{name}:{sha256[:16]}:{i}" for i in range(n)]
+
+
+def manifest_path(topic: str) -> Path:
+    return MANIFEST_DIR / f"{topic}.json"
+
+
+def store_key(layout: str = None) -> dict:
+    """Which store a manifest's chunk ids live in: the layout and, for the shared layout, its collection."""
+    layout = layout or VS_LAYOUT
+    return {"layout": layout, "collection": VS_SHARED_COLLECTION if layout == "shared" else None}
+
+
+def load_manifest(topic: str):
+    """Return {file path: {size, mtime, sha256, chunk_ids}} for a topic."""
+    path = manifest_path(topic)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("files", {})
+
+
+def load_manifest_store(topic: str):
+    """The store_key() the topic's manifest was written for, None without a manifest."""
+    path = manifest_path(topic)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        # Manifests from before the shared layout existed describe per-topic stores
+        return json.load(f).get("store", store_key("per_topic"))
+
+
+def save_manifest(topic: str, files: dict, store: dict = None):
+    MANIFEST_DIR.mkdir(parents=True, exist_ok=True)
+    path = manifest_path(topic)
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"topic": topic, "updated_at": time.time(), "store": store or store_key(), "files": files},
+                  f, indent=4)
+    os.replace(tmp, path)
+
+
+def diff_topic(topic_dir: Path, manifest: dict):
+    """
+    Compare the files on disk against the topic manifest.
+
+    Size and mtime are checked first; a file is only hashed when one of them
+    moved, and it only counts as changed when the hash differs too.
+
+    Returns:
+        (changed, removed, unchanged) where changed maps path -> fingerprint
+        for new or modified files, removed is a list of paths that disappeared,
+        and unchanged maps path -> (possibly refreshed) manifest entry.
+    """
+    changed, unchanged = {}, {}
+    paths = list_topic_files(topic_dir)
+
+    for p in paths:
+        st = os.stat(p)
+        entry = manifest.get(p)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            unchanged[p] = entry
+            continue
+
+        sha256 = file_sha256(p)
+        fingerprint = {"size": st.st_size, "mtime": st.st_mtime, "sha256": sha256}
+        if entry and entry["sha256"] == sha256:
+            # Touched but not edited: keep the chunks, remember the new mtime
+            unchanged[p] = {**entry, **fingerprint}
+        else:
+            changed[p] = fingerprint
+
+    on_disk = set(paths)
+    removed = [p for p in manifest if p not in on_disk]
+    return changed, removed, unchanged
+
+
+# ------------------- VECTORSTORE ------------------- #
+
+_embeddings = None
+
+
+def get_embeddings():
+    """Embedding client shared by every topic of this run, behind the on-disk cache."""
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = OpenAIEmbeddings(model=EMBED_MODEL)
+        if EMBED_CACHE:
+            _embeddings = CachedEmbeddings(_embeddings, EMBED_MODEL)
+    return _embeddings
+
+
+def store_path(topic: str) -> Path:
+    """Persist directory holding `topic`'s chunks in the configured layout."""
+    return SHARED_DIR if VS_LAYOUT == "shared" else VS_DIR / topic
+
+
+def open_vectorstore(topic: str):
+    if VS_LAYOUT == "shared":
+        return TopicView(open_chroma(SHARED_DIR, VS_SHARED_COLLECTION, get_embeddings()), topic)
+    return open_chroma(VS_DIR / topic, embeddings=get_embeddings())
+
+
+def build_vectorstore(splits, topic: str, ids=None, vs=None, batch_tokens: int = EMBED_BATCH_TOKENS):
+    topic_vs_dir = store_path(topic)
 
     print(f"[ingest] Building vectorstore for topic={topic} at {topic_vs_dir}")
-    vs = Chroma(
-        embedding_function=embeddings,
-        persist_directory=str(topic_vs_dir),
-    )
+    if vs is None:
+        vs = open_vectorstore(topic)
+    if ids is None:
+        ids = [str(uuid.uuid4()) for _ in splits]
 
-    # Insert in batches with progress bar
-    for i in tqdm(range(0, len(splits), batch_size), desc=f"[{topic}] Embedding"):
-        batch = splits[i: i + batch_size]
-        vs.add_documents(batch)
+    # Embed with several requests in flight; a single writer stores the results
+    with tqdm(total=len(splits), desc=f"[{topic}] Embedding") as progress:
+        asyncio.run(embed_and_write(
+            vs, zip(ids, splits), get_embeddings(),
+            batch_tokens=batch_tokens, progress=progress,
+        ))
 
     vs.persist()
     print(
@@ -83,6 +274,265 @@ def build_vectorstore(splits, topic: str, batch_size: int = 64):
     return vs
 
 
+def stream_vectorstore(changed: dict, topic: str, vs, files: dict):
+    """
+    Parse, split and embed the changed files of a topic as one stream.
+
+    Parsing runs in a background thread feeding a bounded queue, so it
+    overlaps with embedding and only a few batches of chunks are ever held
+    in memory. Fills `files` with the manifest entry of every file streamed
+    in full. A file that fails part way is left out of `files` and the chunks
+    it already produced are deleted again.
+
+    Returns:
+        (chunks written, paths that failed to parse)
+    """
+    failed = {}
+
+    def chunks():
+        for p, fingerprint in changed.items():
+            ids = []
+            try:
+                yield from iter_file_chunks(p, fingerprint["sha256"], ids, topic)
+            except Exception as e:
+                print(f"[ingest] Failed to load {p}: {e}")
+                failed[p] = ids
+                continue
+            files[p] = {**fingerprint, "chunk_ids": ids}
+
+    print(f"[ingest] Streaming {len(changed)} files into vectorstore for topic={topic}")
+    with tqdm(desc=f"[{topic}] Embedding", unit="chunk") as progress:
+        n_chunks = asyncio.run(embed_and_write(
+            vs, iter_in_thread(chunks()), get_embeddings(), progress=progress,
+        ))
+
+    partial = [chunk_id for ids in failed.values() for chunk_id in ids]
+    if partial:
+        delete_chunks(vs, partial)
+        n_chunks -= len(partial)
+    vs.persist()
+    print(f"[ingest]   -> Vectorstore streamed with {n_chunks} chunks for {topic}")
+    return n_chunks, list(failed)
+
+
+def delete_chunks(vs, ids, batch_size: int = 500):
+    for i in range(0, len(ids), batch_size):
+        vs.delete(ids=ids[i: i + batch_size])
+
+
+def wipe_topic(vs, topic: str):
+    """
+    Delete every chunk of `topic` from its store.
+
+    Used when a topic has no manifest yet: a store built before manifests
+    existed holds chunks under random ids, which the deterministic ids of
+    an incremental run would otherwise sit next to.
+    """
+    ids = vs.get(include=[])["ids"]
+    if not ids:
+        return
+    print(f"[ingest] No manifest for topic={topic}, deleting its {len(ids)} existing chunks")
+    delete_chunks(vs, ids)
+    prune_pool(topic, ids)
+
+
+def parse_file(p: str, topic: str):
+    """
+    Load and split a single file. Runs inside a worker process in parallel mode.
+
+    Splits are None when the file could not be parsed, so the caller can
+    leave it out of the manifest and retry it on the next run.
+    """
+    start = time.perf_counter()
+    try:
+        docs = load_file(p)
+    except Exception as e:
+        print(f"[ingest] Failed to load {p}: {e}")
+        return None, time.perf_counter() - start
+    splits = split_docs(docs, topic) if docs else []
+    return splits, time.perf_counter() - start
+
+
+def parse_files(jobs, workers: int = 1):
+    """
+    Load and split a list of (topic, path) jobs, optionally in a process pool.
+
+    Largest files are submitted first so one big PDF does not end up alone at
+    the tail of the run, but results are always returned in the order of
+    `jobs`, which keeps chunk order and ids reproducible.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        results = [parse_file(p, topic) for topic, p in jobs]
+    else:
+        order = sorted(range(len(jobs)), key=lambda i: os.path.getsize(jobs[i][1]), reverse=True)
+        results = [None] * len(jobs)
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = {i: pool.submit(parse_file, jobs[i][1], jobs[i][0]) for i in order}
+            for i, future in futures.items():
+                results[i] = future.result()
+
+    for (topic, p), (splits, elapsed) in zip(jobs, results):
+        if splits is not None:
+            print(f"[ingest] Parsed {Path(p).name} ({topic}) in {elapsed:.2f}s → {len(splits)} chunks")
+    return results
+
+
+def plan_topic(topic_dir: Path):
+    """
+    Diff a topic folder against its manifest. Returns None when it has no documents.
+
+    Without a manifest, or with one written for another layout or shared
+    collection, every file counts as new and the plan asks for a rebuild,
+    which clears whatever the topic's store already holds.
+    """
+    topic = topic_dir.name
+    store = load_manifest_store(topic)
+    manifest = load_manifest(topic)
+    orphaned = []
+    if store is not None and store != store_key():
+        print(f"[ingest] Manifest of {topic} was written for {store}, re-embedding into {store_key()}")
+        orphaned = [i for entry in manifest.values() for i in entry.get("chunk_ids", [])]
+        manifest = {}
+    rebuild = store != store_key()
+    changed, removed, unchanged = diff_topic(topic_dir, manifest)
+
+    if not changed and not unchanged and not removed:
+        return None
+
+    return {
+        "topic": topic,
+        "manifest": manifest,
+        "changed": changed,
+        "removed": removed,
+        "unchanged": unchanged,
+        "rebuild": rebuild,
+        # Chunk ids of the store the topic is moving away from
+        "orphaned": orphaned,
+    }
+
+
+def apply_topic(plan: dict, parsed: dict = None):
+    """
+    Bring the vectorstore of one topic in line with its folder.
+
+    `parsed` maps every changed path of the plan to its chunks (None for a
+    file that failed to parse). New chunks are embedded in file order, then
+    the chunks of modified or deleted files are removed. Without `parsed`,
+    the changed files are streamed page by page straight into the embedder
+    instead. A file that fails to parse keeps its previous manifest entry and
+    chunks (or stays out of the manifest if it is new), so the next run picks
+    it up again. Returns the number of files (re-)embedded.
+    """
+    topic = plan["topic"]
+    manifest, changed = plan["manifest"], plan["changed"]
+    removed, unchanged = plan["removed"], plan["unchanged"]
+
+    if not changed and not removed:
+        if unchanged != manifest:
+            save_manifest(topic, unchanged)
+        print(f"[ingest] Topic {topic} is up to date ({len(unchanged)} files), skipping")
+        if VS_BACKEND == "numpy" and not numpy_index_exists(topic):
+            export_numpy_index(topic)
+        return 0
+
+    print(f"[ingest] {topic}: {len(changed)} new/changed, {len(removed)} removed, {len(unchanged)} unchanged")
+    vs = open_vectorstore(topic)
+    if plan.get("rebuild"):
+        wipe_topic(vs, topic)
+        prune_pool(topic, plan.get("orphaned", []))
+
+    files = dict(unchanged)
+    if parsed is None:
+        n_chunks, failed = stream_vectorstore(changed, topic, vs, files)
+    else:
+        all_splits, all_ids, failed = [], [], []
+        for p, fingerprint in changed.items():
+            splits = parsed[p]
+            if splits is None:
+                failed.append(p)
+                continue
+            ids = chunk_ids_for(p, fingerprint["sha256"], len(splits), topic)
+            all_splits.extend(splits)
+            all_ids.extend(ids)
+            files[p] = {**fingerprint, "chunk_ids": ids}
+
+        if all_splits:
+            build_vectorstore(all_splits, topic, ids=all_ids, vs=vs)
+        else:
+            vs.persist()
+        n_chunks = len(all_splits)
+
+    for p in failed:
+        # The old entry (if any) still describes what the store holds for this file
+        if p in manifest:
+            files[p] = manifest[p]
+    if failed:
+        print(f"[ingest] {len(failed)} files of topic={topic} failed to parse, they are retried on the next run")
+
+    # Only now that the new chunks are in, drop those of replaced or deleted files
+    live_ids = {chunk_id for entry in files.values() for chunk_id in entry.get("chunk_ids", [])}
+    stale_ids = []
+    for p in [p for p in changed if p not in failed] + removed:
+        stale_ids.extend(i for i in manifest.get(p, {}).get("chunk_ids", []) if i not in live_ids)
+    if stale_ids:
+        print(f"[ingest] Deleting {len(stale_ids)} stale chunks for topic={topic}")
+        delete_chunks(vs, stale_ids)
+        vs.persist()
+        pruned = prune_pool(topic, stale_ids)
+        if pruned:
+            print(f"[ingest] Dropped {pruned} Q&A pool entries generated from stale chunks")
+
+    save_manifest(topic, files)
+    # Tells running app workers to reopen this store
+    write_store_version(store_path(topic))
+    if VS_BACKEND == "numpy":
+        export_numpy_index(topic, vs)
+    n_files = len(changed) - len(failed)
+    print(f"[ingest] Finished processing topic {topic}: {n_files} files → {n_chunks} chunks")
+    return n_files
+
+
+def numpy_index_exists(topic: str) -> bool:
+    from numpy_index import index_exists, index_path
+    return index_exists(index_path(topic))
+
+
+def export_numpy_index(topic: str, vs=None):
+    """Re-export the memory-mapped index sessions read with VS_BACKEND=numpy."""
+    from numpy_index import export_store, index_path
+
+    n = export_store(vs or open_vectorstore(topic), index_path(topic))
+    print(f"[ingest] NumPy index for {topic}: {n} chunks at {index_path(topic)}")
+
+
+def ingest_topic(topic_dir: Path, workers: int = 1, mode: str = "batch"):
+    """Incrementally ingest a single topic folder."""
+    plan = plan_topic(topic_dir)
+    if plan is None:
+        return None
+    if mode == "stream":
+        return apply_topic(plan)
+    jobs = [(plan["topic"], p) for p in plan["changed"]]
+    results = parse_files(jobs, workers)
+    parsed = {p: splits for (_, p), (splits, _) in zip(jobs, results)}
+    return apply_topic(plan, parsed)
+
+
+def topic_entry(topic: str, description: str = None) -> dict:
+    """
+    Catalog entry for a topic of the shared layout: what it covers (sources,
+    chunk count), not where it is stored.
+    """
+    files = load_manifest(topic)
+    return {
+        "description": description or f"This folder contains materials for {topic}.",
+        "collection": VS_SHARED_COLLECTION,
+        "sources": sorted(Path(p).name for p in files),
+        "chunks": sum(len(entry.get("chunk_ids", [])) for entry in files.values()),
+        "updated_at": time.time(),
+    }
+
+
 def update_catalog(topics):
     """Create or update catalog.json with topics and descriptions."""
     catalog = {}
@@ -91,9 +541,15 @@ def update_catalog(topics):
             catalog = json.load(f)
 
     for topic in topics:
-        if topic not in catalog:
+        description = catalog.get(topic, {}).get("description")
+        if load_manifest_store(topic) != store_key():
+            # Nothing of this topic was written to the configured store, keep pointing at the old one
+            print(f"[ingest] {topic} is not in the {VS_LAYOUT} store yet, leaving its catalog entry as is")
+        elif VS_LAYOUT == "shared":
+            catalog[topic] = topic_entry(topic, description)
+        elif not catalog.get(topic, {}).get("vectorstore_path"):
             catalog[topic] = {
-                "description": f"This folder contains materials for {topic}.",
+                "description": description or f"This folder contains materials for {topic}.",
                 "vectorstore_path": str(VS_DIR / topic),
             }
 
@@ -102,40 +558,75 @@ def update_catalog(topics):
     print(f"[ingest] Catalog updated at {CATALOG_PATH}")
 
 
-def main():
+def main(workers: int = None, mode: str = None, qa_pool_size: int = None):
     load_dotenv()
+    workers = workers or INGEST_WORKERS
+    mode = mode or INGEST_MODE
+    qa_pool_size = QA_POOL_SIZE if qa_pool_size is None else qa_pool_size
     print(f"[ingest] DATA_DIR={DATA_DIR}")
-    print(f"[ingest] VS_DIR={VS_DIR}")
+    print(f"[ingest] VS_DIR={VS_DIR} layout={VS_LAYOUT} backend={VS_BACKEND}")
+    print(f"[ingest] mode={mode} workers={workers}")
 
     if not DATA_DIR.exists():
         print(f"[ingest] Data directory not found: {DATA_DIR}")
         return
 
-    topic_dirs = [d for d in DATA_DIR.iterdir() if d.is_dir()]
+    topic_dirs = sorted(d for d in DATA_DIR.iterdir() if d.is_dir())
     if not topic_dirs:
         print(f"[ingest] No topic folders found inside {DATA_DIR}")
         return
 
-    processed_topics = []
-
+    plans = []
     for topic_dir in topic_dirs:
-        topic = topic_dir.name
-        print(f"\n[ingest] === Processing topic: {topic} ===")
-        docs = load_documents(topic_dir)
-        if not docs:
+        plan = plan_topic(topic_dir)
+        if plan is None:
             print(f"[ingest] No documents found in {topic_dir}, skipping...")
             continue
+        plans.append(plan)
+
+    # Parse the changed files of every topic in one pool, then embed topic by topic.
+    # Streaming mode parses while embedding instead, so there is nothing to do up front.
+    jobs = [] if mode == "stream" else [(plan["topic"], p) for plan in plans for p in plan["changed"]]
+    start = time.perf_counter()
+    results = parse_files(jobs, workers)
+    if jobs:
+        print(f"[ingest] Parsed {len(jobs)} files in {time.perf_counter() - start:.2f}s")
+    parsed = {(topic, p): splits for (topic, p), (splits, _) in zip(jobs, results)}
 
-        splits = split_docs(docs, topic)
-        _ = build_vectorstore(splits, topic)
+    processed_topics = []
 
-        print(f"[ingest] Finished processing topic {topic}: {len(docs)} docs → {len(splits)} chunks")
+    for plan in plans:
+        topic = plan["topic"]
+        print(f"\n[ingest] === Processing topic: {topic} ===")
+        if mode == "stream":
+            apply_topic(plan)
+        else:
+            apply_topic(plan, {p: parsed[(topic, p)] for p in plan["changed"]})
         processed_topics.append(topic)
 
     if processed_topics:
         update_catalog(processed_topics)
         print(f"[ingest] All topics processed: {processed_topics}")
 
+    if qa_pool_size > 0 and processed_topics:
+        from models import get_llm
+        llm = get_llm(QA_POOL_MODEL)
+        for topic in processed_topics:
+            total = build_pool(topic, llm, open_vectorstore(topic), qa_pool_size)
+            print(f"[ingest] Q&A pool for {topic}: {total} entries")
+
+    if isinstance(_embeddings, CachedEmbeddings):
+        _embeddings.report()
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Ingest topic folders into the vectorstore (per-topic or shared, see VS_LAYOUT).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Parse files in a process pool of this size (default: $INGEST_WORKERS or 1)")
+    parser.add_argument("--mode", choices=["batch", "stream"], default=None,
+                        help="batch: parse whole files, then embed; stream: embed pages as they are parsed "
+                             "with bounded memory (default: $INGEST_MODE or batch)")
+    parser.add_argument("--qa-pool-size", type=int, default=None,
+                        help="Precompute Q&A pairs per topic after ingestion (default: $QA_POOL_SIZE or 0)")
+    args = parser.parse_args()
+    main(workers=args.workers, mode=args.mode, qa_pool_size=args.qa_pool_size)
@@ -0,0 +1,108 @@
+"""
+Incremental extraction of one string field from a JSON object that is still
+being generated.
+
+The student chain streams its raw JSON; only the decoded text of the
+top-level "message" field is forwarded to the UI while the rest of the
+object is parsed normally once the stream ends.
+"""
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonFieldStreamer:
+    """
+    Feed raw chunks of a JSON object; get back the newly decoded characters of
+    the top-level string field `field`.
+
+    Text before the opening brace (e.g. a ```json fence) is ignored. A null or
+    non-string value yields nothing.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.done = False
+        self.emitted = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode = None      # hex digits of a \\uXXXX escape being read
+        self._high = None         # pending high surrogate
+        self._expect_key = False
+        self._reading_key = False
+        self._streaming = False
+        self._key = []
+        self._current_key = None
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        for ch in chunk:
+            if self.done:
+                break
+            if self._in_string:
+                self._string_char(ch, out)
+            else:
+                self._structural_char(ch)
+        text = "".join(out)
+        self.emitted += len(text)
+        return text
+
+    def _structural_char(self, ch: str):
+        if self._depth == 0 and ch != "{":
+            return  # preamble, quotes and brackets included
+        if ch == '"':
+            self._in_string = True
+            if self._depth == 1 and self._expect_key:
+                self._reading_key, self._key = True, []
+            elif self._depth == 1 and self._current_key == self.field:
+                self._streaming = True
+        elif ch in "{[":
+            self._depth += 1
+            self._expect_key = self._depth == 1 and ch == "{"
+        elif ch in "}]":
+            self._depth -= 1
+            if self._depth == 0:
+                self.done = True
+        elif self._depth == 1 and ch == ":":
+            self._expect_key = False
+        elif self._depth == 1 and ch == ",":
+            self._expect_key, self._current_key = True, None
+        elif self._depth == 1 and not ch.isspace() and self._current_key == self.field:
+            # null / number / bool: nothing to stream
+            self.done = True
+
+    def _string_char(self, ch: str, out: list):
+        if self._unicode is not None:
+            self._unicode += ch
+            if len(self._unicode) == 4:
+                code, self._unicode = int(self._unicode, 16), None
+                if 0xD800 <= code < 0xDC00:
+                    self._high = code
+                    return
+                if 0xDC00 <= code < 0xE000 and self._high is not None:
+                    code = 0x10000 + ((self._high - 0xD800) << 10) + (code - 0xDC00)
+                self._high = None
+                self._emit(chr(code), out)
+            return
+        if self._escape:
+            self._escape = False
+            if ch == "u":
+                self._unicode = ""
+            else:
+                self._emit(_ESCAPES.get(ch, ch), out)
+            return
+        if ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._reading_key:
+                self._reading_key, self._current_key = False, "".join(self._key)
+            elif self._streaming:
+                self._streaming, self.done = False, True
+        else:
+            self._emit(ch, out)
+
+    def _emit(self, text: str, out: list):
+        if self._reading_key:
+            self._key.append(text)
+        elif self._streaming:
+            out.append(text)
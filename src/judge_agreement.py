@@ -0,0 +1,183 @@
+"""
+Offline agreement check between the fused judge chain and the two-call
+evaluator + scorer pipeline.
+
+Replays recent turns from Mongo (interactions recorded with their QA
+question and expected answer) through both pipelines and reports how often
+the ratings match, how far the scores drift and how many input tokens each
+side spent. Nothing is written back to the turn collections. Examples:
+
+    python src/judge_agreement.py --model openai/gpt-4o --limit 50
+    python src/judge_agreement.py --topic CP --stored    # compare with the stored evaluator/scorer docs
+"""
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+from db import get_db
+from models import EvaluatorResponse, ScorerResponse
+from judge_worker import build_judge_chains, judge_turn
+
+ROOT = Path(__file__).resolve().parents[1]
+SCORE_FIELDS = ["overall_score", "teacher_clarity", "teacher_completeness",
+                "student_understanding", "student_engagement"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the fused judge with the evaluator + scorer pipeline.")
+    parser.add_argument("--model", default="openai/gpt-4o")
+    parser.add_argument("--topic", default=None, help="Only replay turns of this topic")
+    parser.add_argument("--limit", type=int, default=50, help="Number of recent turns to replay")
+    parser.add_argument("--stored", action="store_true",
+                        help="Use the stored evaluator/scorer results as the baseline instead of re-running them")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Score difference counted as agreement")
+    parser.add_argument("--out", type=Path, default=None, help="Where to write the JSON report")
+    return parser.parse_args()
+
+
+def load_turns(topic: str = None, limit: int = 50, stored: bool = False) -> list:
+    """Rebuild judge inputs for the most recent replayable turns."""
+    query = {"student_question": {"$exists": True}, "expected_explanation": {"$exists": True}}
+    if topic:
+        query["topic"] = topic
+    db = get_db()
+    interactions = list(db["interaction"].find(query).sort("timestamp", -1).limit(limit))
+    ids = [i["_id"] for i in interactions]
+
+    teachers = {d["_id"]: d for d in db["teacher"].find({"_id": {"$in": ids}})}
+    students = {d["_id"]: d for d in db["student"].find({"_id": {"$in": ids}})}
+    evaluators = {d["_id"]: d for d in db["evaluator"].find({"_id": {"$in": ids}})} if stored else {}
+    scorers = {d["_id"]: d for d in db["scorer"].find({"_id": {"$in": ids}})} if stored else {}
+
+    turns = []
+    for i in interactions:
+        teacher, student = teachers.get(i["_id"]), students.get(i["_id"])
+        if teacher is None or student is None:
+            continue
+        if stored and (i["_id"] not in evaluators or i["_id"] not in scorers):
+            continue
+        student = {k: v for k, v in student.items() if k not in ("_id", "timestamp")}
+        turn = {
+            "id": i["_id"],
+            "inputs": {
+                "expected_explanation": i["expected_explanation"],
+                "teacher_explanation": teacher["message"],
+                "student_question": i["student_question"],
+                "student_followup_question": student.get("message"),
+                "student_response": json.dumps(student, ensure_ascii=False),
+            },
+        }
+        if stored:
+            turn["baseline"] = (
+                EvaluatorResponse(**{k: v for k, v in evaluators[i["_id"]].items() if k not in ("_id", "timestamp")}),
+                ScorerResponse(**{k: v for k, v in scorers[i["_id"]].items() if k not in ("_id", "timestamp")}),
+            )
+        turns.append(turn)
+    return turns
+
+
+async def _discard(collection: str, interaction_id: str, model):
+    pass
+
+
+async def replay(turns: list, split: dict, fused: dict, concurrency: int) -> list:
+    """Judge every turn with both pipelines. Returns one record per turn that succeeded."""
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def one(turn):
+        async with semaphore:
+            try:
+                if "baseline" in turn:
+                    baseline = turn["baseline"]
+                    split_s = None
+                else:
+                    start = time.perf_counter()
+                    baseline = await judge_turn(turn["id"], turn["inputs"], **split, save=_discard, rollup=False)
+                    split_s = time.perf_counter() - start
+                start = time.perf_counter()
+                candidate = await judge_turn(turn["id"], turn["inputs"], **fused, save=_discard, rollup=False)
+                fused_s = time.perf_counter() - start
+            except Exception as e:
+                print(f"[agreement] Turn {turn['id']} failed: {e!r}")
+                return
+            results.append({"id": turn["id"], "baseline": baseline, "fused": candidate,
+                            "split_s": split_s, "fused_s": fused_s})
+
+    await asyncio.gather(*(one(t) for t in turns))
+    return results
+
+
+def summarize(results: list, tolerance: float) -> dict:
+    n = len(results)
+    if not n:
+        return {"turns": 0}
+
+    rating_match = sum(
+        r["baseline"][0].rating.strip().lower() == r["fused"][0].rating.strip().lower() for r in results
+    )
+    scores = {}
+    for field in SCORE_FIELDS:
+        diffs = [abs(getattr(r["baseline"][1], field) - getattr(r["fused"][1], field)) for r in results]
+        scores[field] = {
+            "mean_abs_diff": round(statistics.mean(diffs), 4),
+            "max_abs_diff": round(max(diffs), 4),
+            "within_tolerance": round(sum(d <= tolerance for d in diffs) / n, 4),
+        }
+
+    summary = {
+        "turns": n,
+        "rating_agreement": round(rating_match / n, 4),
+        "scores": scores,
+        "fused_latency_s": round(statistics.mean(r["fused_s"] for r in results), 3),
+    }
+    split_times = [r["split_s"] for r in results if r["split_s"] is not None]
+    if split_times:
+        summary["split_latency_s"] = round(statistics.mean(split_times), 3)
+    return summary
+
+
+def token_usage(chains: dict) -> dict:
+    return {name: chain.stats() for name, chain in chains.items()}
+
+
+def main():
+    args = parse_args()
+    turns = load_turns(args.topic, args.limit, args.stored)
+    if not turns:
+        print("[agreement] No replayable turns found (interactions need student_question/expected_explanation)")
+        return
+    print(f"[agreement] Replaying {len(turns)} turns with {args.model}")
+
+    split = build_judge_chains(args.model, "split")
+    fused = build_judge_chains(args.model, "fused")
+    results = asyncio.run(replay(turns, split, fused, args.concurrency))
+
+    report = {
+        "model": args.model,
+        "topic": args.topic,
+        "baseline": "stored" if args.stored else "split",
+        "tolerance": args.tolerance,
+        "summary": summarize(results, args.tolerance),
+        "tokens": {"fused": token_usage(fused), **({} if args.stored else {"split": token_usage(split)})},
+        "disagreements": [
+            {"id": r["id"], "split": r["baseline"][0].rating, "fused": r["fused"][0].rating}
+            for r in results
+            if r["baseline"][0].rating.strip().lower() != r["fused"][0].rating.strip().lower()
+        ],
+    }
+    print(f"[agreement] {json.dumps(report['summary'], indent=4)}")
+
+    out = args.out or ROOT / "bench_results" / f"judge_agreement_{int(time.time())}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"[agreement] Report written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from langchain.prompts import ChatPromptTemplate
+from langchain.chains import LLMChain
+from langchain.output_parsers import PydanticOutputParser
+from token_budget import BudgetedChain
+from response_cache import with_cache
+from models import JudgeResponse
+
+judge_prompt = """
+You are an expert evaluator and automated scorer for a teaching-learning interaction.
+In a single response, give both a qualitative assessment and a quantitative score.
+
+Inputs:
+- Pre-determined Ground Truth:
+{expected_explanation}
+- Teacher’s explanation:
+{teacher_explanation}
+- Student's initial question:
+{student_question}
+- Student's follow-up question based on the teacher's reponse, will be null if the student received accurate response
+{student_followup_question}
+- Student’s response (rating, reflection, missing points):
+{student_response}
+
+Instructions for "evaluator":
+1. Assign a qualitative rating for the student’s response using ONLY one of:
+   "excellent" | "good" | "partial" | "needs work" | "incorrect"
+2. Identify key points the student missed. Include them in "missing_points".
+3. Identify any factual errors or misconceptions. Include them in "incorrect_points".
+4. Provide concise feedback to help the student improve in "feedback".
+5. Optionally, include references from the context or QA pool in "referenced_points".
+
+Instructions for "scorer" (consistent with your evaluation above):
+1. All scores must be **between 0.0 and 1.0** inclusive.
+2. Provide all scores; do not leave any field blank.
+3. Comments should summarize any important qualitative insights.
+
+Respond ONLY in valid JSON, matching the following schema:
+
+{{
+  "evaluator": {{
+    "rating": "excellent|good|partial|needs work|incorrect",
+    "missing_points": ["..."],
+    "incorrect_points": ["..."],
+    "feedback": "...",
+    "referenced_points": ["..."]
+  }},
+  "scorer": {{
+    "overall_score": "float between 0.0 and 1.0",
+    "teacher_clarity": "float between 0.0 and 1.0",
+    "teacher_completeness": "float between 0.0 and 1.0",
+    "student_understanding": "float between 0.0 and 1.0",
+    "student_engagement": "float between 0.0 and 1.0",
+    "comments": ["string"]
+  }}
+}}
+"""
+
+
+def build_judge_chain(llm):
+    """Build the single-call chain that returns evaluator and scorer output together."""
+    parser = PydanticOutputParser(pydantic_object=JudgeResponse)
+    prompt = ChatPromptTemplate.from_template(judge_prompt).partial(
+        format_instructions=parser.get_format_instructions()
+    )
+
+    chain = LLMChain(llm=llm, prompt=prompt, output_parser=parser)
+    return with_cache(BudgetedChain(chain, "judge"))
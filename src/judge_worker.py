@@ -0,0 +1,338 @@
+"""
+Evaluator + scorer ("judge") execution, inline or from a durable local queue.
+
+In background mode the teacher gets the student's reply as soon as the
+student chain returns; the judging inputs are written to a SQLite queue and
+processed by worker tasks in the app's event loop. Jobs survive restarts:
+anything pending or interrupted mid-run is picked up again on startup.
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from pathlib import Path
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+from db import get_async_db
+from persistence import buffer
+from score_rollups import record_scores
+from models import EvaluatorResponse, ScorerResponse, JudgeResponse
+from llm_registry import role_llm
+from blocking import run_blocking
+import metrics
+
+load_dotenv()
+# "inline": judge before replying (original behaviour); "background": reply first, judge from the queue
+JUDGE_MODE = os.getenv("JUDGE_MODE", "inline")
+# "split": evaluator then scorer (two LLM calls); "fused": one judge call returning both
+JUDGE_CHAIN = os.getenv("JUDGE_CHAIN", "split")
+JUDGE_QUEUE_PATH = Path(os.getenv("JUDGE_QUEUE_PATH", Path(__file__).resolve().parents[1] / "judge_queue.sqlite3"))
+JUDGE_WORKERS = int(os.getenv("JUDGE_WORKERS", "4"))
+JUDGE_MAX_ATTEMPTS = int(os.getenv("JUDGE_MAX_ATTEMPTS", "5"))
+JUDGE_POLL_INTERVAL = float(os.getenv("JUDGE_POLL_INTERVAL", "1.0"))
+# A job claimed longer ago than this is assumed lost (worker died) and handed out again
+JUDGE_LEASE_SECONDS = float(os.getenv("JUDGE_LEASE_SECONDS", "300"))
+
+
+# ------------------- JUDGING ------------------- #
+
+async def run_evaluator(evaluator_chain, inputs: dict) -> EvaluatorResponse:
+    response = await evaluator_chain.ainvoke({
+        "expected_explanation": inputs["expected_explanation"],
+        "teacher_explanation": inputs["teacher_explanation"],
+        "student_question": inputs["student_question"],
+        "student_followup_question": inputs["student_followup_question"],
+        "student_response": inputs["student_response"],
+    })
+    if isinstance(response['text'], EvaluatorResponse):
+        return response['text']
+    return EvaluatorResponse.parse_raw(response['text'])
+
+
+async def run_scorer(scorer_chain, inputs: dict, evaluator_model: EvaluatorResponse) -> ScorerResponse:
+    response = await scorer_chain.ainvoke({
+        "teacher_explanation": inputs["teacher_explanation"],
+        "student_question": inputs["student_question"],
+        "student_followup_question": inputs["student_followup_question"],
+        "student_response": inputs["student_response"],
+        "evaluator_comments": evaluator_model.json(),
+    })
+    if isinstance(response['text'], ScorerResponse):
+        return response['text']
+    return ScorerResponse.parse_raw(response['text'])
+
+
+async def run_fused_judge(judge_chain, inputs: dict):
+    response = await judge_chain.ainvoke({
+        "expected_explanation": inputs["expected_explanation"],
+        "teacher_explanation": inputs["teacher_explanation"],
+        "student_question": inputs["student_question"],
+        "student_followup_question": inputs["student_followup_question"],
+        "student_response": inputs["student_response"],
+    })
+    judged = response['text']
+    if not isinstance(judged, JudgeResponse):
+        judged = JudgeResponse.parse_raw(judged)
+    return judged.evaluator, judged.scorer
+
+
+def build_judge_chains(model: str, mode: str = None) -> dict:
+    """Chains needed by judge_turn for the configured JUDGE_CHAIN mode, routed per role."""
+    mode = mode or JUDGE_CHAIN
+    if mode == "fused":
+        from judge_chain import build_judge_chain
+        return {"judge_chain": build_judge_chain(role_llm("judge", model))}
+
+    from evaluator_chain import build_evaluator_chain
+    from scorer_chain import build_scorer_chain
+    return {
+        "evaluator_chain": build_evaluator_chain(role_llm("evaluator", model)),
+        "scorer_chain": build_scorer_chain(role_llm("scorer", model)),
+    }
+
+
+async def save_result(collection: str, interaction_id: str, model):
+    # replace_one/upsert keeps retries idempotent
+    with metrics.stage("db.save", collection=collection):
+        await get_async_db()[collection].replace_one(
+            {"_id": interaction_id},
+            {"_id": interaction_id, **model.dict(), "timestamp": datetime.utcnow()},
+            upsert=True,
+        )
+
+
+async def save_result_later(collection: str, interaction_id: str, model):
+    """Like save_result, but through the write-behind buffer."""
+    buffer.replace(collection, {"_id": interaction_id, **model.dict(), "timestamp": datetime.utcnow()})
+
+
+async def judge_turn(interaction_id: str, inputs: dict, evaluator_chain=None, scorer_chain=None,
+                     evaluator_model=None, save=save_result, judge_chain=None, rollup=True):
+    """
+    Evaluate and score one turn and store both results. Returns (evaluator, scorer).
+
+    With a `judge_chain` both come from a single fused call instead. If the
+    inputs carry user_id and topic, the scores are also added to the rollups
+    (idempotently, so a retried job does not count the turn twice).
+    """
+    if judge_chain is not None:
+        evaluator_model, scorer_model = await run_fused_judge(judge_chain, inputs)
+        await save("evaluator", interaction_id, evaluator_model)
+    else:
+        if evaluator_model is None:
+            evaluator_model = await run_evaluator(evaluator_chain, inputs)
+            await save("evaluator", interaction_id, evaluator_model)
+        scorer_model = await run_scorer(scorer_chain, inputs, evaluator_model)
+
+    await save("scorer", interaction_id, scorer_model)
+    if rollup and inputs.get("user_id"):
+        await record_scores(interaction_id, inputs["user_id"], inputs.get("topic"), scorer_model)
+    return evaluator_model, scorer_model
+
+
+# ------------------- QUEUE ------------------- #
+
+class JudgeQueue:
+    """
+    SQLite-backed job queue; every method is blocking and thread-safe.
+
+    Several processes may share the file: read-then-write steps run in a
+    BEGIN IMMEDIATE transaction, so a job is handed to one worker only.
+    """
+
+    def __init__(self, path: Path = JUDGE_QUEUE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, payload TEXT NOT NULL, progress TEXT,"
+            " status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_run REAL NOT NULL, claimed_at REAL, last_error TEXT,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, next_run)")
+        self._conn.commit()
+
+    @contextmanager
+    def _write_transaction(self):
+        """Hold the database write lock from the first read on, across processes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def enqueue(self, job_id: str, payload: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, payload, status, next_run, created_at, updated_at)"
+                " VALUES (?, ?, 'pending', ?, ?, ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False), now, now, now),
+            )
+            self._conn.commit()
+
+    def claim(self):
+        """Mark the next runnable job as running and return it, or None."""
+        now = time.time()
+        with self._write_transaction():
+            row = self._conn.execute(
+                "SELECT id, payload, progress, attempts FROM jobs"
+                " WHERE (status = 'pending' AND next_run <= ?)"
+                "    OR (status = 'running' AND claimed_at < ?)"
+                " ORDER BY next_run LIMIT 1",
+                (now, now - JUDGE_LEASE_SECONDS),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', claimed_at = ?, updated_at = ? WHERE id = ?",
+                    (now, now, row[0]),
+                )
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "payload": json.loads(row[1]),
+            "progress": json.loads(row[2]) if row[2] else {},
+            "attempts": row[3],
+        }
+
+    def save_progress(self, job_id: str, progress: dict):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(progress, ensure_ascii=False), time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def complete(self, job_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def fail(self, job_id: str, error: str):
+        """Schedule a retry with exponential backoff, or park the job as failed."""
+        now = time.time()
+        with self._write_transaction():
+            attempts = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] + 1
+            if attempts >= JUDGE_MAX_ATTEMPTS:
+                status, next_run = "failed", now
+            else:
+                status, next_run = "pending", now + min(300.0, 2 ** attempts) * random.uniform(0.5, 1.0)
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_run = ?, last_error = ?, updated_at = ?"
+                " WHERE id = ?",
+                (status, attempts, next_run, error[:2000], now, job_id),
+            )
+        return status
+
+    def recover(self) -> int:
+        """Requeue jobs left running by a previous process."""
+        with self._lock:
+            n = self._conn.execute(
+                "UPDATE jobs SET status = 'pending', next_run = ? WHERE status = 'running'", (time.time(),)
+            ).rowcount
+            self._conn.commit()
+        return n
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+# ------------------- WORKER ------------------- #
+
+_queue = None
+_wakeup = None
+_workers = []
+_chains = {}
+
+
+def get_queue() -> JudgeQueue:
+    global _queue
+    if _queue is None:
+        _queue = JudgeQueue()
+    return _queue
+
+
+def _chains_for(model: str) -> dict:
+    if model not in _chains:
+        _chains[model] = build_judge_chains(model)
+    return _chains[model]
+
+
+async def _process(queue: JudgeQueue, job: dict):
+    payload, progress = job["payload"], job["progress"]
+    chains = _chains_for(payload["model"])
+    if "judge_chain" in chains:
+        await judge_turn(job["id"], payload, judge_chain=chains["judge_chain"])
+        return
+
+    evaluator_chain, scorer_chain = chains["evaluator_chain"], chains["scorer_chain"]
+
+    evaluator_model = None
+    if "evaluator" in progress:
+        # The evaluator already ran on an earlier attempt; only the scorer is left
+        evaluator_model = EvaluatorResponse(**progress["evaluator"])
+    else:
+        evaluator_model = await run_evaluator(evaluator_chain, payload)
+        await save_result("evaluator", job["id"], evaluator_model)
+        await run_blocking(queue.save_progress, job["id"], {"evaluator": evaluator_model.dict()})
+
+    await judge_turn(job["id"], payload, evaluator_chain, scorer_chain, evaluator_model=evaluator_model)
+
+
+async def _worker_loop(queue: JudgeQueue):
+    while True:
+        job = await run_blocking(queue.claim)
+        if job is None:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=JUDGE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            with metrics.trace(job["id"]), metrics.stage("judge.job"):
+                await _process(queue, job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status = await run_blocking(queue.fail, job["id"], repr(e))
+            print(f"[judge] Job {job['id']} failed (attempt {job['attempts'] + 1}): {e!r} -> {status}")
+        else:
+            await run_blocking(queue.complete, job["id"])
+
+
+def ensure_workers():
+    """Start the worker tasks in the running event loop (once per process)."""
+    global _wakeup
+    if _workers and not all(t.done() for t in _workers):
+        return
+    queue = get_queue()
+    recovered = queue.recover()
+    if recovered:
+        print(f"[judge] Requeued {recovered} interrupted jobs")
+    _wakeup = asyncio.Event()
+    _workers[:] = [asyncio.create_task(_worker_loop(queue)) for _ in range(JUDGE_WORKERS)]
+    print(f"[judge] Started {JUDGE_WORKERS} background judge workers, queue: {queue.counts()}")
+
+
+async def enqueue_judging(interaction_id: str, model: str, inputs: dict):
+    """Persist a judging job for this turn and make sure a worker will pick it up."""
+    await run_blocking(get_queue().enqueue, interaction_id, {"model": model, **inputs})
+    ensure_workers()
+    _wakeup.set()
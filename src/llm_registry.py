@@ -0,0 +1,238 @@
+"""
+Process-wide chat model clients.
+
+Every model gets one ChatOpenAI instance, and all of them share one pooled
+httpx client (plus one async client per event loop), so keep-alive
+connections to OpenRouter are reused across sessions, roles and models.
+
+Roles can be routed to their own model with ROLE_MODELS, e.g.
+
+    ROLE_MODELS="scorer=openai/gpt-4o-mini,evaluator=openai/gpt-4o-mini"
+
+Roles not listed use the model picked in the UI. With LLM_FALLBACK_MODEL
+set (off by default), a call that takes longer than its role's deadline
+(LLM_DEADLINE_SECONDS, per role with ROLE_DEADLINES="student=10,judge=45"),
+or fails, is answered by that model instead; for a streamed call the
+deadline is the time to the first token.
+"""
+import os
+import atexit
+import asyncio
+import weakref
+import functools
+import threading
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+API_KEY = os.getenv("OPENROUTER_API_KEY")
+BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+
+
+def parse_role_models(spec: str) -> dict:
+    """'scorer=a,evaluator=b' -> {'scorer': 'a', 'evaluator': 'b'}"""
+    routes = {}
+    for part in spec.split(","):
+        if "=" in part:
+            role, model = part.split("=", 1)
+            routes[role.strip()] = model.strip()
+    return routes
+
+
+ROLE_MODELS = parse_role_models(os.getenv("ROLE_MODELS", ""))
+ROLE_DEADLINES = {role: float(seconds) for role, seconds in parse_role_models(os.getenv("ROLE_DEADLINES", "")).items()}
+
+_lock = threading.Lock()
+_clients = {}
+_http = None
+_http_async = None
+
+
+def _http_clients():
+    global _http, _http_async
+    with _lock:
+        if _http is None:
+            import httpx
+
+            class PerLoopAsyncClient(httpx.AsyncClient):
+                """
+                An httpx.AsyncClient that sends through a pooled client of the
+                running event loop, so one ChatOpenAI can be built in one thread
+                (e.g. the prewarm thread) and awaited in any other loop.
+
+                It never sends anything itself, so it gets no pool of its own.
+                """
+
+                def __init__(self, **kwargs):
+                    super().__init__(timeout=kwargs.get("timeout"), transport=httpx.AsyncBaseTransport(),
+                                     trust_env=False)
+                    self._kwargs = kwargs
+                    self._loop_clients = weakref.WeakKeyDictionary()
+                    self._loop_lock = threading.Lock()
+
+                async def send(self, request, **kwargs):
+                    loop = asyncio.get_running_loop()
+                    with self._loop_lock:
+                        client = self._loop_clients.get(loop)
+                        if client is None:
+                            client = self._loop_clients[loop] = httpx.AsyncClient(**self._kwargs)
+                    return await client.send(request, **kwargs)
+
+                def close_loop_clients(self):
+                    """Close the pooled client of every event loop that can still run one."""
+                    with self._loop_lock:
+                        clients = list(self._loop_clients.items())
+                        self._loop_clients.clear()
+                    for loop, client in clients:
+                        try:
+                            if loop.is_running():
+                                asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+                            elif not loop.is_closed():
+                                loop.run_until_complete(client.aclose())
+                        except Exception as e:  # best effort at shutdown
+                            print(f"[llm] could not close an HTTP client: {type(e).__name__}: {e}")
+
+            limits = httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+            )
+            _http = httpx.Client(limits=limits, timeout=LLM_TIMEOUT_SECONDS)
+            _http_async = PerLoopAsyncClient(limits=limits, timeout=LLM_TIMEOUT_SECONDS)
+        return _http, _http_async
+
+
+@atexit.register
+def close_http_clients():
+    """Close the shared HTTP clients; the next client built opens new ones."""
+    global _http, _http_async
+    with _lock:
+        http, http_async, _http, _http_async = _http, _http_async, None, None
+        _clients.clear()
+    if http is not None:
+        http.close()
+        http_async.close_loop_clients()
+
+
+def _chat_model(model: str):
+    # Deferred: langchain_openai pulls in the whole OpenAI SDK
+    from langchain_openai import ChatOpenAI
+
+    http, http_async = _http_clients()
+    return ChatOpenAI(
+        base_url=BASE_URL,
+        api_key=API_KEY,
+        model=model,
+        timeout=LLM_TIMEOUT_SECONDS,
+        http_client=http,
+        http_async_client=http_async,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _deadline_fallbacks():
+    # Built on first use: langchain_core is not imported until a client is
+    from langchain_core.runnables import RunnableWithFallbacks
+
+    class DeadlineFallbacks(RunnableWithFallbacks):
+        """
+        RunnableWithFallbacks whose async calls also fall back on a deadline:
+        ainvoke/abatch when the whole answer is late, astream when the first
+        chunk is. Sync calls (offline scripts) only fall back on errors.
+        """
+
+        deadline: float
+
+        def _fell_back(self, reason: str):
+            primary, fallback = model_name(self.runnable), model_name(self.fallbacks[0])
+            metrics.llm_fallbacks.inc(model=primary, fallback=fallback, reason=reason)
+            print(f"[llm] {primary}: {reason}, answering with {fallback}")
+
+        async def ainvoke(self, input, config=None, **kwargs):
+            try:
+                return await asyncio.wait_for(self.runnable.ainvoke(input, config, **kwargs), self.deadline)
+            except asyncio.TimeoutError:
+                self._fell_back(f"no answer in {self.deadline:g}s")
+            except self.exceptions_to_handle as e:
+                self._fell_back(type(e).__name__)
+            return await self.fallbacks[0].ainvoke(input, config, **kwargs)
+
+        async def abatch(self, inputs, config=None, *, return_exceptions: bool = False, **kwargs):
+            configs = config if isinstance(config, list) else [config] * len(inputs)
+            return list(await asyncio.gather(
+                *(self.ainvoke(item, c, **kwargs) for item, c in zip(inputs, configs)),
+                return_exceptions=return_exceptions,
+            ))
+
+        async def astream(self, input, config=None, **kwargs):
+            stream = self.runnable.astream(input, config, **kwargs)
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), self.deadline)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                self._fell_back(f"no first token in {self.deadline:g}s")
+                first = None
+            except self.exceptions_to_handle as e:
+                self._fell_back(type(e).__name__)
+                first = None
+
+            if first is None:
+                await stream.aclose()
+                async for chunk in self.fallbacks[0].astream(input, config, **kwargs):
+                    yield chunk
+                return
+            # Past the first token the answer has started on screen, so the primary finishes it
+            yield first
+            async for chunk in stream:
+                yield chunk
+
+    return DeadlineFallbacks
+
+
+def _with_deadline(primary, fallback, deadline: float):
+    """`primary`, answered by `fallback` when it is slower than `deadline` seconds or fails."""
+    return _deadline_fallbacks()(runnable=primary, fallbacks=[fallback], deadline=deadline)
+
+
+def get_client(model: str, deadline: float = None):
+    """
+    The shared client for `model`. With LLM_FALLBACK_MODEL set (and not
+    `model` itself), it is wrapped to fall back to that model after `deadline`
+    seconds (LLM_DEADLINE_SECONDS by default) or on an error.
+    """
+    deadline = deadline or LLM_DEADLINE_SECONDS
+    key = (model, deadline)
+    with _lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+
+    if LLM_FALLBACK_MODEL and LLM_FALLBACK_MODEL != model:
+        client = _with_deadline(_chat_model(model), _chat_model(LLM_FALLBACK_MODEL), deadline)
+    else:
+        client = _chat_model(model)
+    with _lock:
+        return _clients.setdefault(key, client)
+
+
+def model_for(role: str, selected: str) -> str:
+    return ROLE_MODELS.get(role, selected)
+
+
+def role_llm(role: str, selected: str):
+    """Client for `role` when the user has `selected` a model."""
+    return get_client(model_for(role, selected), ROLE_DEADLINES.get(role))
+
+
+def model_name(llm) -> str:
+    """Model name of a client returned by get_client (or any chat model)."""
+    llm = getattr(llm, "runnable", llm)  # unwrap RunnableWithFallbacks
+    return getattr(llm, "model_name", None) or getattr(llm, "model", "")
@@ -0,0 +1,378 @@
+"""
+Load test for the Chainlit handlers in main.py.
+
+Drives `start`, `main` and `end` for many simulated teaching sessions at
+once, in one process and event loop, the way one app worker would serve
+them. The LLM is fakes.FakeChatModel (deterministic, configurable latency
+and token rate), embeddings come from fakes.HashEmbeddings and Mongo is the
+in-memory fakes.MemoryDatabase, so no API key, network or database is
+needed. Examples:
+
+    python src/load_test.py --sessions 50 --concurrency 50 --turns 5
+    python src/load_test.py --sessions 200 --concurrency 100 --llm-latency 1.5 --judge-mode background
+    python src/load_test.py --sessions 100 --tokens-per-s 40 --no-stream --mongo-latency 0.005
+
+Reports sessions/turns per second, p50/p95/p99 turn and start latency,
+event-loop lag and the mean time of every metrics stage, and writes them to
+bench_results/.
+"""
+import os
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextvars
+import statistics
+from pathlib import Path
+
+from bench_utils import ROOT, WORDS, make_synthetic_corpus, git_commit, peak_rss_mb
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulate concurrent teaching sessions against main.py.")
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions to run in total")
+    parser.add_argument("--turns", type=int, default=5, help="Teacher messages per session")
+    parser.add_argument("--topics", type=int, default=3, help="Topics the sessions are spread over")
+    parser.add_argument("--concurrency", type=int, default=20, help="Sessions open at the same time")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which sessions are started")
+    parser.add_argument("--think-time", type=float, default=1.0,
+                        help="Mean seconds a teacher takes between messages")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="Fake LLM seconds to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=60.0,
+                        help="Fake LLM output rate (0: whole answer at once)")
+    parser.add_argument("--mongo-latency", type=float, default=0.002, help="Seconds per async Mongo call")
+    parser.add_argument("--judge-mode", choices=["inline", "background"], default="inline")
+    parser.add_argument("--judge-chain", choices=["split", "fused"], default="split")
+    parser.add_argument("--no-stream", action="store_true", help="Send the student reply once parsed")
+    parser.add_argument("--vs-layout", choices=["per_topic", "shared"], default="per_topic")
+    parser.add_argument("--vs-backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--qa-pool", type=int, default=50, help="Q&A pool entries per topic")
+    parser.add_argument("--files-per-topic", type=int, default=5)
+    parser.add_argument("--file-kb", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=256, help="Fake embedding dimension")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0,
+                        help="Seconds to wait for background judging to finish")
+    parser.add_argument("--out", type=Path, default=None, help="Where to write the JSON results")
+    return parser.parse_args()
+
+
+# ------------------- STAND-INS ------------------- #
+
+def install_db(database):
+    """Point db.get_db()/get_async_db() at `database` (a fakes.MemoryDatabase) before first use."""
+    import db
+
+    db._db, db._async_db = database, database.async_view()
+
+
+def install_chainlit(model: str):
+    """
+    Register a minimal `chainlit` package: per-session user_session, messages
+    that only count themselves, and an action prompt that answers with the
+    session's preassigned topic.
+    """
+    session = contextvars.ContextVar("load_test_session")
+
+    class UserSession:
+        def get(self, key, default=None):
+            return session.get().get(key, default)
+
+        def set(self, key, value):
+            session.get()[key] = value
+
+    class User:
+        def __init__(self, identifier: str, display_name: str = None, metadata: dict = None):
+            self.identifier = identifier
+            self.display_name = display_name
+            self.metadata = metadata or {}
+
+    class Message:
+        def __init__(self, content: str = "", **kwargs):
+            self.content = content
+
+        async def send(self):
+            stats = session.get()["_stats"]
+            stats["messages"] += 1
+            return self
+
+        async def stream_token(self, token: str):
+            if not self.content:
+                session.get()["_stats"]["streamed"] += 1
+            self.content += token
+
+        async def remove(self):
+            pass
+
+    class AskActionMessage(Message):
+        def __init__(self, content: str = "", actions=None, **kwargs):
+            super().__init__(content)
+
+        async def send(self):
+            await super().send()
+            return {"payload": {"value": session.get()["_topic"]}}
+
+    class ChatSettings:
+        def __init__(self, inputs):
+            self.inputs = inputs
+
+        async def send(self):
+            return {"Model": model}
+
+    class Action:
+        def __init__(self, name: str, payload: dict = None, label: str = ""):
+            self.name, self.payload, self.label = name, payload, label
+
+    def decorator(fn):
+        return fn
+
+    cl = types.ModuleType("chainlit")
+    cl.user_session = UserSession()
+    cl.User, cl.Message, cl.AskActionMessage = User, Message, AskActionMessage
+    cl.ChatSettings, cl.Action = ChatSettings, Action
+    for name in ("oauth_callback", "on_settings_update", "on_chat_start", "on_chat_end", "on_message"):
+        setattr(cl, name, decorator)
+
+    server = types.ModuleType("chainlit.server")
+    server.app = types.SimpleNamespace(router=types.SimpleNamespace(routes=[]))
+    widgets = types.ModuleType("chainlit.input_widget")
+    widgets.Select = lambda **kwargs: kwargs
+    cl.server, cl.input_widget = server, widgets
+    sys.modules.update({"chainlit": cl, "chainlit.server": server, "chainlit.input_widget": widgets})
+    return session, User, Message
+
+
+# ------------------- SETUP ------------------- #
+
+def prepare_topics(args, workdir: Path) -> list:
+    """Synthetic corpus, Chroma stores, catalog and Q&A pools for every topic."""
+    import ingest
+    import qa_pool
+    import vectorstore_registry
+    from fakes import HashEmbeddings, FakeChatModel
+
+    embeddings = HashEmbeddings(dim=args.dim)
+    ingest._embeddings = embeddings
+    vectorstore_registry._embeddings = embeddings
+
+    topics = [f"topic{i}" for i in range(args.topics)]
+    for i, topic in enumerate(topics):
+        make_synthetic_corpus(ingest.DATA_DIR / topic, args.files_per_topic, args.file_kb, args.seed + i)
+        ingest.ingest_topic(ingest.DATA_DIR / topic)
+    ingest.update_catalog(topics)
+
+    if args.qa_pool:
+        generator = FakeChatModel()
+        for topic in topics:
+            vs = ingest.open_vectorstore(topic)
+            qa_pool.build_pool(topic, generator, vs, args.qa_pool)
+    return topics
+
+
+def teacher_message(rng: random.Random) -> str:
+    sentences = [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+        for _ in range(rng.randint(3, 10))
+    ]
+    return " ".join(sentences)
+
+
+# ------------------- RUN ------------------- #
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 4)
+
+    return {"n": len(ordered), "mean": round(statistics.mean(ordered), 4),
+            "p50": pct(50), "p95": pct(95), "p99": pct(99), "max": round(ordered[-1], 4)}
+
+
+async def monitor_loop_lag(samples: list, interval: float = 0.05):
+    """How late the event loop wakes a task that asked to sleep `interval` seconds."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run_session(i: int, args, topics: list, chainlit, app, results: dict, semaphore):
+    session, User, Message = chainlit
+    rng = random.Random(args.seed * 1_000_003 + i)
+    await asyncio.sleep(args.ramp * i / max(1, args.sessions))
+
+    async with semaphore:
+        stats = {"messages": 0, "streamed": 0}
+        session.set({
+            "user": User(f"load-{i:05d}@example.com", display_name=f"Load {i}"),
+            "_topic": topics[i % len(topics)],
+            "_stats": stats,
+        })
+        try:
+            t = time.perf_counter()
+            await app.start()
+            results["start_s"].append(time.perf_counter() - t)
+
+            for _ in range(args.turns):
+                t = time.perf_counter()
+                await app.main(Message(content=teacher_message(rng)))
+                results["turn_s"].append(time.perf_counter() - t)
+                if args.think_time:
+                    await asyncio.sleep(rng.expovariate(1 / args.think_time))
+
+            await app.end()
+            results["sessions"] += 1
+        except Exception as e:
+            results["errors"].append(f"session {i}: {e!r}")
+            print(f"[load] Session {i} failed: {e!r}")
+        results["messages"] += stats["messages"]
+        results["streamed"] += stats["streamed"]
+
+
+async def drain_judging(timeout: float) -> dict:
+    from judge_worker import get_queue
+    from blocking import run_blocking
+
+    deadline = time.perf_counter() + timeout
+    counts = await run_blocking(get_queue().counts)
+    while (counts.get("pending") or counts.get("running")) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.25)
+        counts = await run_blocking(get_queue().counts)
+    return counts
+
+
+async def run(args, topics: list, chainlit) -> dict:
+    import main as app
+    from persistence import buffer
+
+    results = {"sessions": 0, "messages": 0, "streamed": 0, "start_s": [], "turn_s": [], "errors": []}
+    lag = []
+    monitor = asyncio.create_task(monitor_loop_lag(lag))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_session(i, args, topics, chainlit, app, results, semaphore) for i in range(args.sessions)
+    ))
+    results["elapsed_s"] = time.perf_counter() - start
+
+    if args.judge_mode == "background":
+        t = time.perf_counter()
+        results["judge_queue"] = await drain_judging(args.drain_timeout)
+        results["drain_s"] = time.perf_counter() - t
+    await buffer.flush()
+
+    monitor.cancel()
+    results["loop_lag_s"] = lag
+    return results
+
+
+def stage_means() -> dict:
+    """Mean seconds per metrics stage (and model, where labelled)."""
+    import metrics
+
+    out = {}
+    for key, series in sorted(metrics.stage_seconds.snapshot().items()):
+        labels = dict(key)
+        name = labels.pop("stage")
+        label = name + "".join(f"[{v}]" for _, v in sorted(labels.items()))
+        out[label] = {"n": series["count"], "mean_s": round(series["sum"] / series["count"], 4)}
+    return out
+
+
+def main():
+    args = parse_args()
+    workdir = Path(tempfile.mkdtemp(prefix="load_test_"))
+
+    # Modules read their paths and modes at import time, so set them first
+    os.environ.update({
+        "VS_DIR": str(workdir / "vectorstore"),
+        "DATA_DIR": str(workdir / "data"),
+        "MEMORY_DIR": str(workdir / "memory"),
+        "JUDGE_QUEUE_PATH": str(workdir / "judge_queue.sqlite3"),
+        "JUDGE_MODE": args.judge_mode,
+        "JUDGE_CHAIN": args.judge_chain,
+        "STUDENT_STREAM": "0" if args.no_stream else "1",
+        "VS_LAYOUT": args.vs_layout,
+        "VS_BACKEND": args.vs_backend,
+        "EMBED_CACHE": "0",
+        "MONGO_AUTO_INDEX": "0",
+        "RESPONSE_CACHE": "0",
+        "LLM_FALLBACK_MODEL": "",
+        "ROLE_MODELS": "",
+        "METRICS_ENABLED": "1",
+    })
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from fakes import FakeChatModel, MemoryDatabase
+
+    database = MemoryDatabase(latency=args.mongo_latency)
+    install_db(database)
+    chainlit = install_chainlit("fake/chat")
+
+    import llm_registry
+    llm_registry._chat_model = lambda model: FakeChatModel(
+        latency=args.llm_latency, tokens_per_second=args.tokens_per_s, model_name=model
+    )
+
+    try:
+        t = time.perf_counter()
+        topics = prepare_topics(args, workdir)
+        setup_s = time.perf_counter() - t
+        print(f"[load] Prepared {len(topics)} topics in {setup_s:.1f}s; "
+              f"running {args.sessions} sessions x {args.turns} turns, concurrency {args.concurrency}")
+        results = asyncio.run(run(args, topics, chainlit))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    elapsed = results["elapsed_s"]
+    turns = len(results["turn_s"])
+    result = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "summary": {
+            "sessions_ok": results["sessions"],
+            "errors": len(results["errors"]),
+            "elapsed_s": round(elapsed, 3),
+            "sessions_per_s": round(results["sessions"] / elapsed, 3) if elapsed else None,
+            "turns_per_s": round(turns / elapsed, 3) if elapsed else None,
+            "peak_rss_mb": peak_rss_mb(),
+        },
+        "turn_s": percentiles(results["turn_s"]),
+        "start_s": percentiles(results["start_s"]),
+        "loop_lag_s": percentiles(results["loop_lag_s"]),
+        "stages": stage_means(),
+        "messages": {"sent": results["messages"], "streamed": results["streamed"]},
+        "mongo_docs": {name: len(database[name].docs) for name in database.collection_names()},
+        "errors": results["errors"][:20],
+    }
+    if "judge_queue" in results:
+        result["judge_queue"] = results["judge_queue"]
+        result["summary"]["drain_s"] = round(results["drain_s"], 3)
+
+    print(f"[load] {json.dumps(result['summary'])}")
+    print(f"[load] turn latency {json.dumps(result['turn_s'])}")
+    print(f"[load] loop lag     {json.dumps(result['loop_lag_s'])}")
+
+    out = args.out or ROOT / "bench_results" / (
+        f"load_{result['commit'][:8]}_{args.judge_mode}_s{args.sessions}_c{args.concurrency}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4)
+    print(f"[load] Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,52 @@
 import os
-from db import (
-    users_collection,
-    interaction_collection,
-    teacher_collection,
-    student_collection,
-    evaluator_collection,
-    scorer_collection,
-)
-from datetime import datetime
 import uuid
+import importlib
+import threading
 import chainlit as cl
+from chainlit.server import app
 from chainlit.input_widget import Select
 from dotenv import load_dotenv
-from student_chain import build_student_chain
-from evaluator_chain import build_evaluator_chain
-from scorer_chain import build_scorer_chain
 from qa_generator import generate_initial_qa, load_catalog
-from models import StudentResponse, TeacherResponse, EvaluatorResponse, ScorerResponse, get_llm
+from qa_pool import sample_qa, needs_refill, refill_in_background
+from blocking import run_blocking
+from student_memory import StudentMemory
+from judge_worker import (
+    JUDGE_MODE, judge_turn, build_judge_chains, enqueue_judging, ensure_workers, save_result_later
+)
+from persistence import buffer, ensure_user
+from schema import bootstrap_in_background
+from json_stream import JsonFieldStreamer
+import metrics
+from models import StudentResponse, TeacherResponse, get_llm
+from llm_registry import role_llm
 from typing import Optional
 from pathlib import Path
-import json
 
 load_dotenv()
 VS_DIR = VS_DIR = Path(os.getenv("VS_DIR", Path(__file__).resolve().parents[1] / "vectorstore"))
 CATALOG_PATH = VS_DIR / "catalog.json"
+# Stream the student's follow-up question token by token (0: send it once parsed)
+STUDENT_STREAM = os.getenv("STUDENT_STREAM", "1") == "1"
+# Import the LangChain/Chroma modules on a background thread at startup (0: on the first chat start)
+STARTUP_PREWARM = os.getenv("STARTUP_PREWARM", "1") == "1"
+PREWARM_MODULES = ("student_chain", "evaluator_chain", "scorer_chain", "judge_chain",
+                   "langchain_openai", "langchain_community.vectorstores")
+
+# Prometheus text on /metrics of the Chainlit server
+metrics.mount(app)
+
+
+def _prewarm():
+    for name in PREWARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"[startup] Prewarm import of {name} failed: {e!r}")
+
+
+if STARTUP_PREWARM:
+    # The worker accepts connections right away; the heavy imports finish meanwhile
+    threading.Thread(target=_prewarm, name="startup-prewarm", daemon=True).start()
 # ------------------- AUTH ------------------- #
 
 
@@ -49,16 +72,14 @@ def oauth_callback(
 async def setup_agent(settings):
     current_model = settings["Model"]
     print("Updated Model to: ", current_model)
-    llm = get_llm(current_model)
-    cl.user_session.set("llm", llm)
-    user_topic = cl.user_session.get("topic")
-    catalog = cl.user_session.get("catalog")
-    student_chain, vs = build_student_chain(llm, user_topic, catalog)
-    evaluator_chain = build_evaluator_chain(llm)
-    scorer_chain = build_scorer_chain(llm)
-    cl.user_session.set("student_chain", student_chain)
-    cl.user_session.set("evaluator_chain", evaluator_chain)
-    cl.user_session.set("scorer_chain", scorer_chain)
+    cl.user_session.set("llm", get_llm(current_model))
+    cl.user_session.set("model", current_model)
+    # Only the model clients change; prompts, parsers and the vectorstore are kept
+    student_chain = cl.user_session.get("student_chain")
+    if student_chain is not None:
+        student_chain.rebind(role_llm("student", current_model))
+    for chain in (cl.user_session.get("judge_chains") or {}).values():
+        chain.rebind(role_llm(chain.role, current_model))
 
 
 # ------------------- CHAT START ------------------- #
@@ -67,6 +88,9 @@ async def setup_agent(settings):
 @cl.on_chat_start
 async def start():
     """Initialize session, show topics, and prepare Q&A after topic selection."""
+    # Ensure Mongo indexes exist (once per process, off the event loop)
+    bootstrap_in_background()
+
     user = cl.user_session.get("user")
     await cl.Message(content=f"Welcome, {user.display_name or user.identifier}!").send()
 
@@ -82,14 +106,18 @@ async def start():
         ]
     ).send()
     cl.user_session.set("llm", get_llm(settings["Model"]))
+    cl.user_session.set("model", settings["Model"])
+    if JUDGE_MODE == "background":
+        # Picks up judging jobs left over from a previous run
+        ensure_workers()
 
     # Load catalog
     if not CATALOG_PATH.exists():
         await cl.Message(content="⚠️ No catalog found. Please run ingestion first.").send()
         return
 
-    with open(CATALOG_PATH, "r", encoding="utf-8") as f:
-        catalog = json.load(f)
+    with metrics.stage("start.load_catalog"):
+        catalog = await run_blocking(load_catalog)
 
     if not catalog:
         await cl.Message(content="⚠️ Catalog is empty. Add some topics first.").send()
@@ -119,22 +147,33 @@ async def start():
         return
 
     llm = cl.user_session.get("llm")
+    model = cl.user_session.get("model")
+
+    # Step 3: Build chains + vectorstore for chosen topic (each role may be routed to its own model)
+    from student_chain import build_student_chain  # deferred, see PREWARM_MODULES
 
-    # Step 3: Build chains + vectorstore for chosen topic
-    student_chain, vs = build_student_chain(llm, user_topic, catalog)
-    evaluator_chain = build_evaluator_chain(llm)
-    scorer_chain = build_scorer_chain(llm)
+    with metrics.stage("start.build_chains"):
+        student_chain, vs = await run_blocking(build_student_chain, role_llm("student", model), user_topic, catalog)
+        # Evaluator + scorer, or a single fused judge chain (JUDGE_CHAIN)
+        judge_chains = build_judge_chains(model)
 
-    # Step 4: Generate initial Q&A immediately
-    qa_pool = generate_initial_qa(llm, vs, n=5)
+    # Step 4: Draw Q&A from the precomputed pool; generate on the spot only if there is none
+    with metrics.stage("start.qa_sample"):
+        qa_pool = await run_blocking(sample_qa, user_topic, n=5)
+        if await run_blocking(needs_refill, user_topic):
+            refill_in_background(user_topic, llm, vs)
+    if not qa_pool:
+        with metrics.stage("start.qa_generate"):
+            qa_pool = await run_blocking(generate_initial_qa, llm, vs, n=5)
 
     # Step 5: Store in session
     cl.user_session.set("student_chain", student_chain)
-    cl.user_session.set("evaluator_chain", evaluator_chain)
-    cl.user_session.set("scorer_chain", scorer_chain)
+    cl.user_session.set("judge_chains", judge_chains)
     cl.user_session.set("qa_pool", qa_pool)
     cl.user_session.set("qa_index", 0)
     cl.user_session.set("topic", user_topic)
+    with metrics.stage("db.load_student_memory"):
+        cl.user_session.set("student_memory", await StudentMemory.load(user.identifier, user_topic))
 
     # Step 6: Kick off conversation
     if qa_pool:
@@ -149,10 +188,27 @@ async def start():
         ).send()
 
 
+# ------------------- CHAT END ------------------- #
+
+
+@cl.on_chat_end
+async def end():
+    """Write out whatever this (or any) session still has buffered."""
+    if buffer.pending():
+        await buffer.flush()
+
+
 # ------------------- MAIN LOOP ------------------- #
 @cl.on_message
 async def main(message: cl.Message):
     """Handle teacher input, student response, evaluation, and scoring."""
+    interaction_id = str(uuid.uuid4())
+    # Every stage of the turn is timed and traced under the interaction id
+    with metrics.trace(interaction_id), metrics.stage("turn", judge_mode=JUDGE_MODE):
+        await handle_turn(message, interaction_id)
+
+
+async def handle_turn(message: cl.Message, interaction_id: str):
     cl_user = cl.user_session.get("user")  # Chainlit User object
     if not cl_user:
         await cl.Message(content="❌ User not authenticated.").send()
@@ -160,125 +216,125 @@ async def main(message: cl.Message):
 
     model_choice = cl.user_session.get("model", "gemini-1.5-flash")
 
-    print(model_choice)
-
     # Extract normalized fields
     user_id = cl_user.identifier
     user_email = getattr(cl_user, "email", None)
     user_name = getattr(cl_user, "display_name", None)
 
-    # Ensure user exists in DB
-    users_collection.update_one(
-        {"_id": user_id},
-        {"$setOnInsert": {
-            "_id": user_id,
-            "email": user_email,
-            "name": user_name,
-            "created_at": datetime.utcnow()
-        }},
-        upsert=True
-    )
+    # Ensure user exists in DB (once per session)
+    if not cl.user_session.get("user_saved"):
+        with metrics.stage("db.ensure_user"):
+            await ensure_user(user_id, user_email, user_name)
+        cl.user_session.set("user_saved", True)
 
     # Load session state
     student_chain = cl.user_session.get("student_chain")
-    evaluator_chain = cl.user_session.get("evaluator_chain")
-    scorer_chain = cl.user_session.get("scorer_chain")
+    judge_chains = cl.user_session.get("judge_chains")
     qa_pool = cl.user_session.get("qa_pool", [])
     qa_index = cl.user_session.get("qa_index", 0)
-    # Fetch all previous interactions of this user
-    user_interactions = interaction_collection.find(
-        {"user_id": user_id},
-        {"_id": 1}  # we only need the interaction IDs
-    )
-    interaction_ids = [i["_id"] for i in user_interactions]
-
-    # Create new interaction entry
-    interaction_id = str(uuid.uuid4())
-    interaction_collection.insert_one({
-        "_id": interaction_id,
-        "user_id": user_id,
-        "timestamp": datetime.utcnow()
-    })
+    # Student memory is loaded once per session and extended after each response
+    student_memory = cl.user_session.get("student_memory")
+    if student_memory is None:
+        with metrics.stage("db.load_student_memory"):
+            student_memory = await StudentMemory.load(user_id, cl.user_session.get("topic"))
+        cl.user_session.set("student_memory", student_memory)
 
     # 1️⃣ Teacher provides explanation
     teacher_explanation = message.content
     teacher_model = TeacherResponse(message=teacher_explanation)
-    teacher_collection.insert_one({
-        "_id": interaction_id,
-        **teacher_model.dict(),
-        "timestamp": datetime.utcnow()
-    })
 
     # Expected answer from QA pool
     expected_answer = qa_pool[qa_index].a if qa_index < len(qa_pool) else ""
-    # Fetch all student responses for these interactions
-    student_memory_docs = student_collection.find(
-        {"_id": {"$in": interaction_ids}}
-    )
-
-    # Convert to a list of dicts or models
-    student_memory = [StudentResponse(**doc) for doc in student_memory_docs]
+    student_question = qa_pool[qa_index].q if qa_index < len(qa_pool) else ""
     # 2️⃣ Student generates response
-    student_llm_response = student_chain.invoke({
+    student_inputs = {
         "teacher_explanation": teacher_explanation,
-        "student_memory": student_memory
-    })
+        "student_memory": student_memory.prompt_view()
+    }
+    streamed_msg = None
+    if STUDENT_STREAM:
+        student_llm_response, streamed_msg = await stream_student_reply(student_chain, student_inputs)
+    else:
+        student_llm_response = await student_chain.ainvoke(student_inputs)
 
     if isinstance(student_llm_response['text'], StudentResponse):
         student_model = student_llm_response['text']
     else:
-        student_model = StudentResponse.parse_raw(student_llm_response['text'])
+        with metrics.stage("student.parse"):
+            student_model = StudentResponse.parse_raw(student_llm_response['text'])
 
-    student_collection.insert_one({
-        "_id": interaction_id,
-        **student_model.dict(),
-        "timestamp": datetime.utcnow()
-    })
+    # Interaction, teacher and student documents are written together by the write-behind buffer
+    buffer.record_turn(interaction_id, user_id, cl.user_session.get("topic"), teacher_model, student_model,
+                       student_question=student_question, expected_explanation=expected_answer)
+    with metrics.stage("db.student_memory_append"):
+        await student_memory.append(student_model, buffer=buffer)
 
-    # 3️⃣ Evaluator assesses
-    evaluator_llm_response = evaluator_chain.invoke({
+    judge_inputs = {
         "expected_explanation": expected_answer,
         "teacher_explanation": teacher_explanation,
-        "student_question": qa_pool[qa_index].q,
+        "student_question": student_question,
         "student_followup_question": student_model.message,
-        "student_response": student_model.json()
-    })
+        "student_response": student_model.json(),
+        # Used for the score rollups, not by the chains
+        "user_id": user_id,
+        "topic": cl.user_session.get("topic"),
+    }
+
+    if JUDGE_MODE == "background":
+        # Reply first; evaluator and scorer run from the durable queue
+        await send_student_reply(student_model, qa_pool, qa_index, streamed_msg)
+        with metrics.stage("judge.enqueue"):
+            await enqueue_judging(interaction_id, model_choice, judge_inputs)
+        return
 
-    if isinstance(evaluator_llm_response['text'], EvaluatorResponse):
-        evaluator_model = evaluator_llm_response['text']
-    else:
-        evaluator_model = EvaluatorResponse.parse_raw(
-            evaluator_llm_response['text'])
+    # 3️⃣ Evaluator assesses, 4️⃣ Scorer computes metrics
+    with metrics.stage("judge.inline"):
+        await judge_turn(interaction_id, judge_inputs, **judge_chains, save=save_result_later)
 
-    evaluator_collection.insert_one({
-        "_id": interaction_id,
-        **evaluator_model.dict(),
-        "timestamp": datetime.utcnow()
-    })
+    # 5️⃣ Continue conversation
+    await send_student_reply(student_model, qa_pool, qa_index, streamed_msg)
 
-    # 4️⃣ Scorer computes metrics
-    scorer_llm_response = scorer_chain.invoke({
-        "teacher_explanation": teacher_explanation,
-        "student_question": qa_pool[qa_index].q,
-        "student_followup_question": student_model.message,
-        "student_response": student_model.json(),
-        "evaluator_comments": evaluator_model.json()
-    })
 
-    if isinstance(scorer_llm_response['text'], ScorerResponse):
-        scorer_model = scorer_llm_response['text']
-    else:
-        scorer_model = ScorerResponse.parse_raw(scorer_llm_response)
+async def stream_student_reply(student_chain, inputs: dict):
+    """
+    Run the student chain, streaming only its "message" field to the UI.
 
-    scorer_collection.insert_one({
-        "_id": interaction_id,
-        **scorer_model.dict(),
-        "timestamp": datetime.utcnow()
-    })
+    Returns (chain output, streamed cl.Message or None if nothing was shown).
+    """
+    streamer = JsonFieldStreamer("message")
+    msg = cl.Message(content="")
 
-    # 5️⃣ Continue conversation
+    async def on_chunk(text):
+        token = streamer.feed(text)
+        if not token:
+            return
+        if not msg.content:
+            await msg.stream_token("👩‍🎓 Student: ")
+        await msg.stream_token(token)
+
+    try:
+        response = await student_chain.astream(inputs, on_chunk)
+    except Exception:
+        if msg.content:
+            await msg.remove()
+        raise
+    return response, (msg if msg.content else None)
+
+
+async def send_student_reply(student_model: StudentResponse, qa_pool, qa_index: int, streamed_msg=None):
+    with metrics.stage("ui.send_reply"):
+        await _send_student_reply(student_model, qa_pool, qa_index, streamed_msg)
+
+
+async def _send_student_reply(student_model: StudentResponse, qa_pool, qa_index: int, streamed_msg=None):
+    """Send the student's follow-up, or move on to the next question if it understood."""
     if student_model.message:
-        await cl.Message(content=f"👩‍🎓 Student: {student_model.message}").send()
+        if streamed_msg is not None:
+            # Finalize the streamed message with the parsed text
+            streamed_msg.content = f"👩‍🎓 Student: {student_model.message}"
+            await streamed_msg.send()
+        else:
+            await cl.Message(content=f"👩‍🎓 Student: {student_model.message}").send()
     else:
         await cl.Message(content="👩‍🎓 Student: I think I understood this topic.").send()
         qa_index += 1
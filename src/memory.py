@@ -1,59 +1,414 @@
+"""
+Per-agent interaction memory as an append-only JSON Lines segment log.
+
+Each agent gets MEMORY_DIR/<agent>/ with numbered segments (00000001.jsonl,
+...). Writes append one line to the newest segment; fsyncs are batched
+(every MEMORY_FSYNC_EVERY writes, and at most MEMORY_FSYNC_SECONDS after a
+write even if no other write follows). A segment that
+grows past MEMORY_SEGMENT_MB is sealed with a sidecar offset index and a new
+one is started; once MEMORY_COMPACT_SEGMENTS sealed segments pile up they are
+merged in the background, keeping the last entry per interaction_id.
+
+Several processes may share a log: appends, rotation, compaction and index
+rebuilds all hold an flock on MEMORY_DIR/<agent>/.lock. Without fcntl
+(Windows) only threads are coordinated, so run a single writer process there.
+"""
+import os
 import uuid
 import json
+import time
+import atexit
+import threading
 from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
 from pydantic import BaseModel
-import datetime
-from db import (
-    interaction_collection,
-    teacher_collection,
-    student_collection,
-    evaluator_collection,
-    scorer_collection,
-)
-
-MEMORY_DIR = Path("memory")
-MEMORY_DIR.mkdir(exist_ok=True)
-FILES = {
-    "teacher": MEMORY_DIR / "teacher.json",
-    "student": MEMORY_DIR / "student.json",
-    "evaluator": MEMORY_DIR / "evaluator.json",
-    "scorer": MEMORY_DIR / "scorer.json",
-}
-
-
-def load_memory(agent: str):
-    file = FILES[agent]
-    if not file.exists():
-        return []
-    return json.loads(file.read_text(encoding="utf-8"))
+from db import collection
 
+try:
+    import fcntl
+except ImportError:  # not available on Windows; only in-process locking applies there
+    fcntl = None
 
-def save_interaction(agent: str, model: BaseModel, interaction_id: str = None):
-    """Save validated agent response to its memory file."""
-    interaction_id = interaction_id or str(uuid.uuid4())
-    file = FILES[agent]
+load_dotenv()
+MEMORY_DIR = Path(os.getenv("MEMORY_DIR", "memory"))
+MEMORY_SEGMENT_MB = float(os.getenv("MEMORY_SEGMENT_MB", "16"))
+MEMORY_FSYNC_EVERY = int(os.getenv("MEMORY_FSYNC_EVERY", "32"))
+MEMORY_FSYNC_SECONDS = float(os.getenv("MEMORY_FSYNC_SECONDS", "1.0"))
+MEMORY_COMPACT_SEGMENTS = int(os.getenv("MEMORY_COMPACT_SEGMENTS", "4"))
+AGENTS = ("teacher", "student", "evaluator", "scorer")
+
+_READ_BLOCK = 64 * 1024
+
+
+def _segment_name(number: int) -> str:
+    return f"{number:08d}.jsonl"
+
+
+def _iter_lines_reversed(path: Path):
+    """Yield the non-empty lines of a file from last to first, reading one block at a time."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b""  # start of a line cut by the block boundary, completed by the next read
+        while end > 0:
+            start = max(0, end - _READ_BLOCK)
+            f.seek(start)
+            lines = (f.read(end - start) + tail).split(b"\n")
+            tail = lines.pop(0) if start > 0 else b""
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+            end = start
+
+
+class SegmentLog:
+    """
+    Append-only JSONL log for one agent.
+
+    Thread-safe. Every operation that changes which segment is written or
+    where entries live (append, rotation, compaction, index rebuild) also
+    holds an flock on the directory's lock file, so processes sharing the
+    directory always append to the newest segment and never compact under
+    each other.
+    """
+
+    def __init__(self, directory: Path, segment_bytes: int = int(MEMORY_SEGMENT_MB * 1024 * 1024)):
+        self.dir = Path(directory)
+        self.segment_bytes = segment_bytes
+        self._lock = threading.RLock()
+        self._index = {}          # interaction_id -> (segment number, offset)
+        self._scanned = {}        # segment number -> bytes already indexed
+        self._fd = None
+        self._active = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._sync_timer = None
+        self._compacting = False
+        self._lock_fd = None
+        self._lock_depth = 0
+
+    @contextmanager
+    def _exclusive(self):
+        """The thread lock plus an flock on the directory lock file; re-entrant within a thread."""
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                if self._lock_fd is None:
+                    self.dir.mkdir(parents=True, exist_ok=True)
+                    self._lock_fd = os.open(self.dir / ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # ---- segments ----
+
+    def segments(self) -> list:
+        if not self.dir.exists():
+            return []
+        return sorted(int(p.stem) for p in self.dir.glob("*.jsonl") if p.stem.isdigit())
+
+    def _path(self, number: int) -> Path:
+        return self.dir / _segment_name(number)
+
+    def _open_active(self):
+        """Point the write fd at the newest segment. Call under _exclusive()."""
+        if self._fd is not None and not self._path(self._active + 1).exists():
+            return  # nobody rotated since we opened it
+        if self._fd is not None:
+            self._sync()
+            os.close(self._fd)
+            self._fd = None
+        self.dir.mkdir(parents=True, exist_ok=True)
+        numbers = self.segments()
+        self._active = numbers[-1] if numbers else 1
+        self._fd = os.open(self._path(self._active), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _rotate(self):
+        """Seal the active segment and start the next one. Call under _exclusive()."""
+        self._sync()
+        os.close(self._fd)
+        self._fd = None
+        self._write_sidecar(self._active)
+        self._active += 1
+        self._fd = os.open(self._path(self._active), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if len(self.segments()) - 1 >= MEMORY_COMPACT_SEGMENTS:
+            self.compact_in_background()
+
+    # ---- index ----
+
+    def _write_sidecar(self, number: int):
+        self._scan(number)
+        offsets = {k: off for k, (seg, off) in self._index.items() if seg == number}
+        tmp = self._path(number).with_suffix(".idx.tmp")
+        tmp.write_text(json.dumps(offsets), encoding="utf-8")
+        os.replace(tmp, self._path(number).with_suffix(".idx"))
+
+    def _scan(self, number: int):
+        """Index entries of segment `number` not seen yet (sidecar first, then the file tail)."""
+        path = self._path(number)
+        if not path.exists():
+            return
+        start = self._scanned.get(number, 0)
+        sidecar = path.with_suffix(".idx")
+        if start == 0 and sidecar.exists() and number != self._active:
+            for key, offset in json.loads(sidecar.read_text(encoding="utf-8")).items():
+                self._index[key] = (number, offset)
+            self._scanned[number] = path.stat().st_size
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partial write by another process; pick it up next time
+                try:
+                    self._index[json.loads(line)["interaction_id"]] = (number, offset)
+                except (ValueError, KeyError):
+                    pass
+                offset += len(line)
+        self._scanned[number] = offset
+
+    def _refresh(self):
+        for number in self.segments():
+            self._scan(number)
+
+    # ---- writes ----
+
+    def append(self, entry: dict):
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._exclusive():
+            self._open_active()
+            size = os.fstat(self._fd).st_size
+            if size and size + len(line) > self.segment_bytes:
+                self._rotate()
+            offset = os.lseek(self._fd, 0, os.SEEK_END)
+            os.write(self._fd, line)
+            if self._scanned.get(self._active, 0) == offset:
+                self._index[entry["interaction_id"]] = (self._active, offset)
+                self._scanned[self._active] = offset + len(line)
+            self._unsynced += 1
+            if self._unsynced >= MEMORY_FSYNC_EVERY or time.monotonic() - self._last_sync >= MEMORY_FSYNC_SECONDS:
+                self._sync()
+            elif self._sync_timer is None:
+                # Sync a burst's tail even if the log goes idle after it
+                self._sync_timer = threading.Timer(MEMORY_FSYNC_SECONDS, self.sync)
+                self._sync_timer.daemon = True
+                self._sync_timer.start()
+
+    def _sync(self):
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    # ---- reads ----
+
+    def _read_at(self, number: int, offset: int):
+        with open(self._path(number), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
 
-    # load existing
-    if file.exists():
-        memory = json.loads(file.read_text(encoding="utf-8"))
-    else:
-        memory = []
+    def get(self, interaction_id: str):
+        """Entry for `interaction_id`, or None."""
+        with self._exclusive():
+            if interaction_id not in self._index:
+                self._refresh()
+            for _ in range(2):
+                location = self._index.get(interaction_id)
+                if location is None:
+                    return None
+                try:
+                    entry = self._read_at(*location)
+                    if entry.get("interaction_id") == interaction_id:
+                        return entry
+                except (OSError, ValueError):
+                    pass
+                # Offsets moved (compacted by another process); rebuild the index once
+                self._index, self._scanned = {}, {}
+                self._refresh()
+        return None
 
-    # append validated dict
-    memory.append({
+    def iter_recent(self):
+        """Yield the latest entry per interaction_id, newest first, reading segments backwards."""
+        seen = set()
+        for number in reversed(self.segments()):
+            try:
+                for line in _iter_lines_reversed(self._path(number)):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line
+                    key = entry.get("interaction_id")
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    yield entry
+            except FileNotFoundError:
+                continue  # compacted away while we were reading
+
+    # ---- compaction ----
+
+    def compact(self) -> int:
+        """
+        Merge sealed segments, keeping the newest entry per interaction_id. Returns entries dropped.
+
+        Runs entirely under _exclusive(): appends of every process wait for
+        it, and the index it filters on is rebuilt from disk first, since
+        another process may have compacted or appended since we last looked.
+        """
+        with self._exclusive():
+            self._open_active()
+            sealed = [n for n in self.segments() if n != self._active]
+            if len(sealed) < 2:
+                return 0
+            self._index, self._scanned = {}, {}
+            self._refresh()
+
+            target = self._path(sealed[0]).with_suffix(".compact.tmp")
+            kept, total, offsets = 0, 0, {}
+            with open(target, "wb") as out:
+                for number in sealed:
+                    with open(self._path(number), "rb") as f:
+                        offset_in = 0
+                        for line in f:
+                            total += 1
+                            line_offset, offset_in = offset_in, offset_in + len(line)
+                            try:
+                                key = json.loads(line)["interaction_id"]
+                            except (ValueError, KeyError):
+                                continue
+                            # Keep only the copy the index points at (the newest one)
+                            if self._index.get(key) == (number, line_offset):
+                                offsets[key] = out.tell()
+                                out.write(line)
+                                kept += 1
+                out.flush()
+                os.fsync(out.fileno())
+
+            os.replace(target, self._path(sealed[0]))
+            for number in sealed[1:]:
+                self._path(number).unlink(missing_ok=True)
+                self._path(number).with_suffix(".idx").unlink(missing_ok=True)
+                self._scanned.pop(number, None)
+            for key, offset in offsets.items():
+                if self._index.get(key, (None,))[0] in sealed:
+                    self._index[key] = (sealed[0], offset)
+            self._scanned[sealed[0]] = self._path(sealed[0]).stat().st_size
+            self._write_sidecar(sealed[0])
+        print(f"[memory] Compacted {len(sealed)} segments in {self.dir}: kept {kept} of {total} entries")
+        return total - kept
+
+    def compact_in_background(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"[memory] Compaction of {self.dir} failed: {e!r}")
+            finally:
+                with self._lock:
+                    self._compacting = False
+
+        threading.Thread(target=run, name=f"memory-compact-{self.dir.name}", daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._sync()
+                os.close(self._fd)
+                self._fd = None
+            if self._lock_fd is not None and self._lock_depth == 0:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def _migrate_legacy(agent: str, log: SegmentLog):
+    """Move a pre-segment-log memory/<agent>.json into the log, once."""
+    legacy = MEMORY_DIR / f"{agent}.json"
+    if not legacy.exists() or log.segments():
+        return
+    for entry in json.loads(legacy.read_text(encoding="utf-8")):
+        log.append(entry)
+    log.sync()
+    legacy.rename(legacy.with_suffix(".json.migrated"))
+    print(f"[memory] Migrated {legacy} into {log.dir}")
+
+
+def get_log(agent: str) -> SegmentLog:
+    if agent not in AGENTS:
+        raise KeyError(agent)
+    with _logs_lock:
+        if agent not in _logs:
+            log = SegmentLog(MEMORY_DIR / agent)
+            _migrate_legacy(agent, log)
+            _logs[agent] = log
+        return _logs[agent]
+
+
+@atexit.register
+def _close_logs():
+    for log in list(_logs.values()):
+        log.close()
+
+
+def load_memory(agent: str, limit: int = None):
+    """
+    Entries of `agent` (the latest one per interaction_id), oldest first.
+    With `limit`, only the most recent `limit` entries are read, from the end
+    of the log.
+    """
+    recent = []
+    for entry in get_log(agent).iter_recent():
+        if limit is not None and len(recent) >= limit:
+            break
+        recent.append(entry)
+    return recent[::-1]
+
+
+def iter_recent_memory(agent: str):
+    """Stream `agent` entries newest first without loading whole segments."""
+    return get_log(agent).iter_recent()
+
+
+def get_interaction(agent: str, interaction_id: str):
+    """Entry for one interaction via the offset index, or None."""
+    return get_log(agent).get(interaction_id)
+
+
+def save_interaction(agent: str, model: BaseModel, interaction_id: str = None):
+    """Save validated agent response to its memory log."""
+    interaction_id = interaction_id or str(uuid.uuid4())
+    get_log(agent).append({
         "interaction_id": interaction_id,
         agent: model.dict()
     })
-
-    file.write_text(json.dumps(memory, indent=2,
-                    ensure_ascii=False), encoding="utf-8")
     return interaction_id
 
 
 def create_interaction(user_id: str) -> str:
     """Create a new interaction entry for a user."""
     interaction_id = str(uuid.uuid4())
-    interaction_collection.insert_one({
+    collection("interaction").insert_one({
         "_id": interaction_id,
         "user_id": user_id,
         "timestamp": datetime.utcnow()
@@ -62,7 +417,7 @@ def create_interaction(user_id: str) -> str:
 
 
 def save_teacher(interaction_id: str, model: BaseModel):
-    teacher_collection.insert_one({
+    collection("teacher").insert_one({
         "_id": interaction_id,
         **model.dict(),
         "timestamp": datetime.utcnow()
@@ -70,7 +425,7 @@ def save_teacher(interaction_id: str, model: BaseModel):
 
 
 def save_student(interaction_id: str, model: BaseModel):
-    student_collection.insert_one({
+    collection("student").insert_one({
         "_id": interaction_id,
         **model.dict(),
         "timestamp": datetime.utcnow()
@@ -78,7 +433,7 @@ def save_student(interaction_id: str, model: BaseModel):
 
 
 def save_evaluator(interaction_id: str, model: BaseModel):
-    evaluator_collection.insert_one({
+    collection("evaluator").insert_one({
         "_id": interaction_id,
         **model.dict(),
         "timestamp": datetime.utcnow()
@@ -86,7 +441,7 @@ def save_evaluator(interaction_id: str, model: BaseModel):
 
 
 def save_scorer(interaction_id: str, model: BaseModel):
-    scorer_collection.insert_one({
+    collection("scorer").insert_one({
         "_id": interaction_id,
         **model.dict(),
         "timestamp": datetime.utcnow()
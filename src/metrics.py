@@ -0,0 +1,197 @@
+"""
+In-process metrics for the teaching turn: stage latency histograms, LLM
+token counters, error and parse-failure counters, plus whatever collectors
+other modules register (e.g. response cache hit rates).
+
+Exposed in Prometheus text format on METRICS_PATH of the Chainlit server
+(see mount()); with METRICS_TRACE_PATH set, every stage is also appended to
+that file as one JSON line, tagged with the turn it belongs to.
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_TRACE_PATH = os.getenv("METRICS_TRACE_PATH", "")
+PREFIX = "ltb_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = PREFIX + name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels):
+        with self._lock:
+            self._values[_labels_key(labels)] += amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self) -> dict:
+        """{labels tuple: {"count", "sum"}} for every series observed so far."""
+        with self._lock:
+            return {key: {"count": series[-1], "sum": series[-2]} for key, series in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', str(bound)),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+stage_seconds = Histogram("stage_seconds", "Latency of each stage of a teaching turn")
+stage_errors = Counter("stage_errors_total", "Stages that raised, by exception type")
+llm_tokens = Counter("llm_tokens_total", "LLM tokens by role, model and direction (input/output)")
+parse_failures = Counter("parse_failures_total", "Chain outputs that did not parse into the expected model")
+llm_fallbacks = Counter("llm_fallbacks_total", "LLM calls answered by the fallback model, by model and reason")
+writes_dropped = Counter("writes_dropped_total", "Buffered Mongo writes given up on, by collection and reason")
+
+_metrics = [stage_seconds, stage_errors, llm_tokens, parse_failures, llm_fallbacks, writes_dropped]
+_collectors = []
+
+
+def register_collector(collector):
+    """
+    Add a callable run at scrape time. It returns a list of
+    (name, type, help, [(labels dict, value), ...]) tuples.
+    """
+    _collectors.append(collector)
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in list(_collectors):
+        try:
+            families = collector()
+        except Exception as e:
+            print(f"[metrics] Collector {collector!r} failed: {e!r}")
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {PREFIX}{name} {help}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{PREFIX}{name}{_format_labels(_labels_key(labels))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------- TRACING ------------------- #
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_trace_lock = threading.Lock()
+_trace_file = None
+
+
+def _write_trace(record: dict):
+    global _trace_file
+    with _trace_lock:
+        if _trace_file is None:
+            _trace_file = open(METRICS_TRACE_PATH, "a", encoding="utf-8", buffering=1)
+        _trace_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+@contextmanager
+def trace(trace_id: str):
+    """Tag every stage run inside this block (and tasks it starts) with `trace_id`."""
+    token = _trace_id.set(trace_id)
+    try:
+        yield
+    finally:
+        _trace_id.reset(token)
+
+
+@contextmanager
+def stage(name: str, **labels):
+    """Time a block: latency histogram, error counter and (optionally) a trace line."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        stage_errors.inc(stage=name, error=error, **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name, **labels)
+        if METRICS_TRACE_PATH:
+            _write_trace({"ts": time.time(), "trace": _trace_id.get(), "stage": name,
+                          "duration_s": round(elapsed, 6), "error": error, **labels})
+
+
+def record_tokens(role: str, model: str, input_tokens: int, output_tokens: int):
+    if not METRICS_ENABLED:
+        return
+    llm_tokens.inc(input_tokens, role=role, model=model, kind="input")
+    llm_tokens.inc(output_tokens, role=role, model=model, kind="output")
+
+
+# ------------------- HTTP ------------------- #
+
+def mount(app, path: str = METRICS_PATH):
+    """Serve render() on `path` of a Starlette/FastAPI app (Chainlit's server)."""
+    if not METRICS_ENABLED:
+        return
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+
+    async def endpoint(request):
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+    # Ahead of Chainlit's catch-all frontend route
+    app.router.routes.insert(0, Route(path, endpoint, methods=["GET"]))
@@ -0,0 +1,144 @@
+"""
+Move per-topic Chroma stores into the shared collection (VS_LAYOUT=shared).
+
+Every chunk of VS_DIR/<topic> is copied with its stored embedding (nothing
+is re-embedded), tagged with topic, source file name and page, and given a
+topic-prefixed id. The topic's manifest, Q&A pool and catalog entry are
+rewritten to match. The old directories are left in place unless
+--delete-old is given. Examples:
+
+    python src/migrate_vectorstore.py --dry-run
+    python src/migrate_vectorstore.py --topic CP
+    python src/migrate_vectorstore.py --delete-old
+
+Sessions follow the rewritten catalog right away; run ingest.py with
+VS_LAYOUT=shared from then on.
+"""
+import os
+import json
+import shutil
+import argparse
+from pathlib import Path
+
+import chromadb
+
+from ingest import CATALOG_PATH, load_manifest, save_manifest, store_key, topic_entry
+from qa_pool import load_pool, save_pool
+from vectorstore_registry import SHARED_DIR, VS_SHARED_COLLECTION, write_store_version
+
+# LangChain's Chroma wrapper stores per-topic chunks in its default collection
+SOURCE_COLLECTION = "langchain"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Migrate per-topic Chroma stores into the shared collection.")
+    parser.add_argument("--topic", action="append", help="Topic to migrate (repeatable, default: all per-topic)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be copied")
+    parser.add_argument("--delete-old", action="store_true", help="Remove each per-topic directory once migrated")
+    return parser.parse_args()
+
+
+def shared_id(topic: str, chunk_id: str) -> str:
+    """Same scheme as ingest.chunk_ids_for in the shared layout."""
+    prefix = f"{topic}/"
+    return chunk_id if chunk_id.startswith(prefix) else prefix + chunk_id
+
+
+def tag(metadata: dict, topic: str) -> dict:
+    metadata = dict(metadata or {})
+    metadata["topic"] = topic
+    metadata["source"] = Path(metadata.get("source", "")).name
+    metadata["page"] = int(metadata.get("page", 0))
+    return metadata
+
+
+def copy_topic(topic: str, vs_path: str, dest, batch_size: int) -> int:
+    """Upsert every chunk of one per-topic store into `dest`. Returns chunks copied."""
+    source = chromadb.PersistentClient(path=vs_path).get_collection(SOURCE_COLLECTION)
+    total = source.count()
+    copied = 0
+    while copied < total:
+        batch = source.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=copied)
+        if not batch["ids"]:
+            break
+        dest.upsert(
+            ids=[shared_id(topic, i) for i in batch["ids"]],
+            embeddings=batch["embeddings"],
+            documents=batch["documents"],
+            metadatas=[tag(m, topic) for m in batch["metadatas"]],
+        )
+        copied += len(batch["ids"])
+        print(f"[migrate] {topic}: {copied}/{total} chunks")
+    return copied
+
+
+def rewrite_ids(topic: str):
+    """Point the manifest and Q&A pool of `topic` at the new chunk ids."""
+    files = load_manifest(topic)
+    for entry in files.values():
+        entry["chunk_ids"] = [shared_id(topic, i) for i in entry.get("chunk_ids", [])]
+    if files:
+        save_manifest(topic, files, store_key("shared"))
+
+    pool = load_pool(topic)
+    for entry in pool:
+        entry["source_ids"] = [shared_id(topic, i) for i in entry.get("source_ids", [])]
+    if pool:
+        save_pool(topic, pool)
+
+
+def save_catalog(catalog: dict):
+    tmp = CATALOG_PATH.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=4)
+    os.replace(tmp, CATALOG_PATH)
+
+
+def main():
+    args = parse_args()
+    if not CATALOG_PATH.exists():
+        print(f"[migrate] No catalog at {CATALOG_PATH}, nothing to migrate")
+        return
+    with open(CATALOG_PATH, "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+
+    topics = [t for t in (args.topic or catalog) if catalog.get(t, {}).get("vectorstore_path")]
+    if not topics:
+        print("[migrate] No per-topic stores in the catalog")
+        return
+
+    if args.dry_run:
+        for topic in topics:
+            path = catalog[topic]["vectorstore_path"]
+            count = chromadb.PersistentClient(path=path).get_collection(SOURCE_COLLECTION).count()
+            print(f"[migrate] {topic}: {count} chunks in {path} -> {VS_SHARED_COLLECTION}")
+        return
+
+    SHARED_DIR.mkdir(parents=True, exist_ok=True)
+    dest = chromadb.PersistentClient(path=str(SHARED_DIR)).get_or_create_collection(VS_SHARED_COLLECTION)
+
+    for topic in topics:
+        vs_path = catalog[topic]["vectorstore_path"]
+        copied = copy_topic(topic, vs_path, dest, args.batch_size)
+        stored = len(dest.get(where={"topic": topic}, include=[])["ids"])
+        if stored < copied:
+            print(f"[migrate] {topic}: only {stored}/{copied} chunks found after copying, leaving it per-topic")
+            continue
+
+        rewrite_ids(topic)
+        catalog[topic] = topic_entry(topic, catalog[topic].get("description"))
+        # Save after every topic, so an interrupted run can resume with the rest
+        save_catalog(catalog)
+        write_store_version(SHARED_DIR)
+        print(f"[migrate] {topic}: {copied} chunks migrated")
+
+        if args.delete_old:
+            shutil.rmtree(vs_path, ignore_errors=True)
+            print(f"[migrate] Removed {vs_path}")
+
+    print("[migrate] Done. Run ingest.py with VS_LAYOUT=shared from now on")
+
+
+if __name__ == "__main__":
+    main()
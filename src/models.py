@@ -1,17 +1,11 @@
-import os
 from typing import List, Optional, Literal
 from pydantic import BaseModel, confloat
-from langchain_openai import ChatOpenAI
-
-API_KEY = os.getenv("OPENROUTER_API_KEY")
+from llm_registry import get_client
 
 
 def get_llm(model_name: str):
-    return ChatOpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=API_KEY,
-        model=f"{model_name}"
-    )
+    """Shared (pooled) client for `model_name`; see llm_registry."""
+    return get_client(model_name)
 
 # -------------------------------
 # Teacher
@@ -56,3 +50,11 @@ class ScorerResponse(BaseModel):
     student_engagement: confloat(ge=0.0, le=1.0)
     # Comments are required, even if empty
     comments: List[str]
+
+
+# -------------------------------
+# Judge (evaluator + scorer in one call)
+# -------------------------------
+class JudgeResponse(BaseModel):
+    evaluator: EvaluatorResponse
+    scorer: ScorerResponse
@@ -0,0 +1,396 @@
+"""
+In-process vector index on memory-mapped NumPy arrays, an alternative to
+Chroma for course-sized topics (VS_BACKEND=numpy).
+
+An index is published at VS_DIR/numpy/<topic>. Every export writes a new
+version directory there and then replaces the CURRENT file naming it, so
+readers always find a complete index. A version directory holds:
+
+    index.json      count, dim, dtype, embedding model
+    vectors.npy     unit-length embeddings as float16, or int8 with...
+    scales.npy      ...one float32 scale per row
+    full.npy        float32 embeddings for re-ranking (only with NUMPY_INDEX_RERANK)
+    chunks.jsonl    one {"id", "text", "metadata"} line per row
+    offsets.npy     byte offset of every line of chunks.jsonl
+
+Everything is opened with mmap, so loading is near-instant and any number
+of worker processes share one read-only copy through the page cache. Search
+is a blocked matrix product of the (batched) query embeddings against the
+quantized matrix with a running top-k; with NUMPY_INDEX_RERANK=N the best
+k*N candidates are re-scored with the float32 vectors.
+
+The index is exported from the topic's Chroma store, with the embeddings
+already stored there:
+
+    python src/numpy_index.py --topic CP --dtype int8 --rerank 4
+
+ingest.py does the same after every topic when VS_BACKEND=numpy.
+"""
+import os
+import json
+import mmap
+import time
+import shutil
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+
+import numpy as np
+from langchain_core.documents import Document
+
+from vectorstore_registry import VS_DIR, EMBED_MODEL, write_store_version
+
+load_dotenv()
+NUMPY_INDEX_DIR = VS_DIR / "numpy"
+# "float16" (2 bytes/dim) or "int8" (1 byte/dim plus a scale per row)
+NUMPY_INDEX_DTYPE = os.getenv("NUMPY_INDEX_DTYPE", "float16")
+# Re-rank the best k*N quantized hits with float32 vectors (0: off, and full.npy is not written)
+NUMPY_INDEX_RERANK = int(os.getenv("NUMPY_INDEX_RERANK", "0"))
+# Rows scored per matrix product, bounding the temporary float32 copy
+NUMPY_INDEX_BLOCK_ROWS = int(os.getenv("NUMPY_INDEX_BLOCK_ROWS", "32768"))
+
+FORMAT = 1
+CURRENT_FILE = "CURRENT"
+INDEX_FILES = ("index.json", "vectors.npy", "scales.npy", "full.npy", "chunks.jsonl", "offsets.npy")
+
+
+def index_path(topic: str) -> Path:
+    return NUMPY_INDEX_DIR / topic
+
+
+_COMPARISONS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value is not None and value != arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value is not None and value not in arg,
+}
+
+
+def where_predicate(where: dict):
+    """
+    Compile a Chroma `where` filter into a test on a chunk's metadata.
+
+    Supports $and / $or and, per key, a plain value or one of $eq, $ne, $gt,
+    $gte, $lt, $lte, $in, $nin. Anything else raises ValueError instead of
+    silently matching nothing.
+    """
+    tests = []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_predicate(c) for c in cond]
+            combine = all if key == "$and" else any
+            tests.append(lambda metadata, parts=parts, combine=combine: combine(p(metadata) for p in parts))
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported where operator {key!r}")
+        elif isinstance(cond, dict):
+            for op, arg in cond.items():
+                if op not in _COMPARISONS:
+                    raise ValueError(f"Unsupported where operator {op!r} on {key!r}")
+                tests.append(lambda metadata, key=key, compare=_COMPARISONS[op], arg=arg:
+                             compare(metadata.get(key), arg))
+        else:
+            tests.append(lambda metadata, key=key, cond=cond: metadata.get(key) == cond)
+    return lambda metadata: all(test(metadata) for test in tests)
+
+
+def current_dir(path) -> Path:
+    """The version directory the index published at `path` currently points to."""
+    path = Path(path)
+    try:
+        return path / (path / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return path  # exported before version directories existed
+
+
+def index_exists(path) -> bool:
+    return (current_dir(path) / "index.json").exists()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(vectors: np.ndarray):
+    """Symmetric per-row int8 quantization: (int8 matrix, float32 scale per row)."""
+    scales = np.abs(vectors).max(axis=1, initial=0.0) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+# ------------------- WRITE ------------------- #
+
+def write_index(dest: Path, ids, texts, metadatas, vectors, dtype: str = NUMPY_INDEX_DTYPE,
+                keep_full: bool = None, embed_model: str = EMBED_MODEL) -> Path:
+    """
+    Publish an index at `dest`: the files go to a new version directory,
+    then CURRENT is replaced (atomically) to name it. Readers that mapped the
+    previous version keep using it until they reopen; it is only deleted
+    when the next export is published.
+    """
+    if dtype not in ("float16", "int8"):
+        raise ValueError(f"Unsupported index dtype {dtype!r} (use float16 or int8)")
+    keep_full = NUMPY_INDEX_RERANK > 0 if keep_full is None else keep_full
+    vectors = _normalize(vectors).reshape(len(ids), -1) if len(ids) else np.zeros((0, 0), dtype=np.float32)
+
+    dest = Path(dest)
+    version = f"v{time.time_ns()}-{os.getpid()}"
+    target = dest / version
+    target.mkdir(parents=True)
+
+    if dtype == "int8":
+        quantized, scales = quantize_int8(vectors)
+        np.save(target / "vectors.npy", quantized)
+        np.save(target / "scales.npy", scales)
+    else:
+        np.save(target / "vectors.npy", vectors.astype(np.float16))
+    if keep_full:
+        np.save(target / "full.npy", vectors)
+
+    offsets = [0]
+    with open(target / "chunks.jsonl", "wb") as f:
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            line = json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}},
+                              ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(target / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+    header = {"format": FORMAT, "count": len(ids), "dim": int(vectors.shape[1]) if len(ids) else 0,
+              "dtype": dtype, "full": bool(keep_full), "embed_model": embed_model, "created_at": time.time()}
+    with open(target / "index.json", "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=4)
+
+    previous = current_dir(dest).name if (dest / CURRENT_FILE).exists() else None
+    pointer = dest / f"{CURRENT_FILE}.{os.getpid()}.tmp"
+    pointer.write_text(version, encoding="utf-8")
+    os.replace(pointer, dest / CURRENT_FILE)
+    # Tells the registry to reopen the index
+    write_store_version(dest)
+
+    for name in INDEX_FILES:
+        (dest / name).unlink(missing_ok=True)  # flat layout of older exports
+    for old in dest.iterdir():
+        if old.is_dir() and old.name.startswith("v") and old.name not in (version, previous):
+            shutil.rmtree(old, ignore_errors=True)
+    return dest
+
+
+def export_store(vs, dest: Path, dtype: str = NUMPY_INDEX_DTYPE, keep_full: bool = None,
+                 batch_size: int = 1000) -> int:
+    """Write the chunks of a Chroma store (or TopicView) as an index, reusing its embeddings."""
+    ids, texts, metadatas, vectors = [], [], [], []
+    while True:
+        batch = vs.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=len(ids))
+        if not batch["ids"]:
+            break
+        ids.extend(batch["ids"])
+        texts.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+        vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    write_index(dest, ids, texts, metadatas, matrix, dtype=dtype, keep_full=keep_full)
+    return len(ids)
+
+
+# ------------------- READ ------------------- #
+
+class NumpyIndex:
+    """
+    Read-only, memory-mapped index with the parts of the Chroma vectorstore
+    API the app uses (similarity_search, get).
+    """
+
+    def __init__(self, path, embedding_function=None, rerank: int = NUMPY_INDEX_RERANK):
+        self.path = Path(path)
+        self.embedding_function = embedding_function
+        try:
+            self._open(current_dir(self.path))
+        except FileNotFoundError:
+            # A newer export was published and our version cleaned up while we opened it
+            self._open(current_dir(self.path))
+        self.rerank = rerank if self.full is not None else 0
+        self._ids = None
+        self._filters = {}
+
+        if embedding_function is not None and self.header.get("embed_model") not in (None, EMBED_MODEL):
+            print(f"[np-index] {self.path} was built with {self.header['embed_model']}, queries use {EMBED_MODEL}")
+
+    def _open(self, directory: Path):
+        self.dir = directory
+        with open(directory / "index.json", "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        self.count = self.header["count"]
+        self.vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+        self.scales = np.load(directory / "scales.npy", mmap_mode="r") if self.header["dtype"] == "int8" else None
+        self.full = np.load(directory / "full.npy", mmap_mode="r") if self.header["full"] else None
+        self.offsets = np.load(directory / "offsets.npy", mmap_mode="r")
+        with open(directory / "chunks.jsonl", "rb") as f:
+            self._chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+
+    def __len__(self):
+        return self.count
+
+    def chunk(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._chunks[start:end])
+
+    def ids(self) -> list:
+        if self._ids is None:
+            self._ids = [self.chunk(i)["id"] for i in range(self.count)]
+        return self._ids
+
+    def _rows_matching(self, filter: dict):
+        """Rows whose metadata matches the Chroma-style `filter` (cached per filter)."""
+        if not filter:
+            return None
+        key = json.dumps(filter, sort_keys=True)
+        if key not in self._filters:
+            matches = where_predicate(filter)
+            rows = [i for i in range(self.count) if matches(self.chunk(i)["metadata"])]
+            self._filters[key] = np.asarray(rows, dtype=np.int64)
+        return self._filters[key]
+
+    # ---- search ---- #
+
+    def _block_scores(self, queries: np.ndarray, start: int, end: int) -> np.ndarray:
+        block = np.asarray(self.vectors[start:end], dtype=np.float32)
+        scores = queries @ block.T
+        if self.scales is not None:
+            scores *= self.scales[start:end]
+        return scores
+
+    def search_vectors(self, queries, k: int = 4, rows=None):
+        """
+        Top-k cosine search for a batch of query embeddings, shape (m, dim).
+        Returns (row indices, scores), both (m, k'), best first; k' = min(k, rows).
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        n = self.count if rows is None else len(rows)
+        k = min(k, n)
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        wanted = min(n, k * self.rerank) if self.rerank else k
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, n, NUMPY_INDEX_BLOCK_ROWS):
+            end = min(n, start + NUMPY_INDEX_BLOCK_ROWS)
+            if rows is None:
+                scores, block_rows = self._block_scores(queries, start, end), np.arange(start, end)
+            else:
+                block_rows = rows[start:end]
+                block = np.asarray(self.vectors[block_rows], dtype=np.float32)
+                scores = queries @ block.T
+                if self.scales is not None:
+                    scores *= self.scales[block_rows]
+            scores = np.concatenate([best_scores, scores], axis=1)
+            candidates = np.concatenate([best_rows, np.broadcast_to(block_rows, (len(queries), len(block_rows)))],
+                                        axis=1)
+            if scores.shape[1] > wanted:
+                top = np.argpartition(-scores, wanted - 1, axis=1)[:, :wanted]
+                scores = np.take_along_axis(scores, top, axis=1)
+                candidates = np.take_along_axis(candidates, top, axis=1)
+            best_scores, best_rows = scores, candidates
+
+        if self.rerank:
+            # Exact float32 scores for the shortlisted rows
+            full = np.asarray(self.full[best_rows.ravel()], dtype=np.float32).reshape(*best_rows.shape, -1)
+            best_scores = np.einsum("mcd,md->mc", full, queries)
+
+        order = np.argsort(-best_scores, axis=1)[:, :k]
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def _documents(self, rows, scores):
+        results = []
+        for row, score in zip(rows, scores):
+            chunk = self.chunk(int(row))
+            results.append((Document(page_content=chunk["text"], metadata=chunk["metadata"]), float(score)))
+        return results
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None):
+        rows, scores = self.search_vectors(embedding, k, self._rows_matching(filter))
+        return self._documents(rows[0], scores[0])
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def batch_similarity_search(self, queries, k: int = 4, filter: dict = None):
+        """Search many queries with one embedding request and one pass over the matrix."""
+        embeddings = self.embedding_function.embed_documents(list(queries))
+        rows, scores = self.search_vectors(embeddings, k, self._rows_matching(filter))
+        return [[doc for doc, _ in self._documents(r, s)] for r, s in zip(rows, scores)]
+
+    # ---- Chroma-style reads ---- #
+
+    def get(self, ids=None, where: dict = None, include=None, limit: int = None, offset: int = 0, **kwargs):
+        include = ["documents", "metadatas"] if include is None else include
+        if ids is not None:
+            positions = {chunk_id: i for i, chunk_id in enumerate(self.ids())}
+            rows = [positions[i] for i in ids if i in positions]
+        else:
+            matching = self._rows_matching(where)
+            rows = list(range(self.count)) if matching is None else matching.tolist()
+            rows = rows[offset: offset + limit] if limit else rows[offset:]
+
+        chunks = [self.chunk(r) for r in rows]
+        if where and ids is not None:
+            matches = where_predicate(where)
+            keep = [i for i, c in enumerate(chunks) if matches(c["metadata"])]
+            rows, chunks = [rows[i] for i in keep], [chunks[i] for i in keep]
+        result = {"ids": [c["id"] for c in chunks]}
+        if "documents" in include:
+            result["documents"] = [c["text"] for c in chunks]
+        if "metadatas" in include:
+            result["metadatas"] = [c["metadata"] for c in chunks]
+        if "embeddings" in include:
+            result["embeddings"] = self.embeddings(rows)
+        return result
+
+    def embeddings(self, rows) -> np.ndarray:
+        """float32 (unit-length) embeddings of `rows`; int8 rows are scaled back."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.full is not None:
+            return np.asarray(self.full[rows], dtype=np.float32)
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][:, None]
+        return vectors
+
+    def persist(self):
+        pass
+
+
+if __name__ == "__main__":
+    from qa_generator import load_catalog
+    from vectorstore_registry import topic_store
+
+    parser = argparse.ArgumentParser(description="Export topic stores to memory-mapped NumPy indexes.")
+    parser.add_argument("--topic", action="append", help="Topic to export (repeatable, default: all in catalog)")
+    parser.add_argument("--dtype", choices=["float16", "int8"], default=NUMPY_INDEX_DTYPE)
+    parser.add_argument("--rerank", type=int, default=NUMPY_INDEX_RERANK,
+                        help="Keep float32 vectors for re-ranking (any value > 0)")
+    args = parser.parse_args()
+
+    catalog = load_catalog()
+    for topic in args.topic or list(catalog):
+        info = catalog.get(topic)
+        if info is None:
+            print(f"[np-index] Unknown topic {topic}, skipping")
+            continue
+        vs = topic_store(topic, info, backend="chroma")
+        start = time.perf_counter()
+        n = export_store(vs, index_path(topic), dtype=args.dtype, keep_full=args.rerank > 0)
+        size = sum(f.stat().st_size for f in current_dir(index_path(topic)).iterdir())
+        print(f"[np-index] {topic}: {n} chunks -> {index_path(topic)} "
+              f"({size / 1024 / 1024:.1f} MB, {time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,263 @@
+"""
+Write-behind persistence for the teaching turn.
+
+Turn documents (interaction, teacher, student, inline judge results, student
+memory) are queued in-process and flushed as one bulk_write per collection
+when WRITE_BUFFER_MAX_OPS operations are pending, every
+WRITE_BUFFER_FLUSH_SECONDS, at the end of a chat and at interpreter exit.
+Batches of inserts are unordered; a batch with updates or replaces is
+applied in queue order. As in db.py, pymongo is only imported once the
+first write is queued.
+
+A failed flush is retried, ahead of newer ops, up to
+WRITE_BUFFER_MAX_RETRIES times and at most WRITE_BUFFER_MAX_PENDING
+operations are kept; writes given up on (and ones Mongo rejects) are
+appended to WRITE_DEAD_LETTER_PATH as JSON lines.
+"""
+import os
+import json
+import atexit
+import asyncio
+import threading
+from datetime import datetime
+from pathlib import Path
+from collections import defaultdict
+from dotenv import load_dotenv
+
+import metrics
+from db import get_db, get_async_db
+
+load_dotenv()
+WRITE_BUFFER_MAX_OPS = int(os.getenv("WRITE_BUFFER_MAX_OPS", "200"))
+WRITE_BUFFER_FLUSH_SECONDS = float(os.getenv("WRITE_BUFFER_FLUSH_SECONDS", "1.0"))
+WRITE_BUFFER_MAX_RETRIES = int(os.getenv("WRITE_BUFFER_MAX_RETRIES", "5"))
+WRITE_BUFFER_MAX_PENDING = int(os.getenv("WRITE_BUFFER_MAX_PENDING", "10000"))
+WRITE_DEAD_LETTER_PATH = Path(os.getenv("WRITE_DEAD_LETTER_PATH",
+                                        Path(__file__).resolve().parents[1] / "write_dead_letter.jsonl"))
+
+DUPLICATE_KEY = 11000
+
+
+async def ensure_user(user_id: str, email: str = None, name: str = None):
+    """Create the user document if missing. Call once per session, not per message."""
+    await get_async_db()["users"].update_one(
+        {"_id": user_id},
+        {"$setOnInsert": {
+            "_id": user_id,
+            "email": email,
+            "name": name,
+            "created_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+
+class _Queued:
+    """A buffered write operation and how many flushes of it failed."""
+
+    __slots__ = ("op", "attempts")
+
+    def __init__(self, op):
+        self.op = op
+        self.attempts = 0
+
+
+def _ordered(ops) -> bool:
+    """
+    Whether a batch must be applied in queue order. Repeated inserts only
+    collide on _id, but two updates or replaces of one document must land
+    in the order they were queued.
+    """
+    from pymongo import InsertOne
+
+    return not all(isinstance(op, InsertOne) for op in ops)
+
+
+def _describe(op) -> dict:
+    """JSON-friendly view of a pymongo write operation, for the dead-letter file."""
+    record = {"op": type(op).__name__}
+    for field in ("filter", "doc", "upsert"):
+        value = getattr(op, f"_{field}", None)
+        if value is not None:
+            record[field] = value
+    return record
+
+
+class WriteBehindBuffer:
+    def __init__(self, max_ops: int = WRITE_BUFFER_MAX_OPS, flush_seconds: float = WRITE_BUFFER_FLUSH_SECONDS,
+                 max_retries: int = WRITE_BUFFER_MAX_RETRIES, max_pending: int = WRITE_BUFFER_MAX_PENDING,
+                 dead_letter_path: Path = WRITE_DEAD_LETTER_PATH):
+        self.max_ops = max_ops
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self.dead_letter_path = Path(dead_letter_path)
+        self._ops = defaultdict(list)  # collection name -> [_Queued], oldest first
+        self._lock = threading.Lock()
+        self._full = None
+        self._task = None
+        self.flushed_ops = 0
+        self.flushes = 0
+        self.dropped_ops = 0
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(ops) for ops in self._ops.values())
+
+    def add(self, collection: str, op):
+        with self._lock:
+            self._ops[collection].append(_Queued(op))
+            full = sum(len(ops) for ops in self._ops.values()) >= self.max_ops
+        self._ensure_task()
+        if full and self._full is not None:
+            self._full.set()
+
+    def insert(self, collection: str, doc: dict):
+        from pymongo import InsertOne
+        self.add(collection, InsertOne(doc))
+
+    def replace(self, collection: str, doc: dict):
+        from pymongo import ReplaceOne
+        self.add(collection, ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+
+    def update(self, collection: str, filter: dict, update: dict, upsert: bool = False):
+        from pymongo import UpdateOne
+        self.add(collection, UpdateOne(filter, update, upsert=upsert))
+
+    def record_turn(self, interaction_id: str, user_id: str, topic: str, teacher_model, student_model,
+                    **fields):
+        """
+        Queue the interaction, teacher and student documents of one turn.
+
+        Extra `fields` (e.g. the QA question and expected answer) go on the
+        interaction document so the turn can be judged again offline.
+        """
+        now = datetime.utcnow()
+        self.insert("interaction", {"_id": interaction_id, "user_id": user_id, "topic": topic, **fields,
+                                    "timestamp": now})
+        self.insert("teacher", {"_id": interaction_id, **teacher_model.dict(), "timestamp": now})
+        self.insert("student", {"_id": interaction_id, **student_model.dict(), "timestamp": now})
+
+    def _take(self):
+        with self._lock:
+            ops, self._ops = self._ops, defaultdict(list)
+        return ops
+
+    def _requeue(self, collection: str, queued, error=None, failed: bool = True):
+        """
+        Put ops back in front of newer ones, keeping their order. With
+        `failed`, this counts as a failed attempt: ops out of retries are
+        dead-lettered. Past max_pending, the collection's oldest ops go too.
+        """
+        retry, expired = [], []
+        for item in queued:
+            item.attempts += failed
+            (expired if item.attempts > self.max_retries else retry).append(item)
+        with self._lock:
+            self._ops[collection][:0] = retry
+            overflow = []
+            pending = sum(len(ops) for ops in self._ops.values())
+            if pending > self.max_pending:
+                ops = self._ops[collection]
+                overflow, ops[:] = ops[:pending - self.max_pending], ops[pending - self.max_pending:]
+        self._dead_letter(collection, expired, "retries", error)
+        self._dead_letter(collection, overflow, "overflow", error)
+
+    def _dead_letter(self, collection: str, queued, reason: str, error=None):
+        if not queued:
+            return
+        self.dropped_ops += len(queued)
+        metrics.writes_dropped.inc(len(queued), collection=collection, reason=reason)
+        print(f"[persist] Dropping {len(queued)} ops to {collection} ({reason}), see {self.dead_letter_path}")
+        now = datetime.utcnow().isoformat()
+        try:
+            self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for item in queued:
+                    record = {"collection": collection, "reason": reason, "error": error, "at": now,
+                              "attempts": item.attempts, **_describe(item.op)}
+                    f.write(json.dumps(record, default=str) + "\n")
+        except OSError as e:
+            print(f"[persist] Could not write dead letters: {e!r}")
+
+    def _handle_error(self, collection: str, queued, error, ordered: bool):
+        from pymongo.errors import BulkWriteError
+
+        if isinstance(error, BulkWriteError):
+            errors = error.details.get("writeErrors", [])
+            # Duplicate keys mean an earlier (requeued) attempt already landed
+            failed = [e for e in errors if e.get("code") != DUPLICATE_KEY]
+            if failed:
+                print(f"[persist] {len(failed)} writes to {collection} rejected: {failed[0].get('errmsg')}")
+                for e in failed:
+                    self._dead_letter(collection, [queued[e["index"]]], "rejected", e.get("errmsg"))
+            if ordered and errors:
+                # An ordered batch stops at its first error: the ops after it never ran
+                self._requeue(collection, queued[errors[0]["index"] + 1:], failed=False)
+        else:
+            print(f"[persist] Flush of {len(queued)} ops to {collection} failed, will retry: {error!r}")
+            self._requeue(collection, queued, repr(error))
+
+    async def flush(self):
+        for collection, queued in self._take().items():
+            if not queued:
+                continue
+            ops = [item.op for item in queued]
+            ordered = _ordered(ops)
+            try:
+                with metrics.stage("db.flush", collection=collection):
+                    await get_async_db()[collection].bulk_write(ops, ordered=ordered)
+                self.flushed_ops += len(ops)
+            except Exception as e:
+                self._handle_error(collection, queued, e, ordered)
+        self.flushes += 1
+
+    def flush_sync(self):
+        """Flush with the blocking client, for use when no event loop is running."""
+        from pymongo.errors import BulkWriteError
+
+        # Ordered batches requeue what follows a rejected op, so go until nothing is left
+        while self.pending():
+            for collection, queued in self._take().items():
+                if not queued:
+                    continue
+                ops = [item.op for item in queued]
+                ordered = _ordered(ops)
+                try:
+                    get_db()[collection].bulk_write(ops, ordered=ordered)
+                    self.flushed_ops += len(ops)
+                except BulkWriteError as e:
+                    self._handle_error(collection, queued, e, ordered)
+                except Exception as e:
+                    self._dead_letter(collection, queued, "shutdown", repr(e))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            if self.pending():
+                # The task inherited the trace of the turn that started it
+                with metrics.trace(None):
+                    await self.flush()
+
+    def _ensure_task(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop: flush() / flush_sync() must be called explicitly
+        self._full = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+
+buffer = WriteBehindBuffer()
+
+
+@atexit.register
+def _flush_at_exit():
+    if buffer.pending():
+        buffer.flush_sync()
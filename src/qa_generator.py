@@ -3,15 +3,12 @@ import json
 from dotenv import load_dotenv
 from typing import List
 from pydantic import BaseModel
-from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
-from langchain.output_parsers import PydanticOutputParser
 from pathlib import Path
 
 
 load_dotenv()
-VS_DIR = os.getenv("VS_DIR")
-CATALOG_PATH = Path(VS_DIR + "/catalog.json")
+VS_DIR = Path(os.getenv("VS_DIR", Path(__file__).resolve().parents[1] / "vectorstore"))
+CATALOG_PATH = VS_DIR / "catalog.json"
 
 
 def load_catalog():
@@ -30,20 +27,11 @@ class QAList(BaseModel):
     questions: List[QAPair]
 
 
-def generate_initial_qa(llm, vs, n: int = 10) -> List[QAPair]:
-    """
-    Generate initial Q&A pairs from vectorDB content.
-
-    Args:
-        vs: Vectorstore instance (e.g., Chroma).
-        n: Number of context documents to retrieve.
-
-    Returns:
-        List[QAPair]: A list of Q&A pairs as Pydantic objects.
-    """
-    # Pull relevant documents
-    docs = vs.similarity_search("learning by teaching", k=n)
-    context = "\n\n".join(d.page_content for d in docs)
+def generate_qa_from_context(llm, context: str) -> List[QAPair]:
+    """Ask the LLM for Q&A pairs grounded in the given textbook context."""
+    from langchain.prompts import ChatPromptTemplate
+    from langchain.chains import LLMChain
+    from langchain.output_parsers import PydanticOutputParser
 
     # Pydantic parser
     parser = PydanticOutputParser(pydantic_object=QAList)
@@ -80,3 +68,20 @@ def generate_initial_qa(llm, vs, n: int = 10) -> List[QAPair]:
     except Exception as e:
         print("Parsing failed:", e)
         return []
+
+
+def generate_initial_qa(llm, vs, n: int = 10) -> List[QAPair]:
+    """
+    Generate initial Q&A pairs from vectorDB content.
+
+    Args:
+        vs: Vectorstore instance (e.g., Chroma).
+        n: Number of context documents to retrieve.
+
+    Returns:
+        List[QAPair]: A list of Q&A pairs as Pydantic objects.
+    """
+    # Pull relevant documents
+    docs = vs.similarity_search("learning by teaching", k=n)
+    context = "\n\n".join(d.page_content for d in docs)
+    return generate_qa_from_context(llm, context)
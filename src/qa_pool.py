@@ -0,0 +1,270 @@
+"""
+Precomputed per-topic Q&A pools.
+
+Pools live in one SQLite table (VS_DIR/qa_pools/pools.sqlite3) shared by
+every app process: drawing questions for a session touches only the rows
+it serves, and reads-then-writes run in BEGIN IMMEDIATE transactions, so
+concurrent sessions and refills never lose each other's updates. Each entry
+keeps the ids of the chunks it was generated from, so re-ingestion can drop
+entries whose source changed. Pools of the older VS_DIR/qa_pools/<topic>.json
+format are imported on first use. Build or top up pools offline with:
+
+    python src/qa_pool.py --topic CP --size 50 --model openai/gpt-4o
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from typing import List
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+from qa_generator import QAPair, generate_qa_from_context, load_catalog
+
+load_dotenv()
+VS_DIR = Path(os.getenv("VS_DIR", Path(__file__).resolve().parents[1] / "vectorstore"))
+QA_POOL_DIR = VS_DIR / "qa_pools"
+QA_POOL_PATH = Path(os.getenv("QA_POOL_PATH", QA_POOL_DIR / "pools.sqlite3"))
+# Refill in the background once fewer than this many entries were never served
+QA_POOL_MIN_FRESH = int(os.getenv("QA_POOL_MIN_FRESH", "20"))
+# Chunks of context handed to the LLM per generation call
+QA_POOL_CONTEXT_CHUNKS = int(os.getenv("QA_POOL_CONTEXT_CHUNKS", "5"))
+
+_lock = threading.Lock()
+_refilling = set()
+_store = None
+_imported = set()
+
+
+class PoolStore:
+    """SQLite table of pool entries; every method is blocking and thread-safe."""
+
+    COLUMNS = "id, q, a, source_ids, served, created_at"
+
+    def __init__(self, path: Path = QA_POOL_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " topic TEXT NOT NULL, id TEXT NOT NULL, q TEXT NOT NULL, a TEXT NOT NULL,"
+            " source_ids TEXT NOT NULL, served INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL,"
+            " PRIMARY KEY (topic, id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_served ON entries(topic, served)")
+        self._conn.commit()
+
+    @contextmanager
+    def _write_transaction(self):
+        """Hold the database write lock from the first read on, across processes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    @staticmethod
+    def _row(row) -> dict:
+        return {"id": row[0], "q": row[1], "a": row[2], "source_ids": json.loads(row[3]),
+                "served": row[4], "created_at": row[5]}
+
+    def _insert(self, topic: str, entries: list) -> int:
+        cursor = self._conn.executemany(
+            "INSERT OR IGNORE INTO entries (topic, id, q, a, source_ids, served, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(topic, e["id"], e["q"], e["a"], json.dumps(e["source_ids"]), e.get("served", 0),
+              e.get("created_at", time.time())) for e in entries],
+        )
+        return cursor.rowcount
+
+    def entries(self, topic: str) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM entries WHERE topic = ? ORDER BY created_at, rowid", (topic,)
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def count(self, topic: str, served: int = None) -> int:
+        query, args = "SELECT COUNT(*) FROM entries WHERE topic = ?", [topic]
+        if served is not None:
+            query, args = query + " AND served = ?", args + [served]
+        with self._lock:
+            return self._conn.execute(query, args).fetchone()[0]
+
+    def add(self, topic: str, entries: list) -> int:
+        """Insert entries whose id the topic does not have yet. Returns how many were new."""
+        with self._write_transaction():
+            return self._insert(topic, entries)
+
+    def replace(self, topic: str, entries: list):
+        with self._write_transaction():
+            self._conn.execute("DELETE FROM entries WHERE topic = ?", (topic,))
+            self._insert(topic, entries)
+
+    def draw(self, topic: str, n: int) -> list:
+        """The `n` least served entries (ties broken at random), counted as served once more."""
+        with self._write_transaction():
+            rows = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM entries WHERE topic = ? ORDER BY served, random() LIMIT ?",
+                (topic, n),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE entries SET served = served + 1 WHERE topic = ? AND id = ?",
+                [(topic, r[0]) for r in rows],
+            )
+        return [self._row(r) for r in rows]
+
+    def remove_sources(self, topic: str, removed_ids: set) -> int:
+        """Delete entries generated from any of `removed_ids`. Returns how many went."""
+        with self._write_transaction():
+            rows = self._conn.execute("SELECT id, source_ids FROM entries WHERE topic = ?", (topic,)).fetchall()
+            victims = [(topic, key) for key, sources in rows if removed_ids.intersection(json.loads(sources))]
+            self._conn.executemany("DELETE FROM entries WHERE topic = ? AND id = ?", victims)
+        return len(victims)
+
+
+def pool_path(topic: str) -> Path:
+    """The pre-SQLite JSON pool of `topic`, imported on first use."""
+    return QA_POOL_DIR / f"{topic}.json"
+
+
+def get_store(topic: str = None) -> PoolStore:
+    """The process-wide PoolStore, after importing the legacy JSON pool of `topic` if there is one."""
+    global _store
+    with _lock:
+        if _store is None:
+            _store = PoolStore()
+        if topic is not None and topic not in _imported:
+            _imported.add(topic)
+            legacy = pool_path(topic)
+            if legacy.exists():
+                with open(legacy, "r", encoding="utf-8") as f:
+                    added = _store.add(topic, json.load(f))
+                legacy.rename(legacy.with_suffix(".json.migrated"))
+                print(f"[qa-pool] Imported {added} entries of {legacy} into {_store.path}")
+        return _store
+
+
+def load_pool(topic: str) -> list:
+    return get_store(topic).entries(topic)
+
+
+def save_pool(topic: str, entries: list):
+    """Replace the whole pool of `topic`."""
+    get_store(topic).replace(topic, entries)
+
+
+def _entry_id(q: str) -> str:
+    return hashlib.sha256(" ".join(q.lower().split()).encode("utf-8")).hexdigest()[:16]
+
+
+def generate_pool_entries(llm, vs, n_chunks: int = QA_POOL_CONTEXT_CHUNKS, rng=random) -> list:
+    """Generate Q&A entries from a random sample of chunks of the store."""
+    ids = vs.get(include=[])["ids"]
+    if not ids:
+        return []
+    chosen = rng.sample(ids, min(n_chunks, len(ids)))
+    docs = vs.get(ids=chosen, include=["documents"])
+    context = "\n\n".join(docs["documents"])
+
+    now = time.time()
+    return [
+        {"id": _entry_id(qa.q), "q": qa.q, "a": qa.a, "source_ids": docs["ids"],
+         "served": 0, "created_at": now}
+        for qa in generate_qa_from_context(llm, context)
+    ]
+
+
+def add_entries(topic: str, entries: list) -> int:
+    """Append new entries, skipping questions the pool already has."""
+    if not entries:
+        return 0
+    return get_store(topic).add(topic, entries)
+
+
+def pool_size(topic: str) -> int:
+    return get_store(topic).count(topic)
+
+
+def build_pool(topic: str, llm, vs, size: int, max_rounds: int = None) -> int:
+    """Generate until the pool holds at least `size` entries. Returns the final size."""
+    max_rounds = max_rounds or max(3, size)
+    for _ in range(max_rounds):
+        current = pool_size(topic)
+        if current >= size:
+            return current
+        added = add_entries(topic, generate_pool_entries(llm, vs))
+        print(f"[qa-pool] {topic}: +{added} entries ({current + added}/{size})")
+    return pool_size(topic)
+
+
+def sample_qa(topic: str, n: int = 5) -> List[QAPair]:
+    """
+    Draw `n` Q&A pairs for a new session, favouring the least served ones.
+
+    Returns an empty list when the topic has no pool yet.
+    """
+    return [QAPair(q=e["q"], a=e["a"]) for e in get_store(topic).draw(topic, n)]
+
+
+def needs_refill(topic: str) -> bool:
+    return get_store(topic).count(topic, served=0) < QA_POOL_MIN_FRESH
+
+
+def refill_in_background(topic: str, llm, vs):
+    """Top the pool up with one generation round on a daemon thread, at most one per topic."""
+    with _lock:
+        if topic in _refilling:
+            return
+        _refilling.add(topic)
+
+    def run():
+        try:
+            added = add_entries(topic, generate_pool_entries(llm, vs))
+            print(f"[qa-pool] Refilled {topic} with {added} entries")
+        except Exception as e:
+            print(f"[qa-pool] Refill failed for {topic}: {e}")
+        finally:
+            with _lock:
+                _refilling.discard(topic)
+
+    threading.Thread(target=run, name=f"qa-pool-refill-{topic}", daemon=True).start()
+
+
+def prune_pool(topic: str, removed_ids) -> int:
+    """Drop entries generated from chunks that no longer exist. Returns how many went."""
+    removed_ids = set(removed_ids)
+    if not removed_ids:
+        return 0
+    return get_store(topic).remove_sources(topic, removed_ids)
+
+
+if __name__ == "__main__":
+    from models import get_llm
+    from vectorstore_registry import topic_store
+
+    parser = argparse.ArgumentParser(description="Build or top up precomputed Q&A pools.")
+    parser.add_argument("--topic", action="append", help="Topic to build (repeatable, default: all in catalog)")
+    parser.add_argument("--size", type=int, default=50, help="Target number of entries per topic")
+    parser.add_argument("--model", default=os.getenv("QA_POOL_MODEL", "openai/gpt-4o"))
+    args = parser.parse_args()
+
+    catalog = load_catalog()
+    llm = get_llm(args.model)
+    for topic in args.topic or list(catalog):
+        if topic not in catalog:
+            print(f"[qa-pool] Unknown topic {topic}, skipping")
+            continue
+        vs = topic_store(topic, catalog[topic])
+        total = build_pool(topic, llm, vs, args.size)
+        print(f"[qa-pool] {topic}: {total} entries in {QA_POOL_PATH}")
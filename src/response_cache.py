@@ -0,0 +1,264 @@
+"""
+Opt-in cache of chain outputs (RESPONSE_CACHE=1).
+
+Entries are keyed by (role, model, normalized inputs) and kept in process
+memory with LRU and TTL eviction. With RESPONSE_CACHE_SIMILARITY set, a miss
+falls back to the most similar cached teacher explanation whose other
+inputs match exactly, if its cosine similarity reaches the threshold.
+"""
+import os
+import json
+import time
+import math
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+from dotenv import load_dotenv
+import metrics
+from llm_registry import model_name
+
+load_dotenv()
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_ROLES = set(os.getenv("RESPONSE_CACHE_ROLES", "student,evaluator,scorer,judge").split(","))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+# Cosine similarity needed for a near-duplicate hit; 0 disables the embedding tier
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+# The free-text input compared by the embedding tier; all other inputs must match exactly
+SIMILARITY_FIELD = "teacher_explanation"
+COUNTERS = ("exact_hits", "similar_hits", "misses", "evicted", "expired")
+
+
+def _normalize(value):
+    if hasattr(value, "dict"):
+        value = value.dict()
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _digest(*parts) -> str:
+    raw = json.dumps([_normalize(p) for p in parts], ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """Thread-safe LRU/TTL map of chain outputs with an optional similarity tier."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY, embeddings=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._embeddings = embeddings
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()           # key -> (stored_at, anchor, vector, value)
+        self._anchors = defaultdict(set)        # anchor -> keys sharing every input but SIMILARITY_FIELD
+        self._stats = defaultdict(lambda: defaultdict(int))
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from vectorstore_registry import get_embeddings
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    def keys_for(self, role: str, model: str, inputs: dict):
+        """Return (exact key, similarity anchor or None)."""
+        key = _digest(role, model, inputs)
+        anchor = None
+        if self.similarity > 0 and inputs.get(SIMILARITY_FIELD):
+            rest = {k: v for k, v in inputs.items() if k != SIMILARITY_FIELD}
+            anchor = _digest(role, model, rest)
+        return key, anchor
+
+    def _drop(self, key: str):
+        _, anchor, _, _ = self._entries.pop(key)
+        if anchor is not None:
+            self._anchors[anchor].discard(key)
+            if not self._anchors[anchor]:
+                del self._anchors[anchor]
+
+    def _fresh(self, key: str, now: float, role: str) -> bool:
+        if now - self._entries[key][0] <= self.ttl:
+            return True
+        self._drop(key)
+        self._stats[role]["expired"] += 1
+        return False
+
+    def get_exact(self, role: str, key: str):
+        now = time.time()
+        with self._lock:
+            if key in self._entries and self._fresh(key, now, role):
+                self._entries.move_to_end(key)
+                self._stats[role]["exact_hits"] += 1
+                return self._entries[key][3]
+        return None
+
+    def get_similar(self, role: str, anchor: str, vector):
+        """Best cached value under `anchor` at or above the similarity threshold."""
+        now = time.time()
+        with self._lock:
+            best, best_score = None, self.similarity
+            for key in list(self._anchors.get(anchor, ())):
+                if not self._fresh(key, now, role):
+                    continue
+                score = _cosine(vector, self._entries[key][2])
+                if score >= best_score:
+                    best, best_score = key, score
+            if best is None:
+                return None
+            self._entries.move_to_end(best)
+            self._stats[role]["similar_hits"] += 1
+            return self._entries[best][3]
+
+    def put(self, role: str, key: str, anchor, vector, value):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.time(), anchor, vector, value)
+            if anchor is not None:
+                self._anchors[anchor].add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats[role]["evicted"] += 1
+
+    def miss(self, role: str):
+        with self._lock:
+            self._stats[role]["misses"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {"entries": len(self._entries), "roles": {}}
+            for role, counts in self._stats.items():
+                hits = counts["exact_hits"] + counts["similar_hits"]
+                lookups = hits + counts["misses"]
+                out["roles"][role] = {
+                    **{name: counts[name] for name in COUNTERS},
+                    "hit_rate": hits / lookups if lookups else 0.0,
+                }
+        return out
+
+    def report(self):
+        for role, s in self.stats()["roles"].items():
+            print(
+                f"[response-cache] {role}: hit rate {s['hit_rate']:.1%} "
+                f"({s['exact_hits']} exact, {s['similar_hits']} similar, {s['misses']} misses, "
+                f"{s['evicted']} evicted, {s['expired']} expired)"
+            )
+
+
+class CachedChain:
+    """
+    Wraps a BudgetedChain: serves repeated inputs from a ResponseCache and
+    stores fresh outputs. Anything else is forwarded to the wrapped chain.
+    """
+
+    def __init__(self, chain, cache: ResponseCache, model: str = None):
+        self.chain = chain
+        self.cache = cache
+        self.model = model or model_name(chain.llm)
+
+    def __getattr__(self, name):
+        return getattr(self.chain, name)
+
+    def rebind(self, llm):
+        # Cached outputs stay keyed by the model that produced them
+        self.chain.rebind(llm)
+        self.model = model_name(llm)
+
+    def _copy(self, value):
+        if hasattr(value, "model_copy"):  # pydantic v2
+            return value.model_copy(deep=True)
+        return value.copy(deep=True) if hasattr(value, "copy") else value
+
+    def invoke(self, inputs: dict, *args, **kwargs):
+        key, anchor = self.cache.keys_for(self.role, self.model, inputs)
+        value = self.cache.get_exact(self.role, key)
+        vector = None
+        if value is None and anchor is not None:
+            vector = self.cache.embeddings.embed_query(inputs[SIMILARITY_FIELD])
+            value = self.cache.get_similar(self.role, anchor, vector)
+        if value is not None:
+            return {**inputs, "text": self._copy(value)}
+
+        self.cache.miss(self.role)
+        response = self.chain.invoke(inputs, *args, **kwargs)
+        self.cache.put(self.role, key, anchor, vector, response["text"])
+        return response
+
+    async def _alookup(self, inputs: dict):
+        key, anchor = self.cache.keys_for(self.role, self.model, inputs)
+        value = self.cache.get_exact(self.role, key)
+        vector = None
+        if value is None and anchor is not None:
+            vector = await self.cache.embeddings.aembed_query(inputs[SIMILARITY_FIELD])
+            value = self.cache.get_similar(self.role, anchor, vector)
+        return key, anchor, vector, value
+
+    async def ainvoke(self, inputs: dict, *args, **kwargs):
+        key, anchor, vector, value = await self._alookup(inputs)
+        if value is not None:
+            return {**inputs, "text": self._copy(value)}
+
+        self.cache.miss(self.role)
+        response = await self.chain.ainvoke(inputs, *args, **kwargs)
+        self.cache.put(self.role, key, anchor, vector, response["text"])
+        return response
+
+    async def astream(self, inputs: dict, on_chunk=None) -> dict:
+        key, anchor, vector, value = await self._alookup(inputs)
+        if value is not None:
+            if on_chunk is not None:
+                # Replay the cached output as one chunk so streaming consumers still see it
+                await on_chunk(value.json() if hasattr(value, "json") else str(value))
+            return {**inputs, "text": self._copy(value)}
+
+        self.cache.miss(self.role)
+        response = await self.chain.astream(inputs, on_chunk)
+        self.cache.put(self.role, key, anchor, vector, response["text"])
+        return response
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _collect_metrics():
+    stats = get_response_cache().stats()
+    lookups, rates = [], []
+    for role, s in stats["roles"].items():
+        for result in ("exact_hits", "similar_hits", "misses"):
+            lookups.append(({"role": role, "result": result}, s[result]))
+        rates.append(({"role": role}, s["hit_rate"]))
+    return [
+        ("response_cache_lookups_total", "counter", "Response cache lookups by role and result", lookups),
+        ("response_cache_hit_rate", "gauge", "Response cache hit rate by role", rates),
+        ("response_cache_entries", "gauge", "Entries held by the response cache", [({}, stats["entries"])]),
+    ]
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+            metrics.register_collector(_collect_metrics)
+        return _cache
+
+
+def with_cache(chain):
+    """Wrap `chain` in a CachedChain if the cache is enabled for its role."""
+    if not RESPONSE_CACHE or chain.role not in RESPONSE_CACHE_ROLES:
+        return chain
+    return CachedChain(chain, get_response_cache())
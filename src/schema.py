@@ -0,0 +1,143 @@
+"""
+Mongo index declarations, bootstrap and query-plan checks.
+
+    python src/schema.py            # create missing indexes and check hot queries
+    python src/schema.py --check    # only report query plans
+
+The app runs the same bootstrap once per process on the first chat start
+(disable with MONGO_AUTO_INDEX=0).
+"""
+import os
+import argparse
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+from db import get_db
+
+load_dotenv()
+MONGO_AUTO_INDEX = os.getenv("MONGO_AUTO_INDEX", "1") == "1"
+# Optional retention for per-turn documents; 0 keeps them forever
+TURN_TTL_DAYS = int(os.getenv("TURN_TTL_DAYS", "0"))
+
+# pymongo.ASCENDING / DESCENDING; pymongo itself is only imported once indexes are built
+ASCENDING, DESCENDING = 1, -1
+
+
+def _timestamp_index():
+    from pymongo import IndexModel
+
+    if TURN_TTL_DAYS > 0:
+        return IndexModel([("timestamp", ASCENDING)], name="timestamp_ttl",
+                          expireAfterSeconds=TURN_TTL_DAYS * 24 * 3600)
+    return IndexModel([("timestamp", ASCENDING)], name="timestamp")
+
+
+def declared_indexes() -> dict:
+    from pymongo import IndexModel
+
+    return {
+        "interaction": [
+            IndexModel([("user_id", ASCENDING), ("topic", ASCENDING), ("timestamp", DESCENDING)],
+                       name="user_id_topic_timestamp"),
+            IndexModel([("topic", ASCENDING), ("timestamp", DESCENDING)], name="topic_timestamp"),
+            _timestamp_index(),
+        ],
+        "teacher": [_timestamp_index()],
+        "student": [_timestamp_index()],
+        "evaluator": [_timestamp_index()],
+        "scorer": [_timestamp_index()],
+    }
+
+
+# Queries the app runs per session or per message: (collection, filter, sort)
+HOT_QUERIES = [
+    ("interaction", {"user_id": "<probe>", "topic": "<probe>"}, [("timestamp", DESCENDING)]),
+    ("interaction", {"topic": "<probe>"}, [("timestamp", DESCENDING)]),
+    ("student", {"_id": {"$in": ["<probe>"]}}, [("timestamp", ASCENDING)]),
+    # student_memory is only read by _id (user_id:topic), so it needs no index of its own
+    ("student_memory", {"_id": "<probe>"}, None),
+    ("scorer", {"timestamp": {"$gte": datetime(2000, 1, 1)}}, None),
+]
+
+
+def ensure_indexes(database=None) -> dict:
+    """Create every declared index that is missing. Returns {collection: [index names]}."""
+    from pymongo.errors import OperationFailure
+
+    database = get_db() if database is None else database
+    created = {}
+    for collection, indexes in declared_indexes().items():
+        try:
+            created[collection] = database[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # Usually an index with the same keys but other options (e.g. TTL toggled)
+            print(f"[schema] Could not create indexes on {collection}: {e}")
+    return created
+
+
+def _stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+def check_query_plans(database=None) -> list:
+    """Explain every hot query and return the ones whose winning plan scans the collection."""
+    from pymongo.errors import OperationFailure
+
+    database = get_db() if database is None else database
+    unindexed = []
+    for collection, filter, sort in HOT_QUERIES:
+        command = {"find": collection, "filter": filter}
+        if sort:
+            command["sort"] = dict(sort)
+        try:
+            explain = database.command("explain", command, verbosity="queryPlanner")
+        except OperationFailure as e:
+            print(f"[schema] Could not explain query on {collection}: {e}")
+            continue
+        stages = set(_stages(explain["queryPlanner"]["winningPlan"]))
+        if "COLLSCAN" in stages:
+            unindexed.append((collection, filter, sort))
+            print(f"[schema] WARNING: unindexed hot query on {collection}: filter={filter} sort={sort}")
+    return unindexed
+
+
+def bootstrap(database=None):
+    database = get_db() if database is None else database
+    created = ensure_indexes(database)
+    print(f"[schema] Indexes ensured: {created}")
+    return check_query_plans(database)
+
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def bootstrap_in_background():
+    """Run bootstrap() once per process on a daemon thread."""
+    global _started
+    with _started_lock:
+        if _started or not MONGO_AUTO_INDEX:
+            return
+        _started = True
+
+    def run():
+        try:
+            bootstrap()
+        except Exception as e:
+            print(f"[schema] Bootstrap failed: {e!r}")
+
+    threading.Thread(target=run, name="schema-bootstrap", daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create Mongo indexes and check query plans.")
+    parser.add_argument("--check", action="store_true", help="Only check query plans")
+    args = parser.parse_args()
+    unindexed = check_query_plans() if args.check else bootstrap()
+    print(f"[schema] {len(unindexed)} unindexed hot queries")
@@ -0,0 +1,238 @@
+"""
+Incrementally maintained scorer rollups for dashboards.
+
+Every scored turn adds its scores to a handful of rollup documents: per
+user, per topic, per (user, topic) and global, each for the turn's UTC day
+and for all time. A document keeps, per score field, the count, sum, sum of
+squares, min, max and a 10-bin histogram, so mean and variance come out of
+a single _id lookup:
+
+    get_rollup("user", user_id)                 # all-time summary
+    get_daily("topic", "CP", days=30)           # one point lookup per day
+
+A turn is counted at most once per document: each document remembers the
+interaction ids of its last ROLLUP_GUARD_SIZE turns and ignores a repeat,
+so a judge job retried after its rollups were written does not count twice.
+
+Seed the rollups from existing scorer documents with
+
+    python src/score_rollups.py --rebuild
+"""
+import os
+import math
+import argparse
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+from db import get_db, get_async_db, collection, async_collection
+
+load_dotenv()
+SCORE_FIELDS = ("overall_score", "teacher_clarity", "teacher_completeness",
+                "student_understanding", "student_engagement")
+HIST_BINS = 10
+ALL_TIME = "all"
+# Interaction ids remembered per rollup document to recognise a retried turn
+ROLLUP_GUARD_SIZE = int(os.getenv("ROLLUP_GUARD_SIZE", "1000"))
+DUPLICATE_KEY = 11000
+# Rollup reads never need the guard list
+_NO_GUARD = {"turns": 0}
+
+
+def rollup_id(scope: str, key: str, period: str = ALL_TIME) -> str:
+    return f"{scope}|{key}|{period}"
+
+
+def _scopes(user_id: str, topic: str):
+    yield "user", user_id
+    yield "topic", topic
+    yield "user_topic", f"{user_id}|{topic}"
+    yield "global", "*"
+
+
+def _bin(value: float) -> str:
+    return f"b{min(HIST_BINS - 1, max(0, int(value * HIST_BINS)))}"
+
+
+def rollup_update(scores: dict) -> dict:
+    """The $inc/$min/$max update that adds one turn's scores to a rollup document."""
+    inc, low, high = {"count": 1}, {}, {}
+    for field in SCORE_FIELDS:
+        value = float(scores[field])
+        inc[f"{field}.sum"] = value
+        inc[f"{field}.sumsq"] = value * value
+        inc[f"{field}.hist.{_bin(value)}"] = 1
+        low[f"{field}.min"] = value
+        high[f"{field}.max"] = value
+    return {"$inc": inc, "$min": low, "$max": high}
+
+
+def rollup_ops(user_id: str, topic: str, scores: dict, when: datetime = None, interaction_id: str = None):
+    """
+    (filter, update) pairs for every rollup document a turn contributes to.
+
+    With `interaction_id`, an update only matches a document that has not
+    counted that turn yet, and records it in the document's guard list.
+    """
+    day = (when or datetime.utcnow()).strftime("%Y-%m-%d")
+    update = rollup_update(scores)
+    for scope, key in _scopes(user_id, topic or "-"):
+        for period in (day, ALL_TIME):
+            filter = {"_id": rollup_id(scope, key, period)}
+            doc_update = {**update, "$setOnInsert": {"scope": scope, "key": key, "period": period}}
+            if interaction_id is not None:
+                filter["turns"] = {"$ne": interaction_id}
+                doc_update["$push"] = {"turns": {"$each": [interaction_id], "$slice": -ROLLUP_GUARD_SIZE}}
+            yield filter, doc_update
+
+
+async def record_scores(interaction_id: str, user_id: str, topic: str, scorer_model, database=None):
+    """
+    Add one scored turn to its rollups. Written directly, not through the
+    write-behind buffer, so a judge job is only completed once its rollups
+    are stored; calling it again for the same turn changes nothing.
+    """
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    scores = scorer_model.dict() if hasattr(scorer_model, "dict") else scorer_model
+    rollups = (get_async_db() if database is None else database)["score_rollups"]
+    pending = list(rollup_ops(user_id, topic, scores, interaction_id=interaction_id))
+    while pending:
+        try:
+            await rollups.bulk_write([UpdateOne(f, u, upsert=True) for f, u in pending], ordered=False)
+            return
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            # The upsert met an existing document: either it counted this turn
+            # already, or another turn's upsert created it first and we try again
+            retry = []
+            for error in errors:
+                filter, update = pending[error["index"]]
+                if await rollups.find_one({"_id": filter["_id"], "turns": interaction_id}, {"_id": 1}) is None:
+                    retry.append((filter, update))
+            pending = retry
+
+
+# ------------------- QUERIES ------------------- #
+
+def summarize(doc: dict) -> dict:
+    """Count, mean, variance, std, min, max and histogram per field of a rollup document."""
+    if not doc:
+        return {"count": 0, "fields": {}}
+    n = doc["count"]
+    fields = {}
+    for field in SCORE_FIELDS:
+        stats = doc.get(field)
+        if not stats:
+            continue
+        mean = stats["sum"] / n
+        variance = max(0.0, stats["sumsq"] / n - mean * mean)
+        fields[field] = {
+            "mean": mean,
+            "variance": variance,
+            "std": math.sqrt(variance),
+            "min": stats["min"],
+            "max": stats["max"],
+            "hist": [stats.get("hist", {}).get(f"b{i}", 0) for i in range(HIST_BINS)],
+        }
+    return {"scope": doc.get("scope"), "key": doc.get("key"), "period": doc.get("period"),
+            "count": n, "fields": fields}
+
+
+def _day_ids(scope: str, key: str, days: int, until: datetime = None):
+    until = until or datetime.utcnow()
+    return [rollup_id(scope, key, (until - timedelta(days=i)).strftime("%Y-%m-%d")) for i in range(days)][::-1]
+
+
+def _daily(ids: list, docs: dict) -> list:
+    out = []
+    for doc_id in ids:
+        summary = summarize(docs.get(doc_id))
+        summary["period"] = doc_id.rsplit("|", 1)[1]
+        out.append(summary)
+    return out
+
+
+def get_rollup(scope: str, key: str, period: str = ALL_TIME) -> dict:
+    return summarize(collection("score_rollups").find_one({"_id": rollup_id(scope, key, period)}, _NO_GUARD))
+
+
+def get_daily(scope: str, key: str, days: int = 30, until: datetime = None) -> list:
+    """One summary per day, oldest first; days without turns have count 0."""
+    ids = _day_ids(scope, key, days, until)
+    docs = {d["_id"]: d for d in collection("score_rollups").find({"_id": {"$in": ids}}, _NO_GUARD)}
+    return _daily(ids, docs)
+
+
+async def aget_rollup(scope: str, key: str, period: str = ALL_TIME) -> dict:
+    return summarize(await async_collection("score_rollups").find_one({"_id": rollup_id(scope, key, period)},
+                                                                      _NO_GUARD))
+
+
+async def aget_daily(scope: str, key: str, days: int = 30, until: datetime = None) -> list:
+    ids = _day_ids(scope, key, days, until)
+    docs = {d["_id"]: d async for d in async_collection("score_rollups").find({"_id": {"$in": ids}}, _NO_GUARD)}
+    return _daily(ids, docs)
+
+
+# ------------------- REBUILD ------------------- #
+
+def rebuild(database=None, batch_size: int = 1000) -> int:
+    """
+    Recompute every rollup from the scorer and interaction collections.
+    Returns turns counted. Run it while no turns are being scored.
+    """
+    from pymongo import UpdateOne
+
+    database = get_db() if database is None else database
+    database["score_rollups"].delete_many({})
+    turns, ops, batch = 0, [], []
+
+    def add(scorers):
+        nonlocal turns
+        interactions = {
+            i["_id"]: i for i in database["interaction"].find(
+                {"_id": {"$in": [s["_id"] for s in scorers]}}, {"user_id": 1, "topic": 1})
+        }
+        for scorer in scorers:
+            interaction = interactions.get(scorer["_id"])
+            if not interaction:
+                continue
+            for filter, update in rollup_ops(interaction["user_id"], interaction.get("topic"), scorer,
+                                             when=scorer.get("timestamp"), interaction_id=scorer["_id"]):
+                ops.append(UpdateOne(filter, update, upsert=True))
+            turns += 1
+
+    for scorer in database["scorer"].find({}, batch_size=batch_size):
+        batch.append(scorer)
+        if len(batch) >= batch_size:
+            add(batch)
+            batch = []
+            if ops:
+                database["score_rollups"].bulk_write(ops, ordered=False)
+                ops.clear()
+    if batch:
+        add(batch)
+    if ops:
+        database["score_rollups"].bulk_write(ops, ordered=False)
+    return turns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or inspect scorer rollups.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute all rollups from stored turns")
+    parser.add_argument("--scope", choices=["user", "topic", "user_topic", "global"], default="global")
+    parser.add_argument("--key", default="*")
+    parser.add_argument("--days", type=int, default=0, help="Show the last N days instead of all time")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"[rollups] Rebuilt rollups from {rebuild()} scored turns")
+    if args.days:
+        for day in get_daily(args.scope, args.key, args.days):
+            overall = day["fields"].get("overall_score", {})
+            print(f"{day['period']}  n={day['count']:<5} overall={overall.get('mean', float('nan')):.3f}")
+    else:
+        print(get_rollup(args.scope, args.key))
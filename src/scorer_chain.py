@@ -1,6 +1,8 @@
 from langchain.prompts import ChatPromptTemplate
 from langchain.chains import LLMChain
 from langchain.output_parsers import PydanticOutputParser
+from token_budget import BudgetedChain
+from response_cache import with_cache
 from models import ScorerResponse
 
 
@@ -11,7 +13,7 @@ You are given the following details of a single interaction:
 - teacher_explanation: What the teacher explained.
 - student_question: The initial question asked by the student.
 - student_followup_question: Any follow-up question from the student.
-- student_response: The response of the student (message, rating, reflection, missing_points).
+- student_response: The response of the student (rating, reflection, missing_points).
 - evaluator_comments: Qualitative feedback from the evaluator.
 
 Your task is to produce a **quantitative evaluation** of the interaction as a JSON object
@@ -53,4 +55,4 @@ def build_scorer_chain(llm):
     )
 
     chain = LLMChain(llm=llm, prompt=prompt, output_parser=parser)
-    return chain
+    return with_cache(BudgetedChain(chain, "scorer"))
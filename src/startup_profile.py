@@ -0,0 +1,132 @@
+"""
+Import-time profile of the app (or any module), from `python -X importtime`.
+
+Every run imports the module in a fresh interpreter. The report gives the
+total import time, the modules with the largest cumulative import time and
+the self time grouped by top-level package. Examples:
+
+    python src/startup_profile.py                     # import main
+    python src/startup_profile.py --module judge_worker --top 40
+    python src/startup_profile.py --runs 5 --compare bench_results/old.json
+"""
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from pathlib import Path
+from collections import defaultdict
+
+from bench_utils import ROOT, git_commit
+
+SRC = Path(__file__).resolve().parent
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Profile import time per module.")
+    parser.add_argument("--module", default="main", help="Module to import (from src/)")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to run; the fastest is reported")
+    parser.add_argument("--top", type=int, default=25, help="Modules to list by cumulative time")
+    parser.add_argument("--out", type=Path, default=None, help="Where to write the JSON report")
+    parser.add_argument("--compare", type=Path, default=None, help="Previous report to diff against")
+    return parser.parse_args()
+
+
+def profile_once(module: str) -> dict:
+    """Import `module` in a new interpreter; wall time plus per-module self/cumulative microseconds."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        tail = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")][-5:]
+        raise RuntimeError(f"import {module} failed:\n" + "\n".join(tail))
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({"module": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us),
+                            "depth": len(indent) // 2})
+    return {"wall_s": wall, "modules": modules}
+
+
+def summarize(run: dict, top: int) -> dict:
+    modules = run["modules"]
+    by_package = defaultdict(int)
+    for m in modules:
+        by_package[m["module"].split(".")[0]] += m["self_us"]
+    imports_s = sum(m["self_us"] for m in modules) / 1e6
+    return {
+        "wall_s": round(run["wall_s"], 3),
+        "imports_s": round(imports_s, 3),
+        "modules": len(modules),
+        "slowest": [
+            {"module": m["module"], "cumulative_s": round(m["cumulative_us"] / 1e6, 4),
+             "self_s": round(m["self_us"] / 1e6, 4)}
+            for m in sorted(modules, key=lambda m: m["cumulative_us"], reverse=True)[:top]
+        ],
+        "packages": {
+            name: round(us / 1e6, 4)
+            for name, us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        },
+    }
+
+
+def compare(current: dict, previous_path: Path):
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\n[startup] vs {previous_path} (commit {previous.get('commit', '?')[:8]})")
+    for key in ("wall_s", "imports_s", "modules"):
+        old, new = previous.get("summary", {}).get(key), current["summary"][key]
+        if isinstance(old, (int, float)) and old:
+            print(f"[startup]   {key:<10} {old:>10.3f} -> {new:>10.3f} ({(new - old) / old:+.1%})")
+    old_packages = previous.get("summary", {}).get("packages", {})
+    for name, seconds in current["summary"]["packages"].items():
+        if name in old_packages:
+            print(f"[startup]   {name:<30} {old_packages[name]:>8.3f} -> {seconds:>8.3f}")
+        else:
+            print(f"[startup]   {name:<30} {'new':>8} -> {seconds:>8.3f}")
+
+
+def main():
+    args = parse_args()
+    runs = [profile_once(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda r: r["wall_s"])
+    summary = summarize(best, args.top)
+
+    print(f"[startup] import {args.module}: {summary['wall_s']:.3f}s wall, "
+          f"{summary['imports_s']:.3f}s in {summary['modules']} module imports (best of {args.runs})")
+    for m in summary["slowest"]:
+        print(f"[startup]   {m['cumulative_s']:>8.3f}s  {m['self_s']:>8.3f}s self  {m['module']}")
+    print("[startup] By package (self time):")
+    for name, seconds in summary["packages"].items():
+        print(f"[startup]   {seconds:>8.3f}s  {name}")
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "module": args.module,
+        "runs_wall_s": [round(r["wall_s"], 3) for r in runs],
+        "summary": summary,
+    }
+    out = args.out or ROOT / "bench_results" / f"startup_{result['commit'][:8]}_{args.module}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4)
+    print(f"[startup] Report written to {out}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
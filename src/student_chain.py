@@ -1,10 +1,11 @@
 import os
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain.prompts import ChatPromptTemplate
 from langchain.chains import LLMChain
 from langchain.output_parsers import PydanticOutputParser
+from token_budget import BudgetedChain
+from response_cache import with_cache
 from models import StudentResponse
+from vectorstore_registry import topic_store
 
 API_KEY = os.getenv("OPENROUTER_API_KEY")
 
@@ -38,22 +39,13 @@ Respond ONLY in valid JSON that matches this schema:
 
 
 def build_student_chain(llm, topic: str, catalog: dict):
-    """Return (LLM chain, vectorstore) for a given topic using catalog path."""
-    # Embeddings
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-
-    # Get vectorstore path from catalog
+    """Return (LLM chain, vectorstore) for a given topic using its catalog entry."""
     topic_info = catalog.get(topic)
     if not topic_info:
         raise ValueError(f"Topic '{topic}' not found in catalog")
 
-    vs_path = topic_info["vectorstore_path"]
-
-    # Load Chroma for this topic
-    vs = Chroma(
-        persist_directory=vs_path,
-        embedding_function=embeddings
-    )
+    # Shared Chroma for this topic (or its view of the shared collection), opened once per process
+    vs = topic_store(topic, topic_info)
 
     # Parser
     parser = PydanticOutputParser(pydantic_object=StudentResponse)
@@ -66,4 +58,4 @@ def build_student_chain(llm, topic: str, catalog: dict):
     # Chain
     chain = LLMChain(llm=llm, prompt=prompt, output_parser=parser)
 
-    return chain, vs
+    return with_cache(BudgetedChain(chain, "student")), vs
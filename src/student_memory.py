@@ -0,0 +1,137 @@
+import os
+from datetime import datetime
+from typing import List
+from dotenv import load_dotenv
+
+from db import async_collection
+from models import StudentResponse
+
+load_dotenv()
+# Student responses kept verbatim; older ones are folded into the summary
+STUDENT_MEMORY_RECENT = int(os.getenv("STUDENT_MEMORY_RECENT", "10"))
+# Cap on distinct missing points / reflections carried in the summary
+STUDENT_MEMORY_MAX_POINTS = int(os.getenv("STUDENT_MEMORY_MAX_POINTS", "20"))
+STUDENT_MEMORY_MAX_REFLECTIONS = int(os.getenv("STUDENT_MEMORY_MAX_REFLECTIONS", "3"))
+
+
+def empty_summary() -> dict:
+    return {"turns": 0, "ratings": {}, "missing_points": [], "reflections": []}
+
+
+def fold_into_summary(summary: dict, responses: List[StudentResponse]) -> dict:
+    """Merge older responses into the rolling summary, keeping it bounded in size."""
+    summary = {**empty_summary(), **(summary or {})}
+    ratings = dict(summary["ratings"])
+    points = list(summary["missing_points"])
+    reflections = list(summary["reflections"])
+
+    for r in responses:
+        ratings[r.rating] = ratings.get(r.rating, 0) + 1
+        for p in r.missing_points:
+            if p in points:
+                points.remove(p)
+            points.append(p)  # most recent last
+        if r.reflection:
+            reflections.append(r.reflection)
+
+    summary["turns"] += len(responses)
+    summary["ratings"] = ratings
+    summary["missing_points"] = points[-STUDENT_MEMORY_MAX_POINTS:]
+    summary["reflections"] = reflections[-STUDENT_MEMORY_MAX_REFLECTIONS:]
+    return summary
+
+
+class StudentMemory:
+    """
+    What the student has said so far, for one user and topic.
+
+    Loaded once per chat session and extended in place after every student
+    response, so a turn costs one small write regardless of history length.
+    The backing document in `student_memory` holds the last
+    STUDENT_MEMORY_RECENT responses plus a summary of everything before.
+
+    Each write carries `seq`, the number of responses it includes, and only
+    applies to an older document: a write that arrives late (e.g. retried
+    by the write-behind buffer) cannot roll the memory back.
+    """
+
+    def __init__(self, user_id: str, topic: str, recent: List[StudentResponse] = None, summary: dict = None):
+        self.user_id = user_id
+        self.topic = topic
+        self.recent = recent or []
+        self.summary = summary or empty_summary()
+
+    @property
+    def doc_id(self) -> str:
+        return f"{self.user_id}:{self.topic}"
+
+    @property
+    def seq(self) -> int:
+        return self.summary["turns"] + len(self.recent)
+
+    @classmethod
+    async def load(cls, user_id: str, topic: str) -> "StudentMemory":
+        memory = cls(user_id, topic)
+        doc = await async_collection("student_memory").find_one({"_id": memory.doc_id})
+        if doc is not None:
+            memory.recent = [StudentResponse(**r) for r in doc.get("recent", [])]
+            memory.summary = {**empty_summary(), **doc.get("summary", {})}
+        else:
+            await memory._backfill()
+        return memory
+
+    async def _latest_interactions(self, filter: dict) -> list:
+        cursor = async_collection("interaction").find(
+            {"user_id": self.user_id, **filter}, {"_id": 1}
+        ).sort("timestamp", -1).limit(STUDENT_MEMORY_RECENT)
+        return [i["_id"] async for i in cursor]
+
+    async def _backfill(self):
+        """
+        Seed a new rolling store from the user's latest stored responses on
+        this topic; interactions stored before they carried a topic are used
+        when there are none.
+        """
+        ids = await self._latest_interactions({"topic": self.topic})
+        if not ids:
+            ids = await self._latest_interactions({"topic": {"$exists": False}})
+        if not ids:
+            return
+        docs = async_collection("student").find({"_id": {"$in": ids}}).sort("timestamp", 1)
+        self.recent = [
+            StudentResponse(**{k: v for k, v in doc.items() if k not in ("_id", "timestamp")})
+            async for doc in docs
+        ]
+
+    def prompt_view(self) -> dict:
+        """What the student chain gets as `student_memory`."""
+        return {"summary": self.summary, "recent": self.recent}
+
+    async def append(self, response: StudentResponse, buffer=None):
+        """Add a response; with a write-behind `buffer` the upsert is queued instead of awaited."""
+        self.recent.append(response)
+        if len(self.recent) > STUDENT_MEMORY_RECENT:
+            overflow = self.recent[:-STUDENT_MEMORY_RECENT]
+            self.recent = self.recent[-STUDENT_MEMORY_RECENT:]
+            self.summary = fold_into_summary(self.summary, overflow)
+
+        update = {
+            "$set": {
+                "recent": [r.dict() for r in self.recent],
+                "summary": self.summary,
+                "seq": self.seq,
+                "updated_at": datetime.utcnow(),
+            },
+            "$setOnInsert": {"user_id": self.user_id, "topic": self.topic},
+        }
+        # A newer document does not match, so the upsert hits a duplicate _id instead of
+        # overwriting it (the buffer treats duplicate keys as already written)
+        filter = {"_id": self.doc_id, "seq": {"$not": {"$gte": self.seq}}}
+        if buffer is not None:
+            buffer.update("student_memory", filter, update, upsert=True)
+            return
+        from pymongo.errors import DuplicateKeyError
+        try:
+            await async_collection("student_memory").update_one(filter, update, upsert=True)
+        except DuplicateKeyError:
+            pass
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from langchain_core.exceptions import OutputParserException
+
+import metrics
+from llm_registry import model_name
+
+load_dotenv()
+# Input-token budgets per chain role (prompt template + inputs)
+TOKEN_BUDGETS = {
+    "student": int(os.getenv("TOKEN_BUDGET_STUDENT", "3000")),
+    "evaluator": int(os.getenv("TOKEN_BUDGET_EVALUATOR", "3000")),
+    "scorer": int(os.getenv("TOKEN_BUDGET_SCORER", "2500")),
+    "judge": int(os.getenv("TOKEN_BUDGET_JUDGE", "3500")),
+}
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken missing or encoding files unavailable offline
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+# ------------------- COMPACT SERIALIZATION ------------------- #
+
+def _prune(obj):
+    if isinstance(obj, dict):
+        return {k: _prune(v) for k, v in obj.items() if v not in (None, "", [], {})}
+    if isinstance(obj, list):
+        return [_prune(v) for v in obj]
+    return obj
+
+
+def compact_json(obj) -> str:
+    """JSON without whitespace or empty fields."""
+    if hasattr(obj, "dict"):
+        obj = obj.dict()
+    return json.dumps(_prune(obj), separators=(",", ":"), ensure_ascii=False)
+
+
+def truncate_middle(text: str, max_tokens: int) -> str:
+    """Keep the start and end of `text`, cutting the middle to roughly `max_tokens`."""
+    if not text or count_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(40, max_tokens * 4)
+    head = text[: max_chars * 2 // 3]
+    tail = text[-(max_chars // 3):]
+    return f"{head} […] {tail}"
+
+
+def render_student_memory(view, max_recent: int = None, with_summary: bool = True) -> str:
+    """
+    Render StudentMemory.prompt_view() as a few compact lines.
+
+    Missing points are listed once, even if several turns repeated them.
+    """
+    if not view:
+        return "(nothing yet)"
+    if isinstance(view, list):  # plain list of StudentResponse
+        view = {"summary": None, "recent": view}
+
+    lines = []
+    summary = view.get("summary") or {}
+    if with_summary and summary.get("turns"):
+        ratings = ", ".join(f"{k}: {v}" for k, v in summary.get("ratings", {}).items())
+        lines.append(f"Earlier ({summary['turns']} turns; {ratings})")
+        for reflection in summary.get("reflections", []):
+            lines.append(f"- {reflection}")
+
+    recent = view.get("recent") or []
+    if max_recent is not None:
+        recent = recent[-max_recent:] if max_recent > 0 else []
+
+    seen = set(summary.get("missing_points", [])) if with_summary else set()
+    for r in recent:
+        line = f"[{r.rating}] {r.reflection}"
+        if r.message:
+            line += f" | asked: {r.message}"
+        new_points = [p for p in r.missing_points if p not in seen]
+        seen.update(new_points)
+        if new_points:
+            line += f" | missing: {'; '.join(new_points)}"
+        lines.append(line)
+
+    if with_summary and summary.get("missing_points"):
+        lines.append(f"Still unclear from earlier: {'; '.join(summary['missing_points'])}")
+    return "\n".join(lines) or "(nothing yet)"
+
+
+# ------------------- PER-ROLE COMPACTION ------------------- #
+
+def compact_student_inputs(inputs: dict, level: int) -> dict:
+    """Level 0 renders memory compactly; higher levels keep fewer turns, then trim the explanation."""
+    view = inputs.get("student_memory")
+    if isinstance(view, str):
+        return inputs
+    recent = (view or {}).get("recent", []) if isinstance(view, dict) else (view or [])
+    max_recent = None if level == 0 else max(0, len(recent) >> level)
+    out = {**inputs, "student_memory": render_student_memory(view, max_recent, with_summary=level < 4)}
+    if level >= 5:
+        out["teacher_explanation"] = truncate_middle(inputs["teacher_explanation"], 1500 >> (level - 5))
+    return out
+
+
+def compact_judge_inputs(inputs: dict, level: int) -> dict:
+    """
+    Level 0 drops the student's message from the response JSON (it is already
+    passed as the follow-up question) and serializes JSON fields compactly;
+    higher levels trim the long free-text fields.
+    """
+    out = dict(inputs)
+    if "student_response" in out:
+        try:
+            response = json.loads(out["student_response"]) if isinstance(out["student_response"], str) \
+                else dict(out["student_response"])
+            response.pop("message", None)
+            out["student_response"] = compact_json(response)
+        except (TypeError, ValueError):
+            pass
+    if "evaluator_comments" in out:
+        try:
+            comments = json.loads(out["evaluator_comments"]) if isinstance(out["evaluator_comments"], str) \
+                else out["evaluator_comments"]
+            out["evaluator_comments"] = compact_json(comments)
+        except (TypeError, ValueError):
+            pass
+    if level > 0:
+        limit = 2000 >> (level - 1)
+        for key in ("teacher_explanation", "expected_explanation"):
+            if out.get(key):
+                out[key] = truncate_middle(out[key], limit)
+    return out
+
+
+COMPACTORS = {
+    "student": compact_student_inputs,
+    "evaluator": compact_judge_inputs,
+    "scorer": compact_judge_inputs,
+    "judge": compact_judge_inputs,
+}
+
+
+# ------------------- CHAIN WRAPPER ------------------- #
+
+class BudgetedChain:
+    """
+    Wraps an LLMChain: compacts its inputs to fit the role's token budget and
+    keeps per-role input token counts.
+
+    Anything other than invoke/ainvoke is forwarded to the wrapped chain.
+    """
+
+    MAX_LEVEL = 8
+
+    def __init__(self, chain, role: str, budget: int = None):
+        self.chain = chain
+        self.role = role
+        self.budget = budget or TOKEN_BUDGETS[role]
+        self.compact = COMPACTORS[role]
+        self.calls = 0
+        self.input_tokens = 0
+        self.last_input_tokens = 0
+        self.over_budget = 0
+
+    def __getattr__(self, name):
+        return getattr(self.chain, name)
+
+    def rebind(self, llm):
+        """Point the chain at another model client; prompt and parser stay as they are."""
+        self.chain.llm = llm
+
+    def count(self, inputs: dict) -> int:
+        return count_tokens(self.chain.prompt.format(**inputs))
+
+    def prepare(self, inputs: dict) -> dict:
+        """Return the least-compacted version of `inputs` that fits the budget."""
+        level = 0
+        prepared = self.compact(inputs, level)
+        tokens = self.count(prepared)
+        while tokens > self.budget and level < self.MAX_LEVEL:
+            level += 1
+            prepared = self.compact(inputs, level)
+            tokens = self.count(prepared)
+
+        if level:
+            print(f"[tokens] {self.role}: compacted to level {level} ({tokens}/{self.budget} tokens)")
+        if tokens > self.budget:
+            self.over_budget += 1
+        self.calls += 1
+        self.input_tokens += tokens
+        self.last_input_tokens = tokens
+        return prepared
+
+    @contextmanager
+    def _observed(self):
+        """Stage timer for one call; counts parse failures separately."""
+        model = model_name(self.chain.llm)
+        try:
+            with metrics.stage(f"chain.{self.role}", model=model):
+                yield model
+        except OutputParserException:
+            metrics.parse_failures.inc(role=self.role, model=model)
+            raise
+
+    def _record(self, model: str, response: dict):
+        output = response["text"]
+        output = output.json() if hasattr(output, "json") else str(output)
+        metrics.record_tokens(self.role, model, self.last_input_tokens, count_tokens(output))
+
+    def invoke(self, inputs: dict, *args, **kwargs):
+        prepared = self.prepare(inputs)
+        with self._observed() as model:
+            response = self.chain.invoke(prepared, *args, **kwargs)
+        self._record(model, response)
+        return response
+
+    async def ainvoke(self, inputs: dict, *args, **kwargs):
+        prepared = self.prepare(inputs)
+        with self._observed() as model:
+            response = await self.chain.ainvoke(prepared, *args, **kwargs)
+        self._record(model, response)
+        return response
+
+    async def astream(self, inputs: dict, on_chunk=None) -> dict:
+        """
+        Like ainvoke, but stream the raw completion, awaiting `on_chunk(text)`
+        for every piece. The full text is parsed once the stream ends.
+        """
+        prepared = self.prepare(inputs)
+        messages = self.chain.prompt.format_messages(**prepared)
+        parts = []
+        with self._observed() as model:
+            start = time.perf_counter()
+            async for chunk in self.chain.llm.astream(messages):
+                text = getattr(chunk, "content", chunk)
+                if not text:
+                    continue
+                if not parts:
+                    metrics.stage_seconds.observe(time.perf_counter() - start,
+                                                  stage=f"chain.{self.role}.first_token", model=model)
+                parts.append(text)
+                if on_chunk is not None:
+                    await on_chunk(text)
+            response = {**prepared, "text": self.chain.output_parser.parse("".join(parts))}
+        self._record(model, response)
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "role": self.role,
+            "budget": self.budget,
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "last_input_tokens": self.last_input_tokens,
+            "over_budget": self.over_budget,
+        }
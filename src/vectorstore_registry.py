@@ -0,0 +1,223 @@
+"""
+Process-wide Chroma stores and the per-topic / shared storage layouts.
+
+With VS_LAYOUT=per_topic (default) every topic has its own persist
+directory, VS_DIR/<topic>. With VS_LAYOUT=shared all topics live in one
+collection (VS_SHARED_COLLECTION in VS_DIR/shared); every chunk carries
+`topic`, `source` (file name) and `page` metadata, and a TopicView limits
+reads to one topic. Move existing per-topic stores over with
+src/migrate_vectorstore.py.
+
+With VS_BACKEND=numpy, sessions read from the topic's exported NumPy index
+instead, when there is one.
+"""
+import os
+import time
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+VS_DIR = Path(os.getenv("VS_DIR", Path(__file__).resolve().parents[1] / "vectorstore"))
+# "per_topic": one Chroma directory per topic; "shared": one collection for the deployment
+VS_LAYOUT = os.getenv("VS_LAYOUT", "per_topic")
+VS_SHARED_COLLECTION = os.getenv("VS_SHARED_COLLECTION", "course_chunks")
+SHARED_DIR = VS_DIR / "shared"
+# "chroma", or "numpy" to serve sessions from memory-mapped indexes (see numpy_index.py)
+VS_BACKEND = os.getenv("VS_BACKEND", "chroma")
+# Close stores nobody has asked for in this many seconds
+VS_IDLE_TTL = float(os.getenv("VS_IDLE_TTL", "1800"))
+# Upper bound on stores kept open at once (least recently used go first)
+VS_MAX_OPEN = int(os.getenv("VS_MAX_OPEN", "8"))
+
+VERSION_FILE = ".version"
+
+_lock = threading.Lock()
+_stores = OrderedDict()  # persist dir (+ collection) -> {"vs", "version", "last_used"}
+_embeddings = None
+
+
+def get_embeddings():
+    """Process-wide embedding client used for query embeddings."""
+    global _embeddings
+    with _lock:
+        if _embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+            _embeddings = OpenAIEmbeddings(model=EMBED_MODEL)
+        return _embeddings
+
+
+def store_version(vs_path) -> str:
+    """Version stamp ingest writes after changing a store; None for older stores."""
+    try:
+        return (Path(vs_path) / VERSION_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+
+
+def write_store_version(vs_path):
+    Path(vs_path).mkdir(parents=True, exist_ok=True)
+    (Path(vs_path) / VERSION_FILE).write_text(str(time.time()), encoding="utf-8")
+
+
+def _evict(now: float):
+    for path in [p for p, e in _stores.items() if now - e["last_used"] > VS_IDLE_TTL]:
+        del _stores[path]
+        print(f"[vs-registry] Closed idle store {path}")
+    while len(_stores) > VS_MAX_OPEN:
+        path, _ = _stores.popitem(last=False)
+        print(f"[vs-registry] Closed least recently used store {path}")
+
+
+def get_vectorstore(vs_path, collection_name: str = None):
+    """
+    Return the shared Chroma store for `vs_path`, opening it on first use.
+
+    A store is reopened when its on-disk version stamp changed since it was
+    opened, i.e. after a re-ingestion.
+    """
+    vs_path = str(vs_path)
+    key = f"{vs_path}::{collection_name}" if collection_name else vs_path
+    return _get_cached(key, vs_path, lambda: open_chroma(vs_path, collection_name))
+
+
+def _get_cached(key: str, vs_path: str, opener):
+    version = store_version(vs_path)
+    now = time.time()
+
+    with _lock:
+        _evict(now)
+        entry = _stores.get(key)
+        if entry is not None and entry["version"] == version:
+            entry["last_used"] = now
+            _stores.move_to_end(key)
+            return entry["vs"]
+
+        if entry is not None:
+            print(f"[vs-registry] {key} changed on disk, reloading")
+
+    vs = opener()
+
+    with _lock:
+        # Another thread may have opened it meanwhile; keep whichever is current
+        entry = _stores.get(key)
+        if entry is not None and entry["version"] == version:
+            vs = entry["vs"]
+        else:
+            _stores[key] = {"vs": vs, "version": version, "last_used": now}
+        _stores[key]["last_used"] = now
+        _stores.move_to_end(key)
+        _evict(now)
+    return vs
+
+
+def open_chroma(vs_path, collection_name: str = None, embeddings=None):
+    """A new (unregistered) Chroma handle; ingest and the migration tool write through these."""
+    # Deferred: chromadb is the slowest import of the app
+    from langchain_community.vectorstores import Chroma
+
+    kwargs = {"collection_name": collection_name} if collection_name else {}
+    return Chroma(persist_directory=str(vs_path), embedding_function=embeddings or get_embeddings(), **kwargs)
+
+
+def open_stores():
+    with _lock:
+        return list(_stores)
+
+
+def chroma_collection(vs):
+    """
+    The chromadb collection behind a LangChain Chroma store or a TopicView.
+
+    The wrapper has no public way to add precomputed embeddings (add_texts
+    embeds again), so writers that already have the vectors upsert through
+    this; it is the only place that reaches into the wrapper's private
+    `_collection`.
+    """
+    if isinstance(vs, TopicView):
+        vs = vs.vs
+    return vs._collection
+
+
+# ------------------- SHARED LAYOUT ------------------- #
+
+def topic_filter(topic: str, filter: dict = None) -> dict:
+    """Chroma `where` clause for `topic`, and-ed with any extra metadata filter."""
+    clauses = [{"topic": topic}] + [{k: v} for k, v in (filter or {}).items()]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class TopicView:
+    """
+    One topic of the shared collection.
+
+    Searches and reads are filtered on the chunk's `topic` metadata; writes,
+    deletes and anything else go straight to the underlying store (chunk ids
+    are already prefixed with the topic).
+    """
+
+    def __init__(self, vs, topic: str):
+        self.vs = vs
+        self.topic = topic
+
+    def __getattr__(self, name):
+        return getattr(self.vs, name)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.vs.similarity_search(query, k=k, filter=topic_filter(self.topic, filter), **kwargs)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.vs.similarity_search_with_score(query, k=k, filter=topic_filter(self.topic, filter), **kwargs)
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.vs.max_marginal_relevance_search(query, k=k, filter=topic_filter(self.topic, filter),
+                                                     **kwargs)
+
+    def get(self, ids=None, where: dict = None, **kwargs):
+        # Also filtered when asking by id, so a view never returns another topic's chunks
+        return self.vs.get(ids=ids, where=topic_filter(self.topic, where), **kwargs)
+
+
+def shared_store():
+    return get_vectorstore(SHARED_DIR, VS_SHARED_COLLECTION)
+
+
+def get_numpy_index(topic: str):
+    """The memory-mapped index of `topic`, or None if it was never exported."""
+    from numpy_index import NumpyIndex, index_path, index_exists
+
+    path = index_path(topic)
+    if not index_exists(path):
+        return None
+    return _get_cached(f"{path}::numpy", str(path), lambda: NumpyIndex(path, get_embeddings()))
+
+
+def topic_store(topic: str, topic_info: dict = None, backend: str = None):
+    """
+    The store a session of `topic` reads from: its NumPy index with
+    VS_BACKEND=numpy, else its own directory for per-topic catalog entries
+    (those with a vectorstore_path), else a TopicView of the shared collection.
+    """
+    if (backend or VS_BACKEND) == "numpy":
+        index = get_numpy_index(topic)
+        if index is not None:
+            return index
+        print(f"[vs-registry] No NumPy index for {topic}, using Chroma")
+    if topic_info and topic_info.get("vectorstore_path"):
+        return get_vectorstore(topic_info["vectorstore_path"])
+    return TopicView(shared_store(), topic)
+
+
+def search(query: str, k: int = 4, topics=None, source: str = None, page: int = None):
+    """Similarity search across topics of the shared collection, filtered on any of the tags."""
+    clauses = []
+    if topics:
+        clauses.append({"topic": {"$in": list(topics)}})
+    if source is not None:
+        clauses.append({"source": source})
+    if page is not None:
+        clauses.append({"page": page})
+    where = None if not clauses else clauses[0] if len(clauses) == 1 else {"$and": clauses}
+    return shared_store().similarity_search(query, k=k, filter=where)
@@ -0,0 +1,39 @@
+"""
+Shared setup: the app modules live flat in src/ and read their settings from
+the environment at import time, so every path points into a scratch
+directory before any of them is imported.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+SCRATCH = Path(tempfile.mkdtemp(prefix="ltb-tests-"))
+os.environ.update({
+    "DATA_DIR": str(SCRATCH / "data"),
+    "VS_DIR": str(SCRATCH / "vectorstore"),
+    "MEMORY_DIR": str(SCRATCH / "memory"),
+    "JUDGE_QUEUE_PATH": str(SCRATCH / "judge_queue.sqlite3"),
+    "WRITE_DEAD_LETTER_PATH": str(SCRATCH / "write_dead_letter.jsonl"),
+    "VS_LAYOUT": "per_topic",
+    "VS_BACKEND": "chroma",
+    "EMBED_CACHE": "0",
+    "MONGO_AUTO_INDEX": "0",
+    "METRICS_TRACE_PATH": "",
+})
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+@pytest.fixture
+def memory_db():
+    """A fakes.MemoryDatabase behind db.get_db() / get_async_db()."""
+    import db
+    from fakes import MemoryDatabase
+
+    database = MemoryDatabase()
+    saved = db._db, db._async_db
+    db._db, db._async_db = database, database.async_view()
+    yield database
+    db._db, db._async_db = saved
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+import embed_scheduler
+from embed_scheduler import embed_and_write, embed_with_retry, iter_in_thread, token_batches
+from fakes import HashEmbeddings
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FlakyEmbeddings(HashEmbeddings):
+    """Raises the queued errors first, then embeds; records every batch it was sent."""
+
+    def __init__(self, errors=(), fail_on=None):
+        super().__init__(dim=8)
+        self.errors = list(errors)
+        self.fail_on = fail_on
+        self.batches = []
+
+    async def aembed_documents(self, texts):
+        self.batches.append(list(texts))
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.fail_on is not None and self.fail_on in texts:
+            raise StatusError(400)
+        return await super().aembed_documents(texts)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.rows.update(zip(ids, documents))
+
+
+class FakeStore:
+    def __init__(self):
+        self._collection = FakeCollection()
+
+
+def chunks(n: int):
+    return [(f"c{i}", Document(page_content=f"chunk {i}", metadata={"i": i, "skip": [1]})) for i in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(embed_scheduler.random, "uniform", lambda a, b: 0.0)
+
+
+def test_retries_rate_limits_and_server_errors():
+    embeddings = FlakyEmbeddings([StatusError(429), StatusError(503)])
+    vectors = asyncio.run(embed_with_retry(embeddings, ["a", "b"], max_retries=3))
+    assert len(vectors) == 2 and len(embeddings.batches) == 3
+
+
+def test_gives_up_on_client_errors_and_after_max_retries():
+    with pytest.raises(StatusError):
+        asyncio.run(embed_with_retry(FlakyEmbeddings([StatusError(400)]), ["a"], max_retries=3))
+
+    embeddings = FlakyEmbeddings([StatusError(429)] * 3)
+    with pytest.raises(StatusError):
+        asyncio.run(embed_with_retry(embeddings, ["a"], max_retries=2))
+    assert len(embeddings.batches) == 3
+
+
+def test_token_batches_respect_the_item_limit():
+    async def collect():
+        return [len(b) async for b in token_batches(chunks(10), max_tokens=10_000, max_items=4)]
+    assert asyncio.run(collect()) == [4, 4, 2]
+
+
+def test_embeds_and_writes_every_chunk_from_a_thread():
+    store = FakeStore()
+    written = asyncio.run(embed_and_write(store, iter_in_thread(iter(chunks(50)), maxsize=4), FlakyEmbeddings(),
+                                          max_in_flight=3, batch_tokens=20))
+    assert written == 50
+    assert store._collection.rows == {f"c{i}": f"chunk {i}" for i in range(50)}
+
+
+def test_first_fatal_error_stops_the_run():
+    store = FakeStore()
+    embeddings = FlakyEmbeddings(fail_on="chunk 4")
+    consumed = []
+
+    def items():
+        for item in chunks(200):
+            consumed.append(item[0])
+            yield item
+
+    with pytest.raises(StatusError):
+        asyncio.run(embed_and_write(store, items(), embeddings, max_in_flight=1, batch_tokens=5))
+
+    assert len(embeddings.batches) < 10
+    assert len(consumed) < 200
+    assert "c4" not in store._collection.rows
+
+
+def test_writer_error_is_raised():
+    class BrokenStore(FakeStore):
+        def __init__(self):
+            super().__init__()
+            self._collection.upsert = self.fail
+
+        def fail(self, **kwargs):
+            raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        asyncio.run(embed_and_write(BrokenStore(), chunks(20), FlakyEmbeddings(), batch_tokens=5))
@@ -0,0 +1,95 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache, cache_key
+from fakes import HashEmbeddings
+
+
+class CountingEmbeddings(HashEmbeddings):
+    def __init__(self):
+        super().__init__(dim=8)
+        self.sent = []
+
+    def embed_documents(self, texts):
+        self.sent.extend(texts)
+        return super().embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        self.sent.extend(texts)
+        return await super().aembed_documents(texts)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3", max_mb=1)
+    yield cache
+    cache.close()
+
+
+def test_round_trip_and_size_tracking(cache):
+    cache.put_many({"a": [0.5] * 4, "b": [1.0] * 8})
+    cache.put_many({"a": [0.25] * 16})  # replaced: its old size must not count twice
+
+    assert cache.get_many(["a", "b", "missing"]) == {"a": [0.25] * 16, "b": [1.0] * 8}
+    assert cache._total == cache._table_size() == (16 + 8) * 4
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3", max_mb=1000 * 4 / (1024 * 1024))  # 1000 floats
+    for i in range(3):
+        cache.put_many({f"k{i}": [float(i)] * 300})
+    cache.get_many(["k0"])  # k0 is now more recently used than k1
+
+    cache.put_many({"k3": [3.0] * 300})  # 4 x 1200 bytes is over the limit
+
+    assert sorted(cache.get_many([f"k{i}" for i in range(4)])) == ["k0", "k2", "k3"]
+    assert cache._total == cache._table_size() <= cache.max_bytes * 0.9
+    cache.close()
+
+
+def test_size_is_loaded_from_an_existing_file(tmp_path):
+    first = EmbeddingCache(tmp_path / "cache.sqlite3")
+    first.put_many({"a": [1.0] * 10})
+    first.close()
+
+    assert EmbeddingCache(tmp_path / "cache.sqlite3")._total == 40
+
+
+def test_only_misses_reach_the_provider(cache):
+    provider = CountingEmbeddings()
+    embeddings = CachedEmbeddings(provider, "m", cache)
+
+    first = embeddings.embed_documents(["one", "two", "one"])
+    second = embeddings.embed_documents(["two", "  two  ", "three"])
+
+    assert provider.sent == ["one", "two", "three"]
+    assert first[0] == first[2] and second[0] == second[1] == first[1]
+    stats = embeddings.stats()
+    assert (stats["requested"], stats["embedded"], stats["hits"], stats["deduped"]) == (6, 3, 2, 1)
+    assert cache_key("m", "two") != cache_key("other", "two")
+
+
+def test_async_path_uses_the_cache(cache):
+    provider = CountingEmbeddings()
+    embeddings = CachedEmbeddings(provider, "m", cache)
+
+    async def run():
+        await embeddings.aembed_documents(["x", "y"])
+        return await embeddings.aembed_documents(["y", "z"])
+
+    assert len(asyncio.run(run())) == 2
+    assert provider.sent == ["x", "y", "z"]
+
+
+def test_stats_stay_consistent_across_threads(cache):
+    embeddings = CachedEmbeddings(HashEmbeddings(dim=8), "m", cache)
+    texts = [f"text {i % 50}" for i in range(400)]
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: embeddings.embed_documents(texts[i: i + 10]), range(0, 400, 10)))
+
+    stats = embeddings.stats()
+    assert stats["requested"] == 400
+    assert stats["requested"] - stats["embedded"] == stats["hits"] + stats["deduped"]
@@ -0,0 +1,121 @@
+import os
+import uuid
+
+import pytest
+
+import ingest
+from fakes import HashEmbeddings
+
+
+@pytest.fixture
+def topic_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "VS_DIR", tmp_path / "vectorstore")
+    monkeypatch.setattr(ingest, "MANIFEST_DIR", tmp_path / "vectorstore" / "manifests")
+    monkeypatch.setattr(ingest, "_embeddings", HashEmbeddings(dim=32))
+    path = tmp_path / "data" / f"topic-{uuid.uuid4().hex[:8]}"
+    path.mkdir(parents=True)
+    (path / "a.md").write_text("alpha beta gamma " * 150, encoding="utf-8")
+    (path / "b.txt").write_text("delta epsilon " * 150, encoding="utf-8")
+    return path
+
+
+def stored_ids(topic: str) -> set:
+    return set(ingest.open_vectorstore(topic).get(include=[])["ids"])
+
+
+def manifest_ids(topic: str) -> set:
+    return {i for entry in ingest.load_manifest(topic).values() for i in entry["chunk_ids"]}
+
+
+def touch(path, seconds: float = 10):
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + seconds))
+
+
+def test_diff_topic_hashes_only_when_stat_moved(topic_dir):
+    changed, removed, unchanged = ingest.diff_topic(topic_dir, {})
+    assert sorted(os.path.basename(p) for p in changed) == ["a.md", "b.txt"]
+    assert removed == [] and unchanged == {}
+    manifest = {p: {**fp, "chunk_ids": [f"{p}:0"]} for p, fp in changed.items()}
+    a, b = sorted(changed)
+
+    touch(a)
+    (topic_dir / "b.txt").write_text("delta changed", encoding="utf-8")
+    (topic_dir / "c.md").write_text("new file", encoding="utf-8")
+    changed, removed, unchanged = ingest.diff_topic(topic_dir, manifest)
+
+    assert sorted(os.path.basename(p) for p in changed) == ["b.txt", "c.md"]
+    assert unchanged[a]["chunk_ids"] == [f"{a}:0"]
+    assert unchanged[a]["mtime"] == os.stat(a).st_mtime
+
+    os.remove(b)
+    assert ingest.diff_topic(topic_dir, manifest)[1] == [b]
+
+
+@pytest.mark.parametrize("mode", ["batch", "stream"])
+def test_incremental_ingest_only_replaces_what_changed(topic_dir, mode):
+    topic = topic_dir.name
+    assert ingest.ingest_topic(topic_dir, mode=mode) == 2
+    first = stored_ids(topic)
+    assert first and first == manifest_ids(topic)
+
+    assert ingest.ingest_topic(topic_dir, mode=mode) == 0
+    assert stored_ids(topic) == first
+
+    (topic_dir / "a.md").write_text("alpha rewritten " * 150, encoding="utf-8")
+    assert ingest.ingest_topic(topic_dir, mode=mode) == 1
+    after_edit = stored_ids(topic)
+    b_ids = {i for i in first if i.startswith("b.txt:")}
+    assert b_ids <= after_edit
+    assert not (first - b_ids) & after_edit
+    assert after_edit == manifest_ids(topic)
+
+    os.remove(topic_dir / "b.txt")
+    assert ingest.ingest_topic(topic_dir, mode=mode) == 0
+    assert stored_ids(topic) == after_edit - b_ids == manifest_ids(topic)
+
+
+@pytest.mark.parametrize("mode", ["batch", "stream"])
+def test_failed_file_keeps_its_previous_chunks(topic_dir, mode, monkeypatch):
+    topic = topic_dir.name
+    ingest.ingest_topic(topic_dir, mode=mode)
+    before = stored_ids(topic)
+    (topic_dir / "b.txt").write_text("delta broken " * 150, encoding="utf-8")
+
+    load_file, iter_file_pages = ingest.load_file, ingest.iter_file_pages
+
+    def broken(p):
+        raise ValueError("cannot parse")
+    monkeypatch.setattr(ingest, "load_file", broken)
+    monkeypatch.setattr(ingest, "iter_file_pages", broken)
+    assert ingest.ingest_topic(topic_dir, mode=mode) == 0
+    assert stored_ids(topic) == before == manifest_ids(topic)
+
+    monkeypatch.setattr(ingest, "load_file", load_file)
+    monkeypatch.setattr(ingest, "iter_file_pages", iter_file_pages)
+    assert ingest.ingest_topic(topic_dir, mode=mode) == 1  # retried on the next run
+
+
+def test_store_without_manifest_is_rebuilt(topic_dir):
+    topic = topic_dir.name
+    vs = ingest.open_vectorstore(topic)
+    vs.add_texts(["legacy chunk"] * 3, ids=[str(uuid.uuid4()) for _ in range(3)])
+    vs.persist()
+
+    plan = ingest.plan_topic(topic_dir)
+    assert plan["rebuild"] and len(plan["changed"]) == 2
+    assert ingest.ingest_topic(topic_dir) == 2
+
+    assert stored_ids(topic) == manifest_ids(topic)
+    assert not ingest.plan_topic(topic_dir)["rebuild"]
+
+
+def test_manifest_for_another_layout_forces_a_rebuild(topic_dir):
+    topic = topic_dir.name
+    ingest.ingest_topic(topic_dir)
+    ingest.save_manifest(topic, ingest.load_manifest(topic), store=ingest.store_key("shared"))
+
+    plan = ingest.plan_topic(topic_dir)
+
+    assert plan["rebuild"] and plan["manifest"] == {} and plan["unchanged"] == {}
+    assert set(plan["orphaned"]) == manifest_ids(topic)
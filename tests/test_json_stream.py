@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from json_stream import JsonFieldStreamer
+
+
+def stream(raw: str, size: int, field: str = "message") -> str:
+    streamer = JsonFieldStreamer(field)
+    return "".join(streamer.feed(raw[i: i + size]) for i in range(0, len(raw), size))
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_decodes_field_across_chunk_boundaries(size):
+    message = 'Line one\nsaid "hi" \\ tab\there, café \U0001F600 done'
+    raw = json.dumps({"reflection": "ignored", "message": message, "rating": 3})
+    assert stream(raw, size) == message
+
+
+@pytest.mark.parametrize("size", [1, 5])
+def test_decodes_ascii_escaped_unicode_and_surrogate_pairs(size):
+    message = "café \U0001F600"
+    raw = json.dumps({"message": message}, ensure_ascii=True)
+    assert "\\ud83d" in raw
+    assert stream(raw, size) == message
+
+
+def test_ignores_fence_and_nested_keys_of_the_same_name():
+    raw = '```json\n{"meta": {"message": "nested"}, "items": ["message"], "message": "top"}\n```'
+    assert stream(raw, 4) == "top"
+
+
+def test_stops_after_the_field():
+    streamer = JsonFieldStreamer("message")
+    assert streamer.feed('{"message": "ab') == "ab"
+    assert streamer.feed('c", "other": "xyz"}') == "c"
+    assert streamer.done
+    assert streamer.emitted == 3
+
+
+@pytest.mark.parametrize("value", ["null", "42", "true"])
+def test_non_string_value_yields_nothing(value):
+    streamer = JsonFieldStreamer("message")
+    assert streamer.feed('{"message": %s, "x": "y"}' % value) == ""
+    assert streamer.done
+
+
+def test_missing_field_yields_nothing():
+    assert stream('{"reflection": "message"}', 3) == ""
+
+
+@pytest.mark.parametrize("size", [1, 6])
+def test_ignores_quotes_and_brackets_before_the_object(size):
+    raw = 'Here is the "answer" [as JSON]:\n{"message": "hello", "rating": "understood"}'
+    assert stream(raw, size) == "hello"
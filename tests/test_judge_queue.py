@@ -0,0 +1,69 @@
+import time
+
+import judge_worker
+from judge_worker import JudgeQueue
+
+
+def make_due(queue):
+    """Skip the retry backoff."""
+    queue._conn.execute("UPDATE jobs SET next_run = 0")
+    queue._conn.commit()
+
+
+def test_claim_hands_each_job_out_once(tmp_path):
+    queue = JudgeQueue(tmp_path / "queue.sqlite3")
+    other = JudgeQueue(tmp_path / "queue.sqlite3")
+    for i in range(3):
+        queue.enqueue(f"j{i}", {"n": i})
+    queue.enqueue("j0", {"n": "duplicate"})
+
+    claimed = [queue.claim(), other.claim(), queue.claim()]
+
+    assert sorted(job["id"] for job in claimed) == ["j0", "j1", "j2"]
+    assert {job["id"]: job["payload"]["n"] for job in claimed}["j0"] == 0
+    assert queue.claim() is None and other.claim() is None
+    assert queue.counts() == {"running": 3}
+
+
+def test_progress_survives_a_requeue(tmp_path):
+    queue = JudgeQueue(tmp_path / "queue.sqlite3")
+    queue.enqueue("j", {"turn": 1})
+    queue.save_progress(queue.claim()["id"], {"evaluator": {"ok": True}})
+
+    assert queue.recover() == 1
+    job = queue.claim()
+    assert job["progress"] == {"evaluator": {"ok": True}}
+
+    queue.complete("j")
+    assert queue.counts() == {}
+
+
+def test_fail_backs_off_then_parks_the_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(judge_worker, "JUDGE_MAX_ATTEMPTS", 3)
+    queue = JudgeQueue(tmp_path / "queue.sqlite3")
+    queue.enqueue("j", {})
+
+    queue.claim()
+    assert queue.fail("j", "boom") == "pending"
+    assert queue.claim() is None  # not due before its backoff
+
+    for attempt in (2, 3):
+        make_due(queue)
+        job = queue.claim()
+        assert job["attempts"] == attempt - 1
+        status = queue.fail("j", f"boom {attempt}")
+
+    assert status == "failed"
+    assert queue.counts() == {"failed": 1}
+    assert queue._conn.execute("SELECT last_error FROM jobs").fetchone()[0] == "boom 3"
+
+
+def test_expired_lease_is_claimed_again(tmp_path, monkeypatch):
+    queue = JudgeQueue(tmp_path / "queue.sqlite3")
+    queue.enqueue("j", {})
+    assert queue.claim()["id"] == "j"
+    assert queue.claim() is None
+
+    monkeypatch.setattr(judge_worker, "JUDGE_LEASE_SECONDS", 0.0)
+    time.sleep(0.01)
+    assert queue.claim()["id"] == "j"
@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+from langchain_core.messages import HumanMessage
+
+import llm_registry
+import metrics
+from fakes import FakeChatModel
+
+
+class NamedModel(FakeChatModel):
+    """Answers with its own model name."""
+
+    def _answer(self, messages):
+        return self.model_name, [self.model_name]
+
+
+class BrokenModel(NamedModel):
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ConnectionError("reset by peer")
+
+
+PROMPT = [HumanMessage(content="hi")]
+
+
+def fallbacks(model: str) -> float:
+    return sum(v for k, v in metrics.llm_fallbacks._values.items() if dict(k)["model"] == model)
+
+
+def with_deadline(primary, deadline=0.2):
+    return llm_registry._with_deadline(primary, NamedModel(model_name="fallback"), deadline)
+
+
+def test_fast_answers_come_from_the_primary():
+    client = with_deadline(NamedModel(model_name="fast"))
+    assert asyncio.run(client.ainvoke(PROMPT)).content == "fast"
+    assert fallbacks("fast") == 0
+
+
+def test_late_or_failed_answers_come_from_the_fallback():
+    slow = with_deadline(NamedModel(model_name="slow", latency=2.0), deadline=0.05)
+    broken = with_deadline(BrokenModel(model_name="broken"))
+
+    assert asyncio.run(slow.ainvoke(PROMPT)).content == "fallback"
+    assert asyncio.run(broken.ainvoke(PROMPT)).content == "fallback"
+    assert fallbacks("slow") == fallbacks("broken") == 1
+
+
+def test_stream_deadline_is_the_first_token():
+    async def collect(client):
+        return "".join([chunk.content async for chunk in client.astream(PROMPT)])
+
+    late_start = with_deadline(NamedModel(model_name="late start", latency=2.0), deadline=0.05)
+    slow_tokens = with_deadline(NamedModel(model_name="slow tokens", tokens_per_second=4), deadline=0.5)
+
+    assert asyncio.run(collect(late_start)) == "fallback"
+    assert asyncio.run(collect(slow_tokens)) == "slow tokens"  # started in time, so it finishes
+
+
+def test_fallback_is_opt_in(monkeypatch):
+    monkeypatch.setattr(llm_registry, "_clients", {})
+    monkeypatch.setattr(llm_registry, "_chat_model", lambda model: NamedModel(model_name=model))
+
+    monkeypatch.setattr(llm_registry, "LLM_FALLBACK_MODEL", "")
+    assert isinstance(llm_registry.get_client("picked"), NamedModel)
+
+    monkeypatch.setattr(llm_registry, "LLM_FALLBACK_MODEL", "backup")
+    client = llm_registry.get_client("picked", deadline=5)
+    assert llm_registry.model_name(client) == "picked"
+    assert llm_registry.model_name(client.fallbacks[0]) == "backup"
+    assert isinstance(llm_registry.get_client("backup"), NamedModel)
+
+
+def test_per_loop_clients_are_pooled_per_loop_and_closed(monkeypatch):
+    monkeypatch.setattr(llm_registry, "_http", None)
+    monkeypatch.setattr(llm_registry, "_http_async", None)
+    http, http_async = llm_registry._http_clients()
+    assert not isinstance(http_async._transport, httpx.AsyncHTTPTransport)  # no pool of its own
+    http_async._kwargs["transport"] = httpx.MockTransport(lambda request: httpx.Response(200, text="ok"))
+
+    loops = [asyncio.new_event_loop() for _ in range(2)]
+    for loop in loops:
+        assert loop.run_until_complete(http_async.get("https://example.test/")).text == "ok"
+    clients = list(http_async._loop_clients.values())
+
+    llm_registry.close_http_clients()
+
+    assert len(clients) == 2 and all(c.is_closed for c in clients)
+    assert http.is_closed and llm_registry._http is None
+    for loop in loops:
+        loop.close()
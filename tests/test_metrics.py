@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram
+
+
+@pytest.fixture
+def collectors(monkeypatch):
+    monkeypatch.setattr(metrics, "_collectors", [])
+
+
+def test_counter_renders_sorted_escaped_series():
+    counter = Counter("things_total", "Things seen")
+    counter.inc(kind="b")
+    counter.inc(2, kind="a")
+    counter.inc(kind='say "hi"\\\n')
+
+    assert counter.render() == [
+        "# HELP ltb_things_total Things seen",
+        "# TYPE ltb_things_total counter",
+        'ltb_things_total{kind="a"} 2.0',
+        'ltb_things_total{kind="b"} 1.0',
+        'ltb_things_total{kind="say \\"hi\\"\\\\\\n"} 1.0',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("wait_seconds", "Waits", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage="s")
+
+    lines = histogram.render()
+
+    assert lines[2:] == [
+        'ltb_wait_seconds_bucket{stage="s",le="0.1"} 1',
+        'ltb_wait_seconds_bucket{stage="s",le="1.0"} 2',
+        'ltb_wait_seconds_bucket{stage="s",le="+Inf"} 3',
+        'ltb_wait_seconds_sum{stage="s"} 5.55',
+        'ltb_wait_seconds_count{stage="s"} 3',
+    ]
+    assert histogram.snapshot() == {(("stage", "s"),): {"count": 3, "sum": 5.55}}
+
+
+def test_stage_times_blocks_and_counts_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TRACE_PATH", str(tmp_path / "trace.jsonl"))
+    monkeypatch.setattr(metrics, "_trace_file", None)
+
+    with metrics.trace("turn-1"):
+        with metrics.stage("test.ok", model="m"):
+            pass
+        with pytest.raises(KeyError):
+            with metrics.stage("test.fails", model="m"):
+                raise KeyError("x")
+    metrics._trace_file.close()
+
+    counts = {dict(k)["stage"]: v["count"] for k, v in metrics.stage_seconds.snapshot().items()}
+    assert counts["test.ok"] == counts["test.fails"] == 1
+    assert 'ltb_stage_errors_total{error="KeyError",model="m",stage="test.fails"} 1.0' in metrics.render()
+    traces = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text().splitlines()]
+    assert [(t["trace"], t["stage"], t["error"]) for t in traces] == [("turn-1", "test.ok", None),
+                                                                      ("turn-1", "test.fails", "KeyError")]
+
+
+def test_render_includes_collectors_and_skips_failing_ones(collectors):
+    def broken():
+        raise RuntimeError("scrape failed")
+
+    metrics.register_collector(broken)
+    metrics.register_collector(lambda: [("cache_entries", "gauge", "Entries", [({"role": "judge"}, 3)])])
+
+    text = metrics.render()
+
+    assert text.endswith("\n")
+    assert "# TYPE ltb_cache_entries gauge\nltb_cache_entries{role=\"judge\"} 3\n" in text
+    assert "# TYPE ltb_llm_tokens_total counter" in text
+
+
+def test_mount_serves_the_metrics_endpoint(collectors):
+    pytest.importorskip("starlette")  # installed with chainlit
+    from starlette.applications import Starlette
+    from starlette.testclient import TestClient
+
+    app = Starlette()
+    metrics.mount(app, "/metrics")
+    metrics.record_tokens("judge", "m", 10, 2)
+
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    assert 'ltb_llm_tokens_total{kind="input",model="m",role="judge"}' in response.text
@@ -0,0 +1,145 @@
+import json
+
+import numpy as np
+import pytest
+
+import numpy_index
+from numpy_index import NumpyIndex, current_dir, index_exists, write_index
+
+DIM = 32
+
+
+def make_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def publish(dest, vectors, dtype="int8", keep_full=False, topic_of=lambda i: "a" if i % 2 else "b"):
+    ids = [f"c{i}" for i in range(len(vectors))]
+    metadatas = [{"topic": topic_of(i)} for i in range(len(vectors))]
+    write_index(dest, ids, [f"text {i}" for i in range(len(vectors))], metadatas, vectors,
+                dtype=dtype, keep_full=keep_full)
+    return ids
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Several blocks per search, so the running top-k merge is exercised
+    monkeypatch.setattr(numpy_index, "NUMPY_INDEX_BLOCK_ROWS", 64)
+
+
+def test_int8_search_matches_exact_top_k(tmp_path):
+    vectors = make_vectors(500)
+    publish(tmp_path / "idx", vectors)
+    index = NumpyIndex(tmp_path / "idx", rerank=0)
+    queries = make_vectors(20, seed=1)
+
+    rows, scores = index.search_vectors(queries, k=5)
+
+    exact = unit(queries) @ unit(vectors).T
+    expected = np.argsort(-exact, axis=1)[:, :5]
+    recall = np.mean([len(set(r) & set(e)) / 5 for r, e in zip(rows, expected)])
+    assert recall >= 0.9
+    assert np.allclose(scores, np.take_along_axis(exact, rows, axis=1), atol=0.02)
+    assert (np.diff(scores, axis=1) <= 1e-6).all()
+
+
+def test_rerank_returns_exact_scores(tmp_path):
+    vectors = make_vectors(300)
+    publish(tmp_path / "idx", vectors, keep_full=True)
+    index = NumpyIndex(tmp_path / "idx", rerank=4)
+    query = make_vectors(1, seed=2)
+
+    rows, scores = index.search_vectors(query, k=3)
+
+    exact = (unit(query) @ unit(vectors).T)[0]
+    assert rows[0].tolist() == np.argsort(-exact)[:3].tolist()
+    assert np.allclose(scores[0], exact[rows[0]], atol=1e-5)
+
+
+def test_filtered_search_only_returns_matching_chunks(tmp_path):
+    vectors = make_vectors(200)
+    publish(tmp_path / "idx", vectors)
+    index = NumpyIndex(tmp_path / "idx")
+
+    results = index.similarity_search_by_vector_with_score(vectors[3], k=10, filter={"topic": "a"})
+
+    assert len(results) == 10
+    assert all(doc.metadata["topic"] == "a" for doc, _ in results)
+    assert results[0][0].page_content == "text 3"
+
+
+def test_get_dequantizes_int8_embeddings(tmp_path):
+    vectors = make_vectors(50)
+    ids = publish(tmp_path / "idx", vectors)
+    index = NumpyIndex(tmp_path / "idx")
+
+    result = index.get(ids=ids[10:15], include=["embeddings", "documents"])
+
+    assert result["ids"] == ids[10:15]
+    assert result["documents"] == [f"text {i}" for i in range(10, 15)]
+    assert np.abs(result["embeddings"] - unit(vectors[10:15])).max() < 0.01
+
+
+def test_republish_keeps_open_readers_working(tmp_path):
+    dest = tmp_path / "idx"
+    publish(dest, make_vectors(40))
+    old = NumpyIndex(dest)
+    for seed in (1, 2, 3):
+        publish(dest, make_vectors(40 + seed, seed=seed))
+
+    assert index_exists(dest)
+    assert len(NumpyIndex(dest)) == 43
+    assert len([p for p in dest.iterdir() if p.is_dir()]) == 2  # current + previous
+    assert old.get(ids=["c0"])["documents"] == ["text 0"]
+
+
+def test_reads_and_converts_flat_layout(tmp_path):
+    dest = tmp_path / "idx"
+    publish(dest, make_vectors(10))
+    version = current_dir(dest)
+    for f in version.iterdir():
+        f.rename(dest / f.name)
+    version.rmdir()
+    (dest / "CURRENT").unlink()
+
+    assert index_exists(dest) and len(NumpyIndex(dest)) == 10
+    publish(dest, make_vectors(12))
+    assert not (dest / "index.json").exists()
+    assert json.loads((current_dir(dest) / "index.json").read_text())["count"] == 12
+
+
+def test_empty_index(tmp_path):
+    write_index(tmp_path / "idx", [], [], [], np.zeros((0, DIM), dtype=np.float32), dtype="int8")
+    index = NumpyIndex(tmp_path / "idx")
+    rows, scores = index.search_vectors(make_vectors(2), k=4)
+    assert rows.shape == (2, 0) and scores.shape == (2, 0)
+
+
+def test_chroma_operators_in_filters(tmp_path):
+    vectors = make_vectors(60)
+    ids = publish(tmp_path / "idx", vectors, topic_of=lambda i: "abc"[i % 3])
+    index = NumpyIndex(tmp_path / "idx")
+
+    def topics(where):
+        return sorted({m["topic"] for m in index.get(where=where)["metadatas"]})
+
+    assert topics({"topic": {"$eq": "a"}}) == ["a"]
+    assert topics({"topic": {"$in": ["a", "c"]}}) == ["a", "c"]
+    assert topics({"topic": {"$nin": ["a"]}}) == topics({"topic": {"$ne": "a"}}) == ["b", "c"]
+    assert topics({"$or": [{"topic": "a"}, {"topic": {"$eq": "b"}}]}) == ["a", "b"]
+    assert topics({"$and": [{"topic": "a"}, {"topic": {"$in": ["a", "b"]}}]}) == ["a"]
+    assert index.get(ids=ids[:6], where={"$and": [{"topic": {"$in": ["b"]}}]})["ids"] == [ids[1], ids[4]]
+
+    results = index.similarity_search_by_vector_with_score(vectors[4], k=5, filter={"$and": [{"topic": "b"}]})
+    assert len(results) == 5 and results[0][0].page_content == "text 4"
+
+
+@pytest.mark.parametrize("where", [{"topic": {"$regex": "a"}}, {"$not": {"topic": "a"}}])
+def test_unsupported_filters_raise(tmp_path, where):
+    publish(tmp_path / "idx", make_vectors(4))
+    with pytest.raises(ValueError):
+        NumpyIndex(tmp_path / "idx").get(where=where)
@@ -0,0 +1,184 @@
+import asyncio
+import json
+
+import pytest
+
+import metrics
+import persistence
+from persistence import WriteBehindBuffer
+
+
+class DownDatabase:
+    """Every bulk_write fails as if Mongo were unreachable."""
+
+    def __getitem__(self, name):
+        return self
+
+    async def bulk_write(self, ops, ordered=True):
+        raise ConnectionError("mongo down")
+
+
+class DownSyncDatabase(DownDatabase):
+    def bulk_write(self, ops, ordered=True):
+        raise ConnectionError("mongo down")
+
+
+@pytest.fixture
+def buffer(tmp_path):
+    return WriteBehindBuffer(max_retries=2, max_pending=4, dead_letter_path=tmp_path / "dead.jsonl")
+
+
+def dead_letters(buffer) -> list:
+    if not buffer.dead_letter_path.exists():
+        return []
+    with open(buffer.dead_letter_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_flush_writes_every_collection(buffer, memory_db):
+    buffer.insert("interaction", {"_id": "i1", "user_id": "u"})
+    buffer.replace("teacher", {"_id": "i1", "text": "v1"})
+    buffer.replace("teacher", {"_id": "i1", "text": "v2"})
+    buffer.update("student_memory", {"_id": "u:t"}, {"$set": {"recent": []}}, upsert=True)
+
+    asyncio.run(buffer.flush())
+
+    assert buffer.pending() == 0 and buffer.flushed_ops == 4
+    assert memory_db["teacher"].find_one({"_id": "i1"})["text"] == "v2"
+    assert memory_db["student_memory"].find_one({"_id": "u:t"}) == {"_id": "u:t", "recent": []}
+
+
+def test_duplicate_keys_from_a_retried_flush_are_not_dropped(buffer, memory_db):
+    memory_db["interaction"].insert_one({"_id": "i1"})
+    buffer.insert("interaction", {"_id": "i1"})
+    buffer.insert("interaction", {"_id": "i2"})
+
+    asyncio.run(buffer.flush())
+
+    assert buffer.pending() == 0 and buffer.dropped_ops == 0
+    assert memory_db["interaction"].count_documents({}) == 2
+    assert dead_letters(buffer) == []
+
+
+def test_rejected_writes_are_dead_lettered_not_retried(buffer, monkeypatch):
+    from pymongo.errors import BulkWriteError
+
+    class RejectingDatabase(DownDatabase):
+        async def bulk_write(self, ops, ordered=True):
+            raise BulkWriteError({"writeErrors": [
+                {"index": 0, "code": 11000, "errmsg": "duplicate"},
+                {"index": 1, "code": 121, "errmsg": "Document failed validation"},
+            ]})
+
+    monkeypatch.setattr(persistence, "get_async_db", RejectingDatabase)
+    buffer.insert("scorer", {"_id": "dup"})
+    buffer.insert("scorer", {"_id": "bad"})
+
+    asyncio.run(buffer.flush())
+
+    assert buffer.pending() == 0 and buffer.dropped_ops == 1
+    [letter] = dead_letters(buffer)
+    assert (letter["reason"], letter["doc"]["_id"], letter["error"]) == ("rejected", "bad", "Document failed validation")
+
+
+def test_outage_retries_then_dead_letters(buffer, monkeypatch):
+    monkeypatch.setattr(persistence, "get_async_db", DownDatabase)
+    buffer.insert("teacher", {"_id": "a"})
+    buffer.insert("teacher", {"_id": "b"})
+
+    for _ in range(2):
+        asyncio.run(buffer.flush())
+        assert buffer.pending() == 2
+    asyncio.run(buffer.flush())
+
+    assert buffer.pending() == 0 and buffer.dropped_ops == 2
+    letters = dead_letters(buffer)
+    assert [(d["reason"], d["op"], d["doc"]["_id"]) for d in letters] == [("retries", "InsertOne", "a"),
+                                                                          ("retries", "InsertOne", "b")]
+    assert "mongo down" in letters[0]["error"] and letters[0]["attempts"] == 3
+
+
+def test_outage_caps_the_buffer_dropping_oldest_first(buffer, monkeypatch):
+    monkeypatch.setattr(persistence, "get_async_db", DownDatabase)
+    for i in range(6):
+        buffer.insert("teacher", {"_id": f"t{i}"})
+
+    asyncio.run(buffer.flush())
+
+    assert buffer.pending() == 4
+    assert [d["doc"]["_id"] for d in dead_letters(buffer)] == ["t0", "t1"]
+    assert {d["reason"] for d in dead_letters(buffer)} == {"overflow"}
+
+
+def test_recovered_flush_forgets_retry_counts(buffer, memory_db, monkeypatch):
+    monkeypatch.setattr(persistence, "get_async_db", DownDatabase)
+    buffer.insert("teacher", {"_id": "a"})
+    asyncio.run(buffer.flush())
+    assert buffer._ops["teacher"][0].attempts == 1
+
+    monkeypatch.undo()
+    asyncio.run(buffer.flush())
+
+    assert buffer.pending() == 0 and buffer.dropped_ops == 0
+    assert memory_db["teacher"].find_one({"_id": "a"}) == {"_id": "a"}
+
+
+def test_flush_sync_dead_letters_ops_it_cannot_write(buffer, monkeypatch):
+    monkeypatch.setattr(persistence, "get_db", DownSyncDatabase)
+    buffer.insert("scorer", {"_id": "s"})
+    buffer.flush_sync()
+    assert [d["reason"] for d in dead_letters(buffer)] == ["shutdown"]
+
+
+class RecordingDatabase(DownDatabase):
+    """Fails the first `failures` flushes, then records every batch it is sent."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.batches = []
+
+    async def bulk_write(self, ops, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("mongo down")
+        self.batches.append(([type(op).__name__ for op in ops], ordered, [op._doc for op in ops]))
+
+
+def test_updates_are_flushed_in_queue_order_after_a_retry(buffer, monkeypatch):
+    database = RecordingDatabase(failures=2)
+    monkeypatch.setattr(persistence, "get_async_db", lambda: database)
+    buffer.insert("interaction", {"_id": "i1"})
+    buffer.update("student_memory", {"_id": "u:t"}, {"$set": {"v": 1}}, upsert=True)
+    asyncio.run(buffer.flush())  # fails, both requeued
+    buffer.insert("interaction", {"_id": "i2"})
+    buffer.update("student_memory", {"_id": "u:t"}, {"$set": {"v": 2}}, upsert=True)
+
+    asyncio.run(buffer.flush())
+
+    assert database.batches == [
+        (["InsertOne", "InsertOne"], False, [{"_id": "i1"}, {"_id": "i2"}]),
+        (["UpdateOne", "UpdateOne"], True, [{"$set": {"v": 1}}, {"$set": {"v": 2}}]),
+    ]
+
+
+def test_ordered_batch_requeues_what_follows_a_duplicate(buffer, memory_db):
+    memory_db["scorer"].insert_one({"_id": "s1"})
+    buffer.insert("scorer", {"_id": "s1"})
+    buffer.replace("scorer", {"_id": "s1", "v": "new"})
+    buffer.update("scorer", {"_id": "s2"}, {"$set": {"v": 2}}, upsert=True)
+
+    asyncio.run(buffer.flush())
+    assert buffer.pending() == 2 and buffer.dropped_ops == 0
+    asyncio.run(buffer.flush())
+
+    assert buffer.pending() == 0
+    assert memory_db["scorer"].find_one({"_id": "s1"})["v"] == "new"
+    assert memory_db["scorer"].find_one({"_id": "s2"})["v"] == 2
+
+
+def test_dropped_writes_are_exported_as_a_metric(buffer, monkeypatch):
+    monkeypatch.setattr(persistence, "get_db", DownSyncDatabase)
+    buffer.insert("evaluator", {"_id": "e"})
+    buffer.flush_sync()
+
+    assert 'ltb_writes_dropped_total{collection="evaluator",reason="shutdown"}' in metrics.render()
@@ -0,0 +1,78 @@
+import json
+import threading
+from collections import Counter
+
+import pytest
+
+import qa_pool
+from qa_pool import PoolStore
+
+
+def entries(n: int, sources=lambda i: [f"chunk{i % 3}"]):
+    return [{"id": f"e{i}", "q": f"question {i}?", "a": f"answer {i}", "source_ids": sources(i)} for i in range(n)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PoolStore(tmp_path / "pools.sqlite3")
+
+
+def test_draw_serves_least_served_entries_first(store):
+    store.add("t", entries(5))
+
+    first = {e["id"] for e in store.draw("t", 3)}
+    second = {e["id"] for e in store.draw("t", 3)}
+
+    assert len(first) == 3
+    assert {"e0", "e1", "e2", "e3", "e4"} - first <= second  # the two unserved ones come next
+    served = {e["id"]: e["served"] for e in store.entries("t")}
+    assert sorted(served.values()) == [1, 1, 1, 1, 2]
+    assert store.count("t", served=0) == 0
+
+
+def test_draw_is_per_topic_and_handles_small_pools(store):
+    store.add("t", entries(2))
+    store.add("other", entries(4))
+
+    assert len(store.draw("t", 5)) == 2
+    assert store.draw("missing", 5) == []
+    assert store.count("other", served=0) == 4
+
+
+def test_concurrent_draws_never_hand_out_an_entry_twice_per_round(tmp_path):
+    PoolStore(tmp_path / "pools.sqlite3").add("t", entries(40))
+    drawn = []
+
+    def session():
+        # one connection per "process"
+        drawn.extend(e["id"] for e in PoolStore(tmp_path / "pools.sqlite3").draw("t", 5))
+
+    threads = [threading.Thread(target=session) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(drawn) == 40 and max(Counter(drawn).values()) == 1
+
+
+def test_add_skips_known_ids_and_remove_sources(store):
+    assert store.add("t", entries(6)) == 6
+    assert store.add("t", entries(7)) == 1
+
+    assert store.remove_sources("t", {"chunk0"}) == 3  # e0, e3, e6
+    assert [e["id"] for e in store.entries("t")] == ["e1", "e2", "e4", "e5"]
+
+
+def test_legacy_json_pool_is_imported_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(qa_pool, "QA_POOL_DIR", tmp_path)
+    monkeypatch.setattr(qa_pool, "_store", PoolStore(tmp_path / "pools.sqlite3"))
+    monkeypatch.setattr(qa_pool, "_imported", set())
+    (tmp_path / "legacy.json").write_text(json.dumps(entries(3)), encoding="utf-8")
+
+    pairs = qa_pool.sample_qa("legacy", n=2)
+
+    assert len(pairs) == 2 and pairs[0].q.startswith("question")
+    assert qa_pool.pool_size("legacy") == 3
+    assert not (tmp_path / "legacy.json").exists() and (tmp_path / "legacy.json.migrated").exists()
+    assert qa_pool.prune_pool("legacy", ["chunk1"]) == 1
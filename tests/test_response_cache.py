@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+
+from fakes import HashEmbeddings
+from response_cache import CachedChain, ResponseCache
+
+EXPLANATION = ("Photosynthesis turns light energy into chemical energy: chlorophyll absorbs light, "
+               "water is split, and carbon dioxide is fixed into glucose in the Calvin cycle.")
+
+
+class Answer(BaseModel):
+    answer: object
+
+
+class StubChain:
+    """Counts calls; the n-th call answers Answer(answer=n)."""
+
+    role = "student"
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, inputs, *args, **kwargs):
+        self.calls += 1
+        return {**inputs, "text": Answer(answer=self.calls)}
+
+    async def ainvoke(self, inputs, *args, **kwargs):
+        return self.invoke(inputs)
+
+
+@pytest.fixture
+def chain():
+    return StubChain()
+
+
+def cached(chain, similarity=0.0, **kwargs):
+    cache = ResponseCache(similarity=similarity, embeddings=HashEmbeddings(dim=512), **kwargs)
+    return CachedChain(chain, cache, model="fake/model"), cache
+
+
+@pytest.mark.filterwarnings("error::DeprecationWarning")  # hits are copied the pydantic v2 way
+def test_exact_hit_skips_the_chain_and_ignores_whitespace(chain):
+    wrapped, cache = cached(chain)
+    first = wrapped.invoke({"teacher_explanation": EXPLANATION, "topic": "bio"})
+    again = wrapped.invoke({"teacher_explanation": "  " + EXPLANATION.replace(" ", "\n", 3), "topic": "bio"})
+
+    assert chain.calls == 1
+    assert again["text"] == first["text"]
+    again["text"].answer = "mutated"
+    assert wrapped.invoke({"teacher_explanation": EXPLANATION, "topic": "bio"})["text"].answer == 1
+    assert cache.stats()["roles"]["student"]["exact_hits"] == 2
+
+
+def test_similar_explanation_is_a_hit(chain):
+    wrapped, cache = cached(chain, similarity=0.9)
+    wrapped.invoke({"teacher_explanation": EXPLANATION, "topic": "bio"})
+
+    reworded = wrapped.invoke({"teacher_explanation": EXPLANATION.replace("turns", "converts"), "topic": "bio"})
+
+    assert chain.calls == 1
+    assert reworded["text"].answer == 1
+    stats = cache.stats()["roles"]["student"]
+    assert (stats["similar_hits"], stats["misses"]) == (1, 1)
+
+
+def test_similarity_needs_the_other_inputs_to_match(chain):
+    wrapped, cache = cached(chain, similarity=0.9)
+    wrapped.invoke({"teacher_explanation": EXPLANATION, "topic": "bio"})
+
+    wrapped.invoke({"teacher_explanation": EXPLANATION + " Also", "topic": "chemistry"})
+    wrapped.invoke({"teacher_explanation": "Mitochondria make ATP by oxidative phosphorylation.", "topic": "bio"})
+
+    assert chain.calls == 3
+    assert cache.stats()["roles"]["student"]["similar_hits"] == 0
+
+
+def test_similarity_tier_is_off_by_default(chain):
+    wrapped, _ = cached(chain)
+    wrapped.invoke({"teacher_explanation": EXPLANATION, "topic": "bio"})
+    wrapped.invoke({"teacher_explanation": EXPLANATION + " Indeed.", "topic": "bio"})
+    assert chain.calls == 2
+
+
+def test_async_similar_hit(chain):
+    wrapped, _ = cached(chain, similarity=0.9)
+
+    async def run():
+        await wrapped.ainvoke({"teacher_explanation": EXPLANATION, "topic": "bio"})
+        return await wrapped.ainvoke({"teacher_explanation": EXPLANATION + " Indeed.", "topic": "bio"})
+
+    assert asyncio.run(run())["text"].answer == 1
+    assert chain.calls == 1
+
+
+def test_lru_eviction_and_ttl(chain):
+    wrapped, cache = cached(chain, max_entries=2)
+    for topic in ("a", "b", "a", "c"):
+        wrapped.invoke({"teacher_explanation": EXPLANATION, "topic": topic})
+    assert chain.calls == 3
+    wrapped.invoke({"teacher_explanation": EXPLANATION, "topic": "b"})  # evicted as least recently used
+    assert chain.calls == 4
+
+    cache.ttl = -1
+    wrapped.invoke({"teacher_explanation": EXPLANATION, "topic": "b"})
+    assert chain.calls == 5
+    stats = cache.stats()["roles"]["student"]
+    assert (stats["evicted"], stats["expired"]) == (2, 1)
@@ -0,0 +1,19 @@
+import pytest
+from pymongo.errors import OperationFailure
+
+import schema
+from fakes import MemoryDatabase
+
+
+def test_hot_queries_are_indexed_once_indexes_are_ensured():
+    database = MemoryDatabase()
+
+    unindexed = {collection for collection, _, _ in schema.check_query_plans(database)}
+    assert unindexed == {"interaction", "scorer"}  # student and student_memory are read by _id
+
+    assert schema.bootstrap(database) == []
+
+
+def test_unsupported_commands_fail_like_mongo():
+    with pytest.raises(OperationFailure):
+        MemoryDatabase().command("ping")
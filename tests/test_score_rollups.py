@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import score_rollups
+from score_rollups import SCORE_FIELDS, get_daily, get_rollup, record_scores, rollup_id
+
+
+def scores(value: float) -> dict:
+    return {field: value for field in SCORE_FIELDS}
+
+
+def record(interaction_id: str, value: float, user_id: str = "u", topic: str = "t"):
+    asyncio.run(record_scores(interaction_id, user_id, topic, scores(value)))
+
+
+def test_rollups_keep_count_mean_and_variance(memory_db):
+    record("i1", 0.2)
+    record("i2", 0.6, topic="other")
+
+    user = get_rollup("user", "u")
+    overall = user["fields"]["overall_score"]
+    assert user["count"] == 2
+    assert overall["mean"] == pytest.approx(0.4) and overall["std"] == pytest.approx(0.2)
+    assert (overall["min"], overall["max"]) == (0.2, 0.6)
+    assert overall["hist"][2] == overall["hist"][6] == 1
+    assert get_rollup("topic", "t")["count"] == get_rollup("user_topic", "u|t")["count"] == 1
+    assert get_rollup("global", "*")["count"] == 2
+    assert get_rollup("user", "nobody") == {"count": 0, "fields": {}}
+
+
+def test_daily_rollups_fill_days_without_turns(memory_db):
+    record("i1", 0.5)
+
+    days = get_daily("user", "u", days=3)
+
+    assert [d["period"] for d in days][-1] == datetime.utcnow().strftime("%Y-%m-%d")
+    assert [d["count"] for d in days] == [0, 0, 1]
+
+
+def test_a_retried_turn_is_counted_once(memory_db):
+    record("i1", 0.5)
+    record("i1", 0.5)
+    record("i2", 1.0)
+
+    assert get_rollup("user", "u")["count"] == 2
+    assert get_rollup("global", "*")["fields"]["overall_score"]["max"] == 1.0
+    assert "turns" not in memory_db["score_rollups"].find_one({"_id": rollup_id("user", "u")}, {"turns": 0})
+
+
+def test_guard_list_keeps_only_the_latest_turns(memory_db, monkeypatch):
+    monkeypatch.setattr(score_rollups, "ROLLUP_GUARD_SIZE", 2)
+    for i in range(3):
+        record(f"i{i}", 0.5)
+
+    doc = memory_db["score_rollups"].find_one({"_id": rollup_id("user", "u")})
+    assert doc["turns"] == ["i1", "i2"] and doc["count"] == 3
+    record("i2", 0.5)
+    assert get_rollup("user", "u")["count"] == 3
+
+
+def test_rebuild_matches_incremental_rollups(memory_db):
+    for i, (user_id, value) in enumerate([("a", 0.1), ("b", 0.9), ("a", 0.5)]):
+        memory_db["interaction"].insert_one({"_id": f"i{i}", "user_id": user_id, "topic": "t"})
+        memory_db["scorer"].insert_one({"_id": f"i{i}", "timestamp": datetime.utcnow(), **scores(value)})
+        record(f"i{i}", value, user_id=user_id)
+    memory_db["scorer"].insert_one({"_id": "orphan", **scores(0.0)})
+    incremental = get_rollup("topic", "t")
+
+    assert score_rollups.rebuild(memory_db, batch_size=2) == 3
+    assert get_rollup("topic", "t") == incremental
+    assert get_rollup("user", "a")["count"] == 2
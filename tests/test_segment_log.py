@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+import memory
+from memory import SegmentLog
+
+
+@pytest.fixture(autouse=True)
+def no_background_compaction(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_COMPACT_SEGMENTS", 1000)
+
+
+def fill(log, keys, version):
+    for key in keys:
+        log.append({"interaction_id": key, "version": version, "pad": "x" * 40})
+
+
+def test_rotates_into_sealed_segments_with_sidecars(tmp_path):
+    log = SegmentLog(tmp_path, segment_bytes=400)
+    fill(log, [f"k{i}" for i in range(20)], 1)
+
+    segments = log.segments()
+    assert len(segments) > 2
+    for number in segments[:-1]:
+        assert (tmp_path / f"{number:08d}.idx").exists()
+    assert all(log.get(f"k{i}")["version"] == 1 for i in range(20))
+    assert log.get("missing") is None
+    log.close()
+
+
+def test_compact_keeps_newest_entry_per_key(tmp_path):
+    log = SegmentLog(tmp_path, segment_bytes=400)
+    keys = [f"k{i}" for i in range(10)]
+    fill(log, keys, 1)
+    fill(log, keys[:5], 2)
+    fill(log, ["tail"], 3)
+    before = len(log.segments())
+
+    dropped = log.compact()
+
+    assert dropped == 5
+    assert len(log.segments()) == 2  # merged sealed segment + active one
+    assert before > 2
+    assert [log.get(k)["version"] for k in keys] == [2] * 5 + [1] * 5
+    assert log.compact() == 0
+    log.close()
+
+
+def test_reload_finds_newest_entries_and_skips_torn_line(tmp_path):
+    log = SegmentLog(tmp_path, segment_bytes=400)
+    keys = [f"k{i}" for i in range(12)]
+    fill(log, keys, 1)
+    fill(log, keys[::3], 2)
+    log.close()
+    active = tmp_path / f"{log.segments()[-1]:08d}.jsonl"
+    with open(active, "ab") as f:
+        f.write(b'{"interaction_id": "torn", "vers')
+
+    reopened = SegmentLog(tmp_path, segment_bytes=400)
+    assert {k: reopened.get(k)["version"] for k in keys} == {k: 2 if i % 3 == 0 else 1 for i, k in enumerate(keys)}
+    assert reopened.get("torn") is None
+
+    recent = list(reopened.iter_recent())
+    assert [e["interaction_id"] for e in recent[:4]] == ["k9", "k6", "k3", "k0"]
+    assert len(recent) == len(keys)
+    reopened.close()
+
+
+def test_reader_recovers_after_another_log_compacts(tmp_path):
+    writer = SegmentLog(tmp_path, segment_bytes=400)
+    reader = SegmentLog(tmp_path, segment_bytes=400)
+    keys = [f"k{i}" for i in range(10)]
+    fill(writer, keys, 1)
+    assert reader.get("k1")["version"] == 1  # builds the reader's index
+
+    fill(writer, keys, 2)
+    writer.compact()
+
+    assert [reader.get(k)["version"] for k in keys] == [2] * 10
+    writer.close()
+    reader.close()
+
+
+def test_last_writes_of_a_burst_are_synced_when_the_log_goes_idle(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_FSYNC_EVERY", 1000)
+    monkeypatch.setattr(memory, "MEMORY_FSYNC_SECONDS", 0.05)
+    synced = []
+    monkeypatch.setattr(memory.os, "fsync", synced.append)
+    log = SegmentLog(tmp_path)
+
+    fill(log, ["a", "b", "c"], 1)
+    assert synced == []
+    time.sleep(0.3)
+
+    assert len(synced) == 1 and log._unsynced == 0
+    log.close()
+    assert len(synced) == 1  # nothing left to sync
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import student_memory
+from models import StudentResponse
+from persistence import WriteBehindBuffer
+from student_memory import StudentMemory
+
+
+def response(i: int, rating: str = "needs work") -> StudentResponse:
+    return StudentResponse(message=f"q{i}", rating=rating, reflection=f"r{i}", missing_points=[f"p{i}"])
+
+
+def store_interactions(memory_db, user_id: str, n: int, topic: str = None):
+    start = datetime(2024, 1, 1)
+    for i in range(n):
+        interaction = {"_id": f"{topic}-{i}", "user_id": user_id, "timestamp": start + timedelta(minutes=i)}
+        if topic is not None:
+            interaction["topic"] = topic
+        memory_db["interaction"].insert_one(interaction)
+        memory_db["student"].insert_one({"_id": f"{topic}-{i}", "timestamp": start + timedelta(minutes=i),
+                                         **response(i).dict()})
+
+
+def test_append_folds_overflow_into_the_summary(memory_db, monkeypatch):
+    monkeypatch.setattr(student_memory, "STUDENT_MEMORY_RECENT", 2)
+
+    async def run():
+        memory = await StudentMemory.load("u", "t")
+        for i in range(3):
+            await memory.append(response(i, rating="confused" if i == 0 else "needs work"))
+        return memory, await StudentMemory.load("u", "t")
+
+    memory, reloaded = asyncio.run(run())
+
+    assert [r.message for r in reloaded.recent] == ["q1", "q2"]
+    assert reloaded.summary == memory.summary
+    assert reloaded.summary["turns"] == 1 and reloaded.summary["ratings"] == {"confused": 1}
+    doc = memory_db["student_memory"].find_one({"_id": "u:t"})
+    assert (doc["seq"], doc["user_id"], doc["topic"]) == (3, "u", "t")
+
+
+def test_a_late_write_does_not_roll_the_memory_back(memory_db, tmp_path):
+    buffer = WriteBehindBuffer(dead_letter_path=tmp_path / "dead.jsonl")
+
+    async def run():
+        memory = await StudentMemory.load("u", "t")
+        await memory.append(response(0), buffer=buffer)
+        stale = buffer._ops.pop("student_memory")
+        await memory.append(response(1), buffer=buffer)
+        await buffer.flush()
+        buffer._ops["student_memory"] = stale  # e.g. requeued after a failed flush
+        await buffer.flush()
+        await StudentMemory.load("u", "t")  # a direct write of an old state is ignored too
+        await StudentMemory("u", "t").append(response(9))
+
+    asyncio.run(run())
+
+    doc = memory_db["student_memory"].find_one({"_id": "u:t"})
+    assert [r["message"] for r in doc["recent"]] == ["q0", "q1"] and doc["seq"] == 2
+    assert buffer.pending() == 0 and buffer.dropped_ops == 0
+
+
+def test_new_memory_is_backfilled_from_the_topic(memory_db):
+    store_interactions(memory_db, "u", 3, topic="t")
+    store_interactions(memory_db, "u", 2, topic="other")
+    store_interactions(memory_db, "u", 2)
+
+    memory = asyncio.run(StudentMemory.load("u", "t"))
+
+    assert [r.message for r in memory.recent] == ["q0", "q1", "q2"]
+    assert memory.seq == 3
+
+
+def test_backfill_falls_back_to_interactions_without_a_topic(memory_db, monkeypatch):
+    monkeypatch.setattr(student_memory, "STUDENT_MEMORY_RECENT", 2)
+    store_interactions(memory_db, "u", 3)
+    store_interactions(memory_db, "someone else", 1, topic="t")
+
+    memory = asyncio.run(StudentMemory.load("u", "t"))
+
+    assert [r.message for r in memory.recent] == ["q1", "q2"]
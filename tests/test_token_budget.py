@@ -0,0 +1,99 @@
+import json
+from types import SimpleNamespace
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from models import StudentResponse
+from token_budget import BudgetedChain, compact_judge_inputs, count_tokens, render_student_memory
+
+STUDENT_PROMPT = ChatPromptTemplate.from_template("Context:\n{student_memory}\n\nTeacher:\n{teacher_explanation}")
+
+
+class RecordingChain:
+    """An LLMChain stand-in that records the inputs it was invoked with."""
+
+    def __init__(self, prompt=STUDENT_PROMPT):
+        self.prompt = prompt
+        self.llm = SimpleNamespace(model_name="fake/chat")
+        self.seen = []
+
+    def invoke(self, inputs, *args, **kwargs):
+        self.seen.append(inputs)
+        return {**inputs, "text": "ok"}
+
+
+def responses(n: int):
+    return [StudentResponse(message=f"question {i}?", rating="needs work", reflection=f"reflection {i} " * 5,
+                            missing_points=["recursion", f"point {i}"]) for i in range(n)]
+
+
+def memory(n: int, turns: int = 0) -> dict:
+    summary = {"turns": turns, "ratings": {"confused": turns}, "missing_points": ["base case"],
+               "reflections": ["lost at the start"]}
+    return {"summary": summary, "recent": responses(n)}
+
+
+def test_render_lists_each_missing_point_once():
+    text = render_student_memory(memory(3, turns=4))
+
+    assert text.splitlines()[0] == "Earlier (4 turns; confused: 4)"
+    assert text.count("recursion") == 1 and text.count("base case") == 1
+    assert "asked: question 2?" in text
+    assert render_student_memory(None) == render_student_memory({"recent": []}) == "(nothing yet)"
+
+
+def test_inputs_within_budget_are_only_rendered():
+    chain = BudgetedChain(RecordingChain(), "student", budget=10_000)
+
+    chain.invoke({"student_memory": memory(4), "teacher_explanation": "short"})
+
+    [seen] = chain.chain.seen
+    assert seen["student_memory"] == render_student_memory(memory(4))
+    assert chain.stats()["over_budget"] == 0 and chain.last_input_tokens == chain.count(seen)
+
+
+def test_over_budget_inputs_keep_the_latest_turns():
+    inputs = {"student_memory": memory(8, turns=2), "teacher_explanation": "short"}
+    full = BudgetedChain(RecordingChain(), "student", budget=10_000).count(
+        {**inputs, "student_memory": render_student_memory(inputs["student_memory"])})
+    chain = BudgetedChain(RecordingChain(), "student", budget=full // 2)
+
+    prepared = chain.prepare(inputs)
+
+    assert chain.count(prepared) <= full // 2
+    assert "question 7?" in prepared["student_memory"] and "question 0?" not in prepared["student_memory"]
+    assert chain.over_budget == 0
+
+
+def test_long_explanations_are_cut_in_the_middle_as_a_last_resort():
+    explanation = "start " + "filler words " * 2000 + "end"
+    chain = BudgetedChain(RecordingChain(), "student", budget=400)
+
+    prepared = chain.prepare({"student_memory": memory(2), "teacher_explanation": explanation})
+
+    text = prepared["teacher_explanation"]
+    assert text.startswith("start") and text.endswith("end") and "[…]" in text
+    assert count_tokens(text) < count_tokens(explanation)
+
+
+def test_judge_inputs_drop_the_repeated_message_and_whitespace():
+    response = {"message": "why?", "rating": "confused", "reflection": "lost", "missing_points": []}
+    inputs = {"student_response": json.dumps(response, indent=2),
+              "evaluator_comments": {"rating": "good", "feedback": None},
+              "teacher_explanation": "x " * 5000}
+
+    level0 = compact_judge_inputs(inputs, 0)
+    level2 = compact_judge_inputs(inputs, 2)
+
+    assert level0["student_response"] == '{"rating":"confused","reflection":"lost"}'
+    assert level0["evaluator_comments"] == '{"rating":"good"}'
+    assert level0["teacher_explanation"] == inputs["teacher_explanation"]
+    assert count_tokens(level2["teacher_explanation"]) < count_tokens(inputs["teacher_explanation"])
+
+
+def test_inputs_that_never_fit_are_counted():
+    chain = BudgetedChain(RecordingChain(), "student", budget=5)
+
+    chain.invoke({"student_memory": memory(2), "teacher_explanation": "a fairly long explanation " * 20})
+
+    assert chain.stats()["over_budget"] == 1 and chain.stats()["calls"] == 1